@@ -0,0 +1,215 @@
+"""Upload-time analysis of hosted bot scripts.
+
+Parses the script with ``ast`` to find syntax errors and third-party
+imports, maps those imports to installable distributions and byte-compiles
+the script so the first start skips compilation.
+"""
+import ast
+import os
+import sys
+import py_compile
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+STDLIB_MODULES = frozenset(getattr(sys, 'stdlib_module_names', ())) | frozenset(sys.builtin_module_names)
+
+# Import names whose distribution is named differently on PyPI. Dotted keys
+# are matched first, for namespace packages like google.*
+IMPORT_TO_DIST = {
+    'telebot': 'pyTelegramBotAPI',
+    'telegram': 'python-telegram-bot',
+    'telethon': 'Telethon',
+    'pyrogram': 'pyrogram',
+    'discord': 'discord.py',
+    'PIL': 'Pillow',
+    'cv2': 'opencv-python',
+    'yaml': 'PyYAML',
+    'bs4': 'beautifulsoup4',
+    'dotenv': 'python-dotenv',
+    'dateutil': 'python-dateutil',
+    'sklearn': 'scikit-learn',
+    'Crypto': 'pycryptodome',
+    'jwt': 'PyJWT',
+    'gtts': 'gTTS',
+    'googletrans': 'googletrans',
+    'yt_dlp': 'yt-dlp',
+    'youtube_dl': 'youtube_dl',
+    'magic': 'python-magic',
+    'docx': 'python-docx',
+    'pptx': 'python-pptx',
+    'fitz': 'PyMuPDF',
+    'serial': 'pyserial',
+    'socks': 'PySocks',
+    'websocket': 'websocket-client',
+    'OpenSSL': 'pyOpenSSL',
+    'MySQLdb': 'mysqlclient',
+    'psycopg2': 'psycopg2-binary',
+    'pymongo': 'pymongo',
+    'motor': 'motor',
+    'google.generativeai': 'google-generativeai',
+    'google.cloud.storage': 'google-cloud-storage',
+    'google.protobuf': 'protobuf',
+    'googleapiclient': 'google-api-python-client',
+}
+
+IMPORT_ERRORS = ('ImportError', 'ModuleNotFoundError', 'Exception', 'BaseException')
+
+
+class AnalysisResult:
+    """Outcome of analysing one uploaded script"""
+
+    __slots__ = ('ok', 'error', 'line', 'imports', 'optional', 'requirements', 'suggested', 'compiled')
+
+    def __init__(self):
+        self.ok = True
+        self.error = None
+        self.line = None
+        self.imports = []
+        self.optional = []
+        self.requirements = []
+        # Guessed from bare import names; installed only once the user confirms them
+        self.suggested = []
+        self.compiled = None
+
+
+def _guarded(handlers):
+    """True if a try statement's handlers catch a failed import"""
+    for handler in handlers:
+        if handler.type is None:
+            return True
+        types_ = handler.type.elts if isinstance(handler.type, ast.Tuple) else [handler.type]
+        for node in types_:
+            if isinstance(node, ast.Name) and node.id in IMPORT_ERRORS:
+                return True
+    return False
+
+
+def collect_imports(tree):
+    """Return (required, optional) absolute module names imported by a module.
+
+    Imports inside ``try`` blocks that catch ImportError are optional: the
+    script is written to run without them.
+    """
+    required, optional = set(), set()
+    try_nodes = (ast.Try, getattr(ast, 'TryStar', ast.Try))
+
+    def visit(node, guarded):
+        if isinstance(node, ast.Import):
+            (optional if guarded else required).update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if not node.level and node.module:
+                (optional if guarded else required).add(node.module)
+        elif isinstance(node, try_nodes):
+            inner = guarded or _guarded(node.handlers)
+            for stmt in node.body:
+                visit(stmt, inner)
+            for stmt in node.handlers + node.orelse + node.finalbody:
+                visit(stmt, guarded)
+        else:
+            for child in ast.iter_child_nodes(node):
+                visit(child, guarded)
+
+    visit(tree, False)
+    return required, optional - required
+
+
+def distribution_for(module, guess=True):
+    """Map an imported module name to a distribution, or None for stdlib.
+
+    Names missing from IMPORT_TO_DIST fall back to the import name itself
+    unless ``guess`` is false.
+    """
+    parts = module.split('.')
+    if parts[0] in STDLIB_MODULES or parts[0] == '__future__':
+        return None
+    for depth in range(len(parts), 0, -1):
+        dist = IMPORT_TO_DIST.get('.'.join(parts[:depth]))
+        if dist:
+            return dist
+    return parts[0].replace('_', '-') if guess else None
+
+
+def local_modules(script):
+    """Top-level module names the script can import from its own directory"""
+    directory = Path(script).parent
+    names = set()
+    try:
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.py'):
+                names.add(entry.name[:-3])
+            elif entry.is_dir() and (Path(entry.path) / '__init__.py').exists():
+                names.add(entry.name)
+    except OSError:
+        pass
+    return names
+
+
+def compiled_path(script):
+    """Where the precompiled code for a script lives"""
+    return Path(script).with_suffix('.pyc')
+
+
+def launch_target(script):
+    """The precompiled script if it is current, else the source"""
+    script = Path(script)
+    compiled = compiled_path(script)
+    try:
+        if compiled.stat().st_mtime >= script.stat().st_mtime:
+            return compiled
+    except OSError:
+        pass
+    return script
+
+
+def analyze_file(script, local=None):
+    """Parse, map imports to distributions and byte-compile an uploaded script"""
+    script = Path(script)
+    result = AnalysisResult()
+
+    source = script.read_bytes()
+    try:
+        tree = ast.parse(source, filename=script.name)
+    except SyntaxError as e:
+        result.ok = False
+        result.error = e.msg
+        result.line = e.lineno
+        return result
+    except ValueError as e:
+        # Null bytes and similar undecodable input
+        result.ok = False
+        result.error = str(e)
+        return result
+
+    required, optional = collect_imports(tree)
+    local = local_modules(script) if local is None else local
+    script_name = script.stem
+
+    def third_party(names):
+        return sorted(n for n in names if n.split('.')[0] not in local and n.split('.')[0] != script_name
+                      and distribution_for(n))
+
+    result.imports = third_party(required)
+    result.optional = third_party(optional)
+    known, guessed = {}, {}
+    for name in result.imports:
+        dist = distribution_for(name, guess=False)
+        if dist:
+            known.setdefault(dist.lower(), dist)
+        else:
+            dist = distribution_for(name)
+            guessed.setdefault(dist.lower(), dist)
+    result.requirements = sorted(known.values(), key=str.lower)
+    result.suggested = sorted((d for k, d in guessed.items() if k not in known), key=str.lower)
+
+    try:
+        # Keep the source path in code objects so tracebacks show real lines
+        result.compiled = py_compile.compile(str(script), cfile=str(compiled_path(script)),
+                                             dfile=str(script.resolve()), doraise=True)
+    except py_compile.PyCompileError as e:
+        # ast accepted it but the compiler did not (e.g. 'return' outside function)
+        result.ok = False
+        result.error = e.exc_value.msg if isinstance(e.exc_value, SyntaxError) else str(e.exc_value)
+        result.line = getattr(e.exc_value, 'lineno', None)
+    return result
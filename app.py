@@ -1,10 +1,25 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, g, Response
 import sqlite3
 import threading
+import time
 from pathlib import Path
 import logging
 from datetime import datetime
 import os
+import hmac
+import json
+import gzip
+import queue
+import hashlib
+from functools import wraps
+
+from bulk import ACTIONS as BULK_ACTIONS, BulkError, enqueue_job, normalize_selector, select_targets
+from metrics import Registry, merge_expositions, read_textfiles, statement_kind
+from lockprof import ProfiledLock, read_report
+from tracing import read_slow_traces
+from dataversion import DataVersion
+from events import Broadcaster, TooManySubscribers, format_sse
+from export import FORMATS as EXPORT_FORMATS, ExportError, encode as encode_export, iter_rows, parse_export
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -14,11 +29,45 @@ logger = logging.getLogger(__name__)
 class Config:
     DB_NAME = 'cyber_v2.db'
     PORT = 10000
+    # Required in the X-Admin-Token header by admin endpoints; unset disables them
+    ADMIN_TOKEN = os.environ.get('ZENX_ADMIN_TOKEN')
+    METRICS_DIR = 'metrics'
+    # Control-plane snapshots older than this are left out of /metrics
+    METRICS_MAX_AGE = 120
+    # Lock profiling is on while this file exists (shared with the bot process)
+    LOCKPROF_FLAG = os.path.join(METRICS_DIR, 'lockprof.enabled')
+    # Written by the bot control plane for updates slower than its threshold
+    SLOW_TRACES_FILE = os.path.join('logs', 'slow_traces.jsonl')
+    # JSON bodies at least this large are gzipped for clients that accept it
+    GZIP_MIN_BYTES = 1024
+    GZIP_LEVEL = 6
+    # Change events appended by the bot control plane, pushed to /api/events viewers
+    EVENTS_FILE = os.path.join('logs', 'events.jsonl')
+    EVENTS_MAX_CLIENTS = 200
+    EVENTS_KEEPALIVE = 15
+    # Rows fetched per locked read while streaming /api/export
+    EXPORT_CHUNK_ROWS = 1000
+    # Conditional GETs remember the ETag last served per URL, up to this many URLs
+    ETAG_CACHE_SIZE = 4096
 
 app = Flask(__name__)
 
-# Database lock
-db_lock = threading.RLock()
+# Database lock; profiles its own contention when switched on
+db_lock = ProfiledLock(threading.RLock(), flag_path=Config.LOCKPROF_FLAG)
+
+# Web process metrics; the control plane's are read from METRICS_DIR
+registry = Registry({'process': 'web'})
+http_request_seconds = registry.histogram('zenx_http_request_seconds', "HTTP request handling time",
+                                          ['endpoint', 'method', 'code'])
+db_query_seconds = registry.histogram('zenx_db_query_seconds', "execute_db query time", ['statement'])
+db_lock_wait_seconds = registry.histogram('zenx_db_lock_wait_seconds', "Time execute_db waited for db_lock",
+                                          buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0))
+
+# Moves on every commit to the database, from this process or the bot's
+data_version = DataVersion(Config.DB_NAME)
+# URL (+ clock bucket) -> (database version, ETag of the last body served for it)
+etag_cache = {}
+etag_cache_lock = threading.Lock()
 
 def get_db():
     with db_lock:
@@ -27,7 +76,11 @@ def get_db():
         return conn
 
 def execute_db(query, params=(), fetchone=False, fetchall=False, commit=False):
+    db_lock.tag(query)
+    waiting = time.perf_counter()
     with db_lock:
+        started = time.perf_counter()
+        db_lock_wait_seconds.observe(started - waiting)
         conn = get_db()
         c = conn.cursor()
         try:
@@ -46,6 +99,114 @@ def execute_db(query, params=(), fetchone=False, fetchall=False, commit=False):
             logger.error(f"Database error: {e}")
             conn.close()
             return None
+        finally:
+            db_query_seconds.labels(statement_kind(query)).observe(time.perf_counter() - started)
+
+def node_load():
+    """Load and capacity per node from one query, shared by both gauges within a scrape"""
+    rows = execute_db("SELECT id, name, current_load, capacity FROM nodes", fetchall=True) or []
+    return {
+        'load': {(row['id'], row['name']): row['current_load'] or 0 for row in rows},
+        'capacity': {(row['id'], row['name']): row['capacity'] or 0 for row in rows},
+    }
+
+def deployment_counts():
+    rows = execute_db("SELECT status, COUNT(*) AS n FROM deployments GROUP BY status", fetchall=True) or []
+    return {(row['status'] or 'unknown',): row['n'] for row in rows}
+
+# Gauges read from the database at scrape time
+scraped_node_load = registry.per_scrape(node_load)
+registry.gauge('zenx_node_load', "Bots counted against each node", ['node', 'name'],
+               callback=lambda: scraped_node_load()['load'])
+registry.gauge('zenx_node_capacity', "Bot capacity of each node", ['node', 'name'],
+               callback=lambda: scraped_node_load()['capacity'])
+registry.gauge('zenx_deployments', "Deployments by status", ['status'], callback=deployment_counts)
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        http_request_seconds.labels(endpoint, request.method, response.status_code).observe(
+            time.perf_counter() - started)
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Gzip large responses for clients that accept it"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+    data = response.get_data()
+    if len(data) < Config.GZIP_MIN_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    if request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=Config.GZIP_LEVEL, mtime=0))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def conditional(bucket=None, volatile=()):
+    """Answer If-None-Match with 304 while a view's output is unchanged.
+
+    The weak ETag is a hash of the response body, leaving out the top-level
+    JSON keys in ``volatile`` (e.g. a generation timestamp), so writes that
+    do not touch what a view returns keep its tag. Each tag is remembered
+    with the database version it was computed at: while nothing has been
+    committed since, a matching request is answered without running the
+    view. ``bucket()`` is part of that key for views that depend on the clock.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.full_path + (f"|{bucket()}" if bucket else '')
+            version = data_version.current(Config.DB_NAME)
+            known = etag_cache.get(key)
+            if known and known[0] == version and request.if_none_match.contains_weak(known[1]):
+                response = Response(status=304)
+                response.set_etag(known[1], weak=True)
+                response.headers['Cache-Control'] = 'no-cache'
+                return response
+            
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            body = response.get_data()
+            if volatile and response.is_json:
+                payload = response.get_json()
+                if isinstance(payload, dict):
+                    body = json.dumps({k: v for k, v in payload.items() if k not in volatile},
+                                      sort_keys=True, default=str).encode()
+            tag = hashlib.blake2b(body, digest_size=12).hexdigest()
+            with etag_cache_lock:
+                etag_cache.pop(key, None)
+                etag_cache[key] = (version, tag)
+                while len(etag_cache) > Config.ETAG_CACHE_SIZE:
+                    etag_cache.pop(next(iter(etag_cache)))
+            if request.if_none_match.contains_weak(tag):
+                response = Response(status=304)
+            response.set_etag(tag, weak=True)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+def current_day():
+    return datetime.now().strftime('%Y-%m-%d')
+
+def current_minute():
+    return int(time.time() // 60)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition of web and control-plane metrics"""
+    body = merge_expositions(registry.render(),
+                             read_textfiles(Config.METRICS_DIR, max_age=Config.METRICS_MAX_AGE))
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/')
 def index():
@@ -130,6 +291,13 @@ def index():
             .api-link:hover {
                 background: rgba(255, 255, 255, 0.3);
             }
+            .activity {
+                list-style: none;
+                padding: 0;
+                margin: 0 0 20px;
+                font-size: 0.9em;
+                opacity: 0.85;
+            }
             .status-online {
                 color: #4ade80;
                 font-weight: bold;
@@ -167,6 +335,8 @@ def index():
                 </div>
             </div>
             
+            <ul class="activity" id="activity"></ul>
+            
             <div class="api-links">
                 <a href="/status" class="api-link">System Status</a>
                 <a href="/api/deployments" class="api-link">Deployments API</a>
@@ -178,25 +348,55 @@ def index():
         </div>
         
         <script>
+            function showStats(data) {
+                // Pushed deltas carry only the fields that changed
+                if ('total_users' in data) document.getElementById('totalUsers').textContent = data.total_users || 0;
+                if ('running_bots' in data) document.getElementById('activeBots').textContent = data.running_bots || 0;
+                if ('total_nodes' in data) document.getElementById('totalNodes').textContent = data.total_nodes || 3;
+                if ('uptime_percent' in data) document.getElementById('uptime').textContent = data.uptime_percent || '100%';
+            }
+            
+            function showActivity(text) {
+                const list = document.getElementById('activity');
+                const item = document.createElement('li');
+                item.textContent = new Date().toLocaleTimeString() + ' - ' + text;
+                list.insertBefore(item, list.firstChild);
+                while (list.children.length > 10) list.removeChild(list.lastChild);
+            }
+            
             async function loadStats() {
                 try {
-                    const response = await fetch('/api/stats');
-                    const data = await response.json();
-                    
-                    document.getElementById('totalUsers').textContent = data.total_users || 0;
-                    document.getElementById('activeBots').textContent = data.running_bots || 0;
-                    document.getElementById('totalNodes').textContent = data.total_nodes || 3;
-                    document.getElementById('uptime').textContent = data.uptime_percent || '100%';
+                    const response = await fetch('/api/stats', {cache: 'no-cache'});
+                    showStats(await response.json());
                 } catch (error) {
                     console.error('Error loading stats:', error);
                 }
             }
             
-            // Load stats on page load
-            loadStats();
-            
-            // Refresh stats every 30 seconds
-            setInterval(loadStats, 30000);
+            if (window.EventSource) {
+                // The server pushes a snapshot on connect, then only what changes
+                const events = new EventSource('/api/events');
+                events.addEventListener('stats', (e) => showStats(JSON.parse(e.data)));
+                events.addEventListener('deployment', (e) => {
+                    const d = JSON.parse(e.data);
+                    showActivity(`Bot #${d.id} ${d.status}${d.node_id ? ' on node ' + d.node_id : ''}`);
+                });
+                events.addEventListener('user', (e) => showActivity(`New user #${JSON.parse(e.data).id}`));
+                events.addEventListener('node', (e) => {
+                    const n = JSON.parse(e.data);
+                    showActivity(`Node ${n.id} load ${n.delta > 0 ? '+' : ''}${n.delta}`);
+                });
+                events.addEventListener('bulk', (e) => {
+                    const b = JSON.parse(e.data);
+                    showActivity(`Bulk ${b.action}: ${b.succeeded} done, ${b.failed} failed`);
+                });
+                events.addEventListener('rebalance', (e) => {
+                    showActivity(`Rebalance corrected ${JSON.parse(e.data).corrected} node counters`);
+                });
+            } else {
+                loadStats();
+                setInterval(loadStats, 30000);
+            }
         </script>
     </body>
     </html>
@@ -227,12 +427,13 @@ def status():
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/api/deployments')
+@conditional()
 def get_deployments():
     """Get all deployments"""
     try:
         deployments = execute_db("""
             SELECT d.id, d.bot_name, d.status, d.start_time, u.username, 
-                   d.cpu_usage, d.ram_usage, d.restart_count, d.bot_username,
+                   d.cpu_usage, d.ram_usage, d.restart_count, d.hang_restart_count, d.bot_username,
                    d.created_at, d.node_id, d.is_banned
             FROM deployments d
             LEFT JOIN users u ON d.user_id = u.id
@@ -251,6 +452,7 @@ def get_deployments():
                 'cpu_usage': dep['cpu_usage'],
                 'ram_usage': dep['ram_usage'],
                 'restart_count': dep['restart_count'],
+                'hang_restart_count': dep['hang_restart_count'],
                 'start_time': dep['start_time'],
                 'created_at': dep['created_at'],
                 'node_id': dep['node_id'],
@@ -263,6 +465,7 @@ def get_deployments():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/nodes')
+@conditional()
 def get_nodes():
     """Get all nodes information"""
     try:
@@ -286,43 +489,80 @@ def get_nodes():
         logger.error(f"Error getting nodes: {e}")
         return jsonify({'error': str(e)}), 500
 
+def collect_stats():
+    """System statistics, shared by /api/stats and the events feed"""
+    total_bots = execute_db("SELECT COUNT(*) FROM deployments", fetchone=True)[0] or 0
+    running_bots = execute_db("SELECT COUNT(*) FROM deployments WHERE status='Running'", fetchone=True)[0] or 0
+    total_users = execute_db("SELECT COUNT(*) FROM users", fetchone=True)[0] or 0
+    prime_users = execute_db("SELECT COUNT(*) FROM users WHERE is_prime=1", fetchone=True)[0] or 0
+    total_nodes = execute_db("SELECT COUNT(*) FROM nodes", fetchone=True)[0] or 0
+    
+    # Get today's stats
+    today = datetime.now().strftime('%Y-%m-%d')
+    new_users_today = execute_db("SELECT COUNT(*) FROM users WHERE DATE(join_date)=?", (today,), fetchone=True)[0] or 0
+    deployments_today = execute_db("SELECT COUNT(*) FROM deployments WHERE DATE(created_at)=?", (today,), fetchone=True)[0] or 0
+    
+    # Get banned bots count
+    banned_bots = execute_db("SELECT COUNT(*) FROM deployments WHERE is_banned=1", fetchone=True)[0] or 0
+    
+    return {
+        'total_bots': total_bots,
+        'running_bots': running_bots,
+        'stopped_bots': total_bots - running_bots,
+        'banned_bots': banned_bots,
+        'total_users': total_users,
+        'prime_users': prime_users,
+        'free_users': total_users - prime_users,
+        'total_nodes': total_nodes,
+        'new_users_today': new_users_today,
+        'deployments_today': deployments_today,
+        'uptime_percent': '99.9%',
+        'timestamp': datetime.now().isoformat()
+    }
+
 @app.route('/api/stats')
+@conditional(bucket=current_day, volatile=('timestamp',))
 def api_stats():
     """Get system statistics"""
     try:
-        total_bots = execute_db("SELECT COUNT(*) FROM deployments", fetchone=True)[0] or 0
-        running_bots = execute_db("SELECT COUNT(*) FROM deployments WHERE status='Running'", fetchone=True)[0] or 0
-        total_users = execute_db("SELECT COUNT(*) FROM users", fetchone=True)[0] or 0
-        prime_users = execute_db("SELECT COUNT(*) FROM users WHERE is_prime=1", fetchone=True)[0] or 0
-        total_nodes = execute_db("SELECT COUNT(*) FROM nodes", fetchone=True)[0] or 0
-        
-        # Get today's stats
-        today = datetime.now().strftime('%Y-%m-%d')
-        new_users_today = execute_db("SELECT COUNT(*) FROM users WHERE DATE(join_date)=?", (today,), fetchone=True)[0] or 0
-        deployments_today = execute_db("SELECT COUNT(*) FROM deployments WHERE DATE(created_at)=?", (today,), fetchone=True)[0] or 0
-        
-        # Get banned bots count
-        banned_bots = execute_db("SELECT COUNT(*) FROM deployments WHERE is_banned=1", fetchone=True)[0] or 0
-        
-        return jsonify({
-            'total_bots': total_bots,
-            'running_bots': running_bots,
-            'stopped_bots': total_bots - running_bots,
-            'banned_bots': banned_bots,
-            'total_users': total_users,
-            'prime_users': prime_users,
-            'free_users': total_users - prime_users,
-            'total_nodes': total_nodes,
-            'new_users_today': new_users_today,
-            'deployments_today': deployments_today,
-            'uptime_percent': '99.9%',
-            'timestamp': datetime.now().isoformat()
-        })
+        return jsonify(collect_stats())
     except Exception as e:
         logger.error(f"Error getting stats: {e}")
         return jsonify({'error': str(e)}), 500
 
+# One producer for every dashboard viewer; only stats that changed are pushed
+broadcaster = Broadcaster(Config.EVENTS_FILE, collect_stats, max_subscribers=Config.EVENTS_MAX_CLIENTS)
+
+@app.route('/api/events')
+def event_stream():
+    """Server-sent events: a stats snapshot, then stats deltas and change events"""
+    try:
+        sub, backlog = broadcaster.subscribe(request.headers.get('Last-Event-ID'))
+    except TooManySubscribers as e:
+        return jsonify({'error': str(e)}), 503
+    
+    def stream():
+        try:
+            yield "retry: 5000\n\n"
+            for event_id, event in backlog:
+                yield format_sse(event_id, event)
+            while True:
+                try:
+                    item = sub.queue.get(timeout=Config.EVENTS_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if item is None:
+                    return
+                yield format_sse(*item)
+        finally:
+            broadcaster.unsubscribe(sub)
+    
+    return Response(stream(), content_type='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/bots')
+@conditional()
 def get_all_bots():
     """Get all bots with pagination"""
     try:
@@ -367,6 +607,7 @@ def get_all_bots():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/users')
+@conditional(bucket=current_minute)
 def get_all_users():
     """Get all users"""
     try:
@@ -408,6 +649,7 @@ def get_all_users():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/bot/<int:bot_id>')
+@conditional()
 def get_bot_details(bot_id):
     """Get details of a specific bot"""
     try:
@@ -472,6 +714,146 @@ def create_backup(bot_id):
         logger.error(f"Error creating backup: {e}")
         return jsonify({'error': str(e)}), 500
 
+def admin_denied():
+    """Error response unless the request carries the admin token"""
+    if not Config.ADMIN_TOKEN:
+        return jsonify({'error': 'Admin API disabled'}), 403
+    token = request.headers.get('X-Admin-Token', '')
+    if not hmac.compare_digest(token.encode(), Config.ADMIN_TOKEN.encode()):
+        return jsonify({'error': 'Invalid admin token'}), 403
+    return None
+
+@app.route('/api/bulk/<action>', methods=['POST'])
+def create_bulk_job(action):
+    """Queue a bulk action on bots selected by bot_ids, user_id or node_id"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    if action not in BULK_ACTIONS:
+        return jsonify({'error': f'Unknown action {action}', 'actions': list(BULK_ACTIONS)}), 400
+    try:
+        selector = normalize_selector(request.get_json(silent=True))
+    except BulkError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        # The control plane owns the bot processes and picks the job up
+        with db_lock:
+            conn = get_db()
+            try:
+                targets = select_targets(conn, selector)
+                job_id = enqueue_job(conn, action, selector, requested_by=request.remote_addr) if targets else None
+            finally:
+                conn.close()
+        if not targets:
+            return jsonify({'error': 'No bots match the selection'}), 404
+        
+        return jsonify({
+            'job_id': job_id,
+            'action': action,
+            'selector': selector,
+            'targets': len(targets),
+            'status': 'pending',
+            'timestamp': datetime.now().isoformat()
+        }), 202
+    except Exception as e:
+        logger.error(f"Error queueing bulk job: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/bulk/jobs/<int:job_id>')
+def get_bulk_job(job_id):
+    """Status and per-bot results of a bulk job"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        job = execute_db("SELECT * FROM bulk_jobs WHERE id=?", (job_id,), fetchone=True)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        return jsonify({
+            'job_id': job['id'],
+            'action': job['action'],
+            'selector': json.loads(job['selector']),
+            'status': job['status'],
+            'requested_by': job['requested_by'],
+            'created_at': job['created_at'],
+            'started_at': job['started_at'],
+            'finished_at': job['finished_at'],
+            'result': json.loads(job['result']) if job['result'] else None
+        })
+    except Exception as e:
+        logger.error(f"Error getting bulk job: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/lockprof', methods=['GET', 'POST'])
+def lock_profile():
+    """db_lock contention report; POST {"enabled": bool, "reset": bool} to control it"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            if 'enabled' in data:
+                db_lock.set_enabled(bool(data['enabled']))
+            if data.get('reset'):
+                db_lock.reset()
+        
+        top = min(int(request.args.get('top', 10)), 100)
+        sort_by = request.args.get('sort', 'wait_total')
+        if sort_by not in ('wait_total', 'wait_max', 'hold_total', 'hold_max', 'count', 'contended'):
+            return jsonify({'error': f'Unknown sort {sort_by}'}), 400
+        
+        return jsonify({
+            'enabled': os.path.exists(Config.LOCKPROF_FLAG),
+            # Per worker; each gunicorn worker profiles its own lock
+            'web': dict(db_lock.report(top, sort_by), pid=os.getpid()),
+            'control_plane': read_report(os.path.join(Config.METRICS_DIR, 'lockprof_control_plane.json')),
+            'timestamp': datetime.now().isoformat()
+        })
+    except Exception as e:
+        logger.error(f"Error getting lock profile: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/traces/slow')
+def slow_traces():
+    """Recent slow bot updates with their span breakdowns"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        limit = min(int(request.args.get('limit', 20)), 200)
+        traces = read_slow_traces(Config.SLOW_TRACES_FILE, limit)
+        kind = request.args.get('kind')
+        if kind:
+            traces = [t for t in traces if t['kind'].startswith(kind)]
+        
+        return jsonify({
+            'traces': traces,
+            'count': len(traces),
+            'timestamp': datetime.now().isoformat()
+        })
+    except Exception as e:
+        logger.error(f"Error reading slow traces: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/export/<name>')
+def export_rows(name):
+    """Stream users, deployments or logs as NDJSON or CSV, in id order"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        spec = parse_export(name, request.args)
+    except ExportError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    rows = iter_rows(get_db, db_lock, spec, chunk_size=Config.EXPORT_CHUNK_ROWS)
+    return Response(encode_export(rows, spec), content_type=EXPORT_FORMATS[spec.format],
+                    headers={'Content-Disposition': f'attachment; filename={spec.filename}',
+                             'Cache-Control': 'no-store'})
+
 @app.route('/health')
 def health_check():
     """Health check endpoint for monitoring"""
@@ -0,0 +1,64 @@
+import io
+import json
+import time
+import zipfile
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def write_bot_archive(target, bot_file, metadata, log_file=None):
+    """Write a single bot backup zip (bot file, metadata.json, logs) to target.
+
+    ``target`` may be a path or a writable file object.
+    """
+    bot_file = Path(bot_file)
+    with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        if bot_file.exists():
+            zipf.write(bot_file, arcname=metadata.get('filename') or bot_file.name)
+
+        zipf.writestr('metadata.json', json.dumps(metadata, indent=4))
+
+        if log_file and Path(log_file).exists():
+            zipf.write(log_file, arcname='bot_logs.log')
+
+
+class BundleWriter:
+    """Single-pass writer for a master archive of per-bot backups.
+
+    Each bot archive is deflated once in memory and then stored as-is
+    (ZIP_STORED) in the master, so nothing is compressed twice and no
+    per-bot zip ever touches the disk.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.members = []
+        self._zipf = zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_STORED)
+
+    def add_bot(self, arcname, bot_file, metadata, log_file=None):
+        """Append one bot backup and return its size in bytes"""
+        buffer = io.BytesIO()
+        write_bot_archive(buffer, bot_file, metadata, log_file)
+
+        info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        self._zipf.writestr(info, buffer.getbuffer())
+
+        size = buffer.tell()
+        self.members.append((arcname, size))
+        return size
+
+    def close(self):
+        self._zipf.close()
+        self.fileobj.seek(0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._zipf.close()
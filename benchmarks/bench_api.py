@@ -0,0 +1,284 @@
+"""Latency and throughput of the app.py JSON API at several database sizes.
+
+For each row scale (the same count in users, deployments, bot_backups and
+notifications) a database is seeded with benchmarks/seed.py, then every
+endpoint is driven by concurrent clients, either in-process through
+Flask's test client or over HTTP against a local gunicorn started like
+the Procfile does.
+
+    python benchmarks/bench_api.py [--rows 1k,100k,1m] [--clients 8] [--requests 400]
+        [--server wsgi|gunicorn] [--workers 2] [--cache-dir .bench-db]
+        [--revalidate] [--json results.json] [--compare baseline.json]
+
+Save a run with --json and pass it to --compare on a later run to print
+the change in throughput and p50/p99 per endpoint; seeded databases are
+reused from --cache-dir, since the 1m scale takes a minute or two to build.
+--revalidate makes each client behave like a polling browser: it accepts
+gzip and sends back the last ETag it saw for a path, so unchanged data is
+answered with 304.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from seed import ROW_SCALES, seed  # noqa: E402
+
+
+def endpoints(rows):
+    """(name, path factory) per benchmarked request"""
+    pages = max(rows // 20, 1)
+    return [
+        ('stats', lambda rng: '/api/stats'),
+        ('deployments', lambda rng: '/api/deployments'),
+        ('bots first page', lambda rng: '/api/bots?page=1'),
+        ('bots random page', lambda rng: f'/api/bots?page={rng.randint(1, pages)}'),
+        ('users', lambda rng: '/api/users'),
+        ('bot detail', lambda rng: f'/api/bot/{rng.randint(1, rows)}'),
+    ]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def seeded_db(scale, cache_dir, workdir):
+    """Path of a database seeded at ``scale``, built once per cache dir"""
+    rows = ROW_SCALES[scale]
+    target = os.path.join(workdir, f"api_{scale}.db")
+    cached = os.path.join(cache_dir, f"api_{scale}.db") if cache_dir else None
+    if cached and os.path.exists(cached):
+        shutil.copyfile(cached, target)
+        return target
+    started = time.perf_counter()
+    conn = sqlite3.connect(target, isolation_level=None)
+    seed(conn, rows, rows, logs_per_bot=0, notifications=rows, backups=rows, log_lines=0)
+    conn.close()
+    print(f"  seeded {scale} in {time.perf_counter() - started:.1f}s")
+    if cached:
+        os.makedirs(cache_dir, exist_ok=True)
+        shutil.copyfile(target, cached)
+    return target
+
+
+def revalidate_headers(etags, path):
+    headers = {'Accept-Encoding': 'gzip'}
+    if path in etags:
+        headers['If-None-Match'] = etags[path]
+    return headers
+
+
+class WsgiClient:
+    """Requests through Flask's test client in this process"""
+
+    def __init__(self, db_path):
+        import app as web
+        web.Config.DB_NAME = db_path
+        self.app = web.app
+
+    def session(self, revalidate=False):
+        client = self.app.test_client()
+        etags = {}
+
+        def get(path):
+            headers = revalidate_headers(etags, path) if revalidate else {}
+            response = client.get(path, headers=headers)
+            if response.headers.get('ETag'):
+                etags[path] = response.headers['ETag']
+            return response.status_code, len(response.data)
+        return get
+
+    def close(self):
+        pass
+
+
+class GunicornClient:
+    """Requests over HTTP to a local gunicorn serving app:app"""
+
+    def __init__(self, db_path, workers):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+        # app.py opens cyber_v2.db relative to its working directory
+        self.cwd = tempfile.mkdtemp(prefix='zenx-api-')
+        os.symlink(db_path, os.path.join(self.cwd, 'cyber_v2.db'))
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{self.port}',
+             '--log-level', 'warning', 'app:app'], cwd=self.cwd, env=env)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                if self.session()('/health')[0] == 200:
+                    return
+            except OSError:
+                time.sleep(0.2)
+        self.close()
+        raise RuntimeError("gunicorn did not come up")
+
+    def session(self, revalidate=False):
+        etags = {}
+
+        def get(path):
+            conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            try:
+                conn.request('GET', path, headers=revalidate_headers(etags, path) if revalidate else {})
+                response = conn.getresponse()
+                if response.getheader('ETag'):
+                    etags[path] = response.getheader('ETag')
+                return response.status, len(response.read())
+            finally:
+                conn.close()
+        return get
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait(timeout=10)
+        shutil.rmtree(self.cwd, ignore_errors=True)
+
+
+def drive(client, path_for, clients, requests, revalidate=False):
+    """Run ``requests`` GETs from ``clients`` threads; returns a result row"""
+    latencies = []
+    errors = 0
+    sizes = 0
+    not_modified = 0
+    remaining = [requests]
+    lock = threading.Lock()
+
+    def worker(seed_value):
+        nonlocal errors, sizes, not_modified
+        rng = random.Random(seed_value)
+        get = client.session(revalidate)
+        get(path_for(rng))
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            path = path_for(rng)
+            started = time.perf_counter()
+            try:
+                status, size = get(path)
+            except OSError:
+                status, size = 0, 0
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                sizes += size
+                if status == 304:
+                    not_modified += 1
+                elif status != 200:
+                    errors += 1
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    return {
+        'requests': len(latencies),
+        'rps': round(len(latencies) / wall, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p90_ms': round(percentile(latencies, 0.9) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(max(latencies, default=0) * 1000, 2),
+        'errors': errors,
+        'bytes': sizes // max(len(latencies), 1),
+        'not_modified': not_modified,
+    }
+
+
+def print_table(results, baseline=None):
+    previous = {(r['rows'], r['endpoint']): r for r in (baseline or {}).get('results', [])}
+    print(f"\n{'rows':>5} {'endpoint':<17} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+          f"{'max ms':>8} {'err':>4} {'bytes':>7}" + ("   vs baseline (req/s, p50, p99)" if previous else ''))
+    for r in results:
+        line = (f"{r['rows']:>5} {r['endpoint']:<17} {r['rps']:>8.1f} {r['p50_ms']:>8.2f} {r['p90_ms']:>8.2f} "
+                f"{r['p99_ms']:>8.2f} {r['max_ms']:>8.1f} {r['errors']:>4} {r['bytes']:>7}")
+        old = previous.get((r['rows'], r['endpoint']))
+        if old:
+            change = [(r[key] / old[key] - 1) * 100 if old[key] else 0.0 for key in ('rps', 'p50_ms', 'p99_ms')]
+            line += "   " + "  ".join(f"{c:+6.1f}%" for c in change)
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='1k,100k', help=f"comma-separated, from {', '.join(ROW_SCALES)}")
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=400, help='per endpoint and scale')
+    parser.add_argument('--server', choices=('wsgi', 'gunicorn'), default='wsgi')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--cache-dir', help='reuse seeded databases from here')
+    parser.add_argument('--revalidate', action='store_true', help='send If-None-Match and accept gzip')
+    parser.add_argument('--json', help='write results here')
+    parser.add_argument('--compare', help='baseline results from an earlier --json run')
+    args = parser.parse_args()
+    scales = [s.strip() for s in args.rows.split(',')]
+    unknown = [s for s in scales if s not in ROW_SCALES]
+    if unknown:
+        parser.error(f"unknown row scale {', '.join(unknown)}")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    workdir = tempfile.mkdtemp(prefix='zenx-api-db-')
+    # app.py creates its metrics directory relative to the working directory
+    os.chdir(workdir)
+    results = []
+    try:
+        for scale in scales:
+            print(f"{scale} rows ({args.server}, {args.clients} clients, {args.requests} requests per endpoint)")
+            db_path = seeded_db(scale, args.cache_dir and os.path.abspath(args.cache_dir), workdir)
+            client = (GunicornClient(db_path, args.workers) if args.server == 'gunicorn'
+                      else WsgiClient(db_path))
+            try:
+                for name, path_for in endpoints(ROW_SCALES[scale]):
+                    row = drive(client, path_for, args.clients, args.requests, args.revalidate)
+                    results.append(dict(row, rows=scale, endpoint=name))
+                    print(f"  {name:<17} {row['rps']:>8.1f} req/s  p50 {row['p50_ms']:.2f} ms  "
+                          f"p99 {row['p99_ms']:.2f} ms  {row['bytes']} B/req  {row['not_modified']} x 304")
+            finally:
+                client.close()
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(results, baseline)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'meta': {'server': args.server, 'workers': args.workers, 'clients': args.clients,
+                         'revalidate': args.revalidate,
+                         'requests': args.requests, 'python': platform.python_version(),
+                         'sqlite': sqlite3.sqlite_version, 'machine': platform.machine(),
+                         'cpus': os.cpu_count(), 'timestamp': time.strftime('%Y-%m-%d %H:%M:%S')},
+                'results': results,
+            }, f, indent=2)
+        print(f"\nwrote {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Benchmark backup_all_bots: per-bot zips + re-deflated master vs one-pass bundle.
+
+Generates N synthetic bots (source file plus log file), then builds the
+"all bots" archive both ways and reports wall time, bytes handed to
+write(2) (from /proc/self/io, Linux only) and the final archive size.
+
+    python benchmarks/bench_backup.py [--bots 50] [--log-kb 256]
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archive import BundleWriter, write_bot_archive  # noqa: E402
+
+
+def written_bytes():
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def make_bots(root, count, log_kb):
+    rng = random.Random(42)
+    bots = []
+    for i in range(count):
+        source = root / f"bot_{i}.py"
+        source.write_text("import telebot\n" + "\n".join(
+            f"# {''.join(rng.choices(string.ascii_letters, k=60))}" for _ in range(300)))
+        log = root / f"bot_{i}.log"
+        log.write_text("".join(f"2024-01-01 00:00:{n % 60:02d} INFO handled update {rng.random()}\n"
+                               for n in range(log_kb * 1024 // 52)))
+        metadata = {'bot_id': i, 'bot_name': f"bot {i}", 'filename': source.name, 'token': 'x' * 46}
+        bots.append((i, source, log, metadata))
+    return bots
+
+
+def legacy(bots, out_dir):
+    """The previous flow: zip per bot on disk, deflate them again, delete"""
+    backup_files = []
+    for bot_id, source, log, metadata in bots:
+        path = out_dir / f"bot_export_{bot_id}.zip"
+        write_bot_archive(path, source, metadata, log)
+        backup_files.append(path)
+
+    master = out_dir / "all_bots_backup.zip"
+    with zipfile.ZipFile(master, 'w', zipfile.ZIP_DEFLATED) as master_zipf:
+        for backup_file in backup_files:
+            master_zipf.write(backup_file, arcname=backup_file.name)
+
+    with open(master, 'rb') as f:
+        size = len(f.read())  # stands in for the upload
+
+    master.unlink()
+    for backup_file in backup_files:
+        backup_file.unlink()
+    return size
+
+
+def bundled(bots, out_dir):
+    """The one-pass flow used by backup_all_bots; the bundle is kept as the backup"""
+    master = out_dir / "all_bots_bundle.zip"
+    with open(master, 'w+b') as archive:
+        with BundleWriter(archive) as bundle:
+            for bot_id, source, log, metadata in bots:
+                bundle.add_bot(f"bot_export_{bot_id}.zip", source, metadata, log)
+        return len(archive.read())  # stands in for the upload
+
+
+def run(name, fn):
+    before = written_bytes()
+    start = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - start
+    written = written_bytes() - before
+    print(f"{name:<26} {elapsed * 1000:>10.1f} {written / 1024:>14.1f} {size / 1024:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bots', type=int, default=50)
+    parser.add_argument('--log-kb', type=int, default=256)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        (root / 'src').mkdir()
+        (root / 'out').mkdir()
+        bots = make_bots(root / 'src', args.bots, args.log_kb)
+
+        print(f"{args.bots} bots, {args.log_kb} KB log each")
+        print(f"{'flow':<26} {'time ms':>10} {'written KiB':>14} {'size KiB':>12}")
+        run("per-bot zips + master", lambda: legacy(bots, root / 'out'))
+        run("one-pass bundle", lambda: bundled(bots, root / 'out'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Compare SELECT * + sqlite3.Row against projected slotted records.
+
+Builds a throwaway database with N deployments (default 10k) whose logs,
+metadata and token columns carry realistic payloads, then measures latency
+and peak Python memory for the admin bot listing and a single-row lookup.
+
+    python benchmarks/bench_dal.py [--rows 10000] [--repeat 5]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dal import DataAccess  # noqa: E402
+
+
+def build_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE users
+                    (id INTEGER PRIMARY KEY, username TEXT, expiry TEXT, file_limit INTEGER,
+                     is_prime INTEGER, join_date TEXT, last_renewal TEXT, total_bots_deployed INTEGER DEFAULT 0,
+                     total_deployments INTEGER DEFAULT 0, last_active TEXT, bot_username TEXT)''')
+    conn.execute('''CREATE TABLE deployments
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, bot_name TEXT,
+                     filename TEXT, pid INTEGER, start_time TEXT, status TEXT,
+                     cpu_usage REAL, ram_usage REAL, last_active TEXT, node_id INTEGER,
+                     logs TEXT, restart_count INTEGER DEFAULT 0, auto_restart INTEGER DEFAULT 1,
+                     created_at TEXT, updated_at TEXT, bot_username TEXT, is_banned INTEGER DEFAULT 0,
+                     token TEXT, metadata TEXT)''')
+    now = '2024-01-01 00:00:00'
+    users = rows // 5 or 1
+    conn.executemany("INSERT INTO users (id, username, join_date) VALUES (?, ?, ?)",
+                     ((i, f"user{i}", now) for i in range(1, users + 1)))
+    logs = 'x' * 4096
+    metadata = '{"k": "' + 'm' * 2000 + '"}'
+    conn.executemany("""
+        INSERT INTO deployments (user_id, bot_name, filename, pid, status, node_id, logs,
+                                 created_at, updated_at, bot_username, token, metadata)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, ((i % users + 1, f"bot{i}", f"bot{i}.py", 1000 + i, 'Running' if i % 2 else 'Stopped',
+           i % 3 + 1, logs, now, now, f"@bot{i}", '123456:' + 'T' * 35, metadata)
+          for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def row_select_star(db_path, lock):
+    with lock:
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute("""
+            SELECT d.*, u.username as user_username
+            FROM deployments d
+            LEFT JOIN users u ON d.user_id = u.id
+            ORDER BY d.id DESC
+        """).fetchall()
+        conn.close()
+    return rows
+
+
+def row_single(db_path, lock, bot_id):
+    with lock:
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        row = conn.execute("SELECT * FROM deployments WHERE id=?", (bot_id,)).fetchone()
+        conn.close()
+    return row['bot_name'], row['pid']
+
+
+def measure(fn, repeat):
+    fn()  # warm the page cache
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return min(timings), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    lock = threading.RLock()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        build_db(db_path, args.rows)
+        dal = DataAccess(db_path, lock)
+        probe = args.rows // 2
+
+        cases = [
+            ("all bots: SELECT * + Row", lambda: row_select_star(db_path, lock)),
+            ("all bots: projected records", lambda: dal.all_deployments('admin_list')),
+            ("one bot x1000: SELECT * + Row",
+             lambda: [row_single(db_path, lock, probe) for _ in range(1000)]),
+            ("one bot x1000: projected record",
+             lambda: [(b.bot_name, b.pid) for b in (dal.deployment(probe, 'list') for _ in range(1000))]),
+        ]
+
+        print(f"{args.rows} deployments, best of {args.repeat}")
+        print(f"{'case':<36} {'latency ms':>12} {'peak MiB':>10}")
+        for name, fn in cases:
+            latency, peak = measure(fn, args.repeat)
+            print(f"{name:<36} {latency * 1000:>12.2f} {peak / 1048576:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Benchmark library installs: cold resolve vs an already-cached requirement set.
+
+Builds a local stand-in package index of small pure-Python wheels, so the
+run is fully offline. Installs the same set for many bots (and a few
+unrelated sets in parallel) and reports time and extra disk per overlay.
+
+    python benchmarks/bench_deps.py [--bots 20] [--packages 8]
+"""
+import argparse
+import base64
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deps import DependencyManager  # noqa: E402
+
+
+def build_wheel(index, name, version, requires=()):
+    """Write a minimal pure-Python wheel for ``name`` into ``index``"""
+    dist_info = f"{name}-{version}.dist-info"
+    files = {
+        f"{name}/__init__.py": f"VERSION = {version!r}\n" + "x = 1\n" * 2000,
+        f"{dist_info}/METADATA": "Metadata-Version: 2.1\n"
+                                 f"Name: {name}\nVersion: {version}\n"
+                                 + ''.join(f"Requires-Dist: {r}\n" for r in requires),
+        f"{dist_info}/WHEEL": "Wheel-Version: 1.0\nGenerator: bench\nRoot-Is-Purelib: true\nTag: py3-none-any\n",
+    }
+    record = []
+    path = index / f"{name}-{version}-py3-none-any.whl"
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for arcname, text in files.items():
+            data = text.encode()
+            digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b'=').decode()
+            record.append(f"{arcname},sha256={digest},{len(data)}")
+            zf.writestr(arcname, data)
+        record.append(f"{dist_info}/RECORD,,")
+        zf.writestr(f"{dist_info}/RECORD", '\n'.join(record) + '\n')
+    return path
+
+
+def disk_usage(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.lstat(os.path.join(root, name)).st_size
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bots', type=int, default=20)
+    parser.add_argument('--packages', type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        index = root / 'index'
+        index.mkdir()
+        names = [f"zenxpkg{i}" for i in range(args.packages)]
+        for i, name in enumerate(names):
+            # Each package depends on the next, so resolution is not trivial
+            build_wheel(index, name, '1.0', requires=names[i + 1:i + 2])
+        for i in range(4):
+            build_wheel(index, f"zenxextra{i}", '1.0')
+
+        manager = DependencyManager(root / 'deps', base_packages=['zenxextra0'],
+                                    index_args=['--no-index', '--find-links', str(index)])
+        requirements = [names[0]]
+
+        start = time.perf_counter()
+        manager.install(0, requirements)
+        cold = time.perf_counter() - start
+        store_size = disk_usage(manager.store)
+
+        timings = []
+        for bot_id in range(1, args.bots):
+            start = time.perf_counter()
+            manager.install(bot_id, requirements)
+            timings.append(time.perf_counter() - start)
+        overlay_size = disk_usage(manager.envs) / args.bots
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            list(pool.map(lambda i: manager.install(1000 + i, [f"zenxextra{i}"]), range(1, 4)))
+        parallel = time.perf_counter() - start
+
+        # The overlay must actually make the packages importable
+        overlay = manager.overlay_path(1)
+        check = subprocess.run(
+            [sys.executable, '-c', f"import {names[-1]}; print({names[-1]}.VERSION)"],
+            env={**os.environ, 'PYTHONPATH': str(overlay)}, capture_output=True, text=True)
+
+        timings.sort()
+        print(f"{args.packages} chained packages, {args.bots} bots")
+        print(f"cold install           {cold * 1000:>9.1f} ms")
+        print(f"cached install p50     {timings[len(timings) // 2] * 1000:>9.1f} ms")
+        print(f"cached install max     {timings[-1] * 1000:>9.1f} ms")
+        print(f"3 new sets in parallel {parallel * 1000:>9.1f} ms")
+        print(f"shared store           {store_size / 1024:>9.1f} KiB")
+        print(f"overlay per bot        {overlay_size / 1024:>9.1f} KiB")
+        print(f"import via overlay     {check.stdout.strip() or check.stderr.strip()[-200:]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+"""End-to-end load test of the bot against a local fake Bot API.
+
+Seeds cyber_v2.db in a scratch directory, imports main.py there with the
+Telegram API pointed at benchmarks/fake_telegram.py and runs the real
+polling loop and handlers. Scripted users then arrive at a fixed rate and
+play one scenario each:
+
+    start     /start
+    upload    send a .py document, then name the bot
+    backup    press "Create Backup" on one of their bots
+    paginate  admin pages through the all-bots list
+    deploy    admin /bulk restart of one stopped bot, then confirm
+
+Reports throughput, end-to-end reply latency per step and, from the
+per-update traces, p50/p99 handler time and DB time per update kind.
+
+    python benchmarks/bench_load.py [--scale large] [--rate 20] [--duration 30]
+        [--mix start=50,upload=15,backup=10,paginate=20,deploy=5] [--api-latency-ms 30]
+
+The tree has no handlers behind the "Upload Bot" and per-bot deploy
+buttons, so upload sets the waiting-for-file session state directly and
+deploy goes through the admin bulk action.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import FakeTelegram  # noqa: E402
+from seed import SCALES, seed, write_bot_files  # noqa: E402
+
+DEFAULT_MIX = 'start=50,upload=15,backup=10,paginate=20,deploy=5'
+
+UPLOAD_SOURCE = b'''import time
+
+BOT_TOKEN = "123456789:AAbenchmarkbenchmarkbenchmarkbench"
+
+while True:
+    time.sleep(60)
+'''
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return mix
+
+
+class Driver:
+    """Plays scenarios for scripted users and records per-step reply latency"""
+
+    def __init__(self, main, fake, users, owners, stopped, timeout):
+        self.main = main
+        self.fake = fake
+        self.users = users
+        self.owners = owners
+        self.stopped = stopped
+        self.timeout = timeout
+        self.admin = main.Config.ADMIN_ID
+        self.busy = set()
+        self.busy_lock = threading.Lock()
+        self.admin_lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.timeouts = defaultdict(int)
+        self.completed = defaultdict(int)
+        self.rng = random.Random(7)
+
+    def step(self, name, chat_id, push, match=None):
+        """Push one update and wait for the bot's reply to it"""
+        since = self.fake.mark()
+        started = time.perf_counter()
+        push()
+        reply = self.fake.wait_reply(chat_id, since, match, self.timeout)
+        if reply is None:
+            self.timeouts[name] += 1
+            return False
+        self.latencies[name].append(reply.at - started)
+        return True
+
+    def claim_user(self, pool):
+        with self.busy_lock:
+            for _ in range(20):
+                uid = self.rng.choice(pool)
+                if uid not in self.busy:
+                    self.busy.add(uid)
+                    return uid
+        return None
+
+    def release_user(self, uid):
+        with self.busy_lock:
+            self.busy.discard(uid)
+
+    def run(self, scenario):
+        if scenario in ('paginate', 'deploy'):
+            with self.admin_lock:
+                ok = SCENARIOS[scenario](self, self.admin)
+        else:
+            uid = self.claim_user(self.owners_list if scenario == 'backup' else self.users)
+            if uid is None:
+                return
+            try:
+                ok = SCENARIOS[scenario](self, uid)
+            finally:
+                self.release_user(uid)
+        if ok:
+            self.completed[scenario] += 1
+
+    @property
+    def owners_list(self):
+        return list(self.owners)
+
+
+def scenario_start(driver, uid):
+    return driver.step('start', uid, lambda: driver.fake.send_text(uid, '/start'))
+
+
+def scenario_upload(driver, uid):
+    main, fake = driver.main, driver.fake
+    main.set_user_session(uid, {'state': 'waiting_for_file'})
+    name = f"load_{uid}_{int(time.time() * 1000)}.py"
+    if not driver.step('upload:document', uid, lambda: fake.send_document(uid, name, UPLOAD_SOURCE),
+                       match='BOT NAME SETUP'):
+        return False
+    # The name prompt is sent just before its next-step handler is registered
+    deadline = time.monotonic() + driver.timeout
+    while uid not in main.bot.next_step_backend.handlers:
+        if time.monotonic() > deadline:
+            driver.timeouts['upload:name'] += 1
+            return False
+        time.sleep(0.002)
+    return driver.step('upload:name', uid, lambda: fake.send_text(uid, f"Load {uid}"), match='UPLOADED')
+
+
+def scenario_backup(driver, uid):
+    bot_id = driver.rng.choice(driver.owners[uid])
+    return driver.step('backup', uid, lambda: driver.fake.press_button(uid, f"create_backup_{bot_id}"),
+                       match='Backup Created')
+
+
+def scenario_paginate(driver, uid):
+    pages = max((sum(len(b) for b in driver.owners.values()) + 9) // 10, 1)
+    page = driver.rng.randrange(pages)
+    return driver.step('paginate', uid, lambda: driver.fake.press_button(uid, f"allbots_page_{page}"),
+                       match='ALL BOTS')
+
+
+def scenario_deploy(driver, uid):
+    if not driver.stopped:
+        return False
+    bot_id = driver.stopped.popleft()
+    fake = driver.fake
+    if not driver.step('deploy:preview', uid, lambda: fake.send_text(uid, f"/bulk restart {bot_id}"),
+                       match='CONFIRM BULK'):
+        return False
+    return driver.step('deploy:run', uid, lambda: fake.press_button(uid, 'bulk_go'), match='BULK RESTART')
+
+
+SCENARIOS = {
+    'start': scenario_start,
+    'upload': scenario_upload,
+    'backup': scenario_backup,
+    'paginate': scenario_paginate,
+    'deploy': scenario_deploy,
+}
+
+
+def report(driver, main, fake, elapsed, started_at):
+    total = sum(driver.completed.values())
+    print(f"\n{total} scenarios in {elapsed:.1f}s ({total / elapsed:.1f}/s), "
+          f"{fake.next_update_id - 1} updates ({(fake.next_update_id - 1) / elapsed:.1f}/s)")
+    for name in SCENARIOS:
+        if driver.completed.get(name):
+            print(f"  {name:<9} {driver.completed[name]:>6}")
+
+    print("\nreply latency (update queued -> first matching reply)")
+    print(f"  {'step':<16} {'n':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'timeouts':>8}")
+    for name in sorted(set(driver.latencies) | set(driver.timeouts)):
+        values = driver.latencies.get(name, [])
+        print(f"  {name:<16} {len(values):>6} {percentile(values, 0.5) * 1000:>8.1f} "
+              f"{percentile(values, 0.99) * 1000:>8.1f} {max(values, default=0) * 1000:>8.1f} "
+              f"{driver.timeouts.get(name, 0):>8}")
+
+    by_kind = defaultdict(list)
+    for trace in main.tracer.recent():
+        if trace.started_at >= started_at:
+            by_kind[trace.kind].append(trace)
+    print("\nhandler time per update kind (from traces)")
+    print(f"  {'kind':<28} {'n':>6} {'p50 ms':>8} {'p99 ms':>8} {'db p50':>8} {'db p99':>8} {'db share':>8}")
+    for kind, traces in sorted(by_kind.items(), key=lambda item: -len(item[1])):
+        durations = [t.duration for t in traces]
+        db = [t.totals.get('db', (0.0, 0))[0] for t in traces]
+        share = sum(db) / sum(durations) if sum(durations) else 0.0
+        print(f"  {kind[:28]:<28} {len(traces):>6} {percentile(durations, 0.5) * 1000:>8.1f} "
+              f"{percentile(durations, 0.99) * 1000:>8.1f} {percentile(db, 0.5) * 1000:>8.2f} "
+              f"{percentile(db, 0.99) * 1000:>8.2f} {share * 100:>7.0f}%")
+
+    lock = main.db_lock.report(top=3)
+    print(f"\ndb_lock: {lock['acquisitions']} acquisitions, {lock['contended']} contended, "
+          f"wait {lock['wait_total_ms']:.0f} ms, hold {lock['hold_total_ms']:.0f} ms")
+    for site in lock['sites']:
+        print(f"  wait {site['wait_total_ms']:8.1f} ms  {site['count']:>6}x  {site['site'][:90]}")
+
+    calls = ', '.join(f"{method} {count}" for method, count in fake.calls.most_common())
+    print(f"\nBot API calls: {calls}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='large')
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--bots', type=int)
+    parser.add_argument('--rate', type=float, default=20, help='scenario arrivals per second')
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--api-latency-ms', type=float, default=30)
+    parser.add_argument('--concurrency', type=int, default=64, help='scenarios in flight at most')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--keep', action='store_true', help='keep the scratch directory')
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    workdir = tempfile.mkdtemp(prefix='zenx-load-')
+    os.chdir(workdir)
+    os.environ.setdefault('BOT_TOKEN', '123456:load-test')
+    os.environ['ZENX_ZYGOTE'] = '0'
+
+    users, bots = SCALES[args.scale]
+    users, bots = args.users or users, args.bots or bots
+    fake = FakeTelegram(latency=args.api_latency_ms / 1000).start()
+
+    import main as host
+    from telebot import apihelper
+    apihelper.API_URL = fake.api_url
+    apihelper.FILE_URL = fake.file_url
+
+    conn = sqlite3.connect(host.Config.DB_NAME, isolation_level=None)
+    counts = seed(conn, users, bots, admin_id=host.Config.ADMIN_ID)
+    write_bot_files(conn, host.Config.PROJECT_DIR)
+    owners = defaultdict(list)
+    stopped = deque()
+    for bot_id, owner, status in conn.execute("SELECT id, user_id, status FROM deployments"):
+        owners[owner].append(bot_id)
+        if status == 'Stopped':
+            stopped.append(bot_id)
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE id != ?", (host.Config.ADMIN_ID,))]
+    conn.close()
+    print(f"seeded {workdir}: " + ', '.join(f"{count} {table}" for table, count in counts.items()))
+
+    host.init_db()
+    host.notification_store.start()
+    host.write_buffer.start()
+    host.tracer.buffer = deque(maxlen=1000000)
+    host.db_lock.set_enabled(True)
+    poller = threading.Thread(target=host.bot.polling, kwargs={'none_stop': True, 'timeout': 5},
+                              name="bot-polling", daemon=True)
+    poller.start()
+
+    driver = Driver(host, fake, user_ids, dict(owners), stopped, args.timeout)
+    names, weights = zip(*mix.items())
+    rng = random.Random(3)
+    pool = ThreadPoolExecutor(max_workers=args.concurrency)
+    print(f"{args.rate:g} scenarios/s for {args.duration:g}s, mix {args.mix}, "
+          f"Bot API latency {args.api_latency_ms:g} ms")
+
+    started_at = time.time()
+    start = time.perf_counter()
+    arrivals = 0
+    while time.perf_counter() - start < args.duration:
+        pool.submit(driver.run, rng.choices(names, weights)[0])
+        arrivals += 1
+        # Poisson arrivals
+        time.sleep(rng.expovariate(args.rate))
+    pool.shutdown(wait=True)
+    elapsed = time.perf_counter() - start
+
+    report(driver, host, fake, elapsed, started_at)
+
+    host.bot.stop_polling()
+    running = list(host.supervisor.bots)
+    if running:
+        host.supervisor.stop_many(running, timeout=5)
+    host.notification_store.stop()
+    host.write_buffer.stop()
+    fake.stop()
+    if not args.keep:
+        import shutil
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Overhead and output of the db_lock contention profiler.
+
+Several threads run a mix of short lookups and a slow write against one
+SQLite file, each under the shared lock as execute_db does, first with a
+plain RLock, then with ProfiledLock switched off and on. Prints the
+per-acquisition overhead and the resulting top-sites report.
+
+    python benchmarks/bench_lockprof.py [--threads 8] [--ops 2000]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lockprof import ProfiledLock  # noqa: E402
+
+QUERIES = [
+    ("SELECT id, status FROM deployments WHERE id=?", False),
+    ("SELECT COUNT(*) FROM deployments WHERE user_id=?", False),
+    ("UPDATE deployments SET status='Running', updated_at=datetime('now') WHERE id=?", True),
+]
+
+
+def workload(db_path, lock, threads, ops):
+    def worker(seed):
+        for i in range(ops):
+            query, commit = QUERIES[(seed + i) % len(QUERIES)]
+            if hasattr(lock, 'tag'):
+                lock.tag(query)
+            with lock:
+                conn = sqlite3.connect(db_path)
+                conn.execute(query, ((seed * ops + i) % 1000,)).fetchall()
+                if commit:
+                    conn.commit()
+                conn.close()
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE deployments (id INTEGER PRIMARY KEY, user_id INTEGER, status TEXT, updated_at TEXT)")
+        conn.executemany("INSERT INTO deployments VALUES (?, ?, 'Stopped', NULL)", ((i, i % 50) for i in range(1000)))
+        conn.commit()
+        conn.close()
+
+        total = args.threads * args.ops
+        plain = workload(db_path, threading.RLock(), args.threads, args.ops)
+        off = workload(db_path, ProfiledLock(), args.threads, args.ops)
+        profiled = ProfiledLock(enabled=True)
+        on = workload(db_path, profiled, args.threads, args.ops)
+
+        print(f"{total} locked queries on {args.threads} threads")
+        for name, elapsed in (('RLock', plain), ('ProfiledLock off', off), ('ProfiledLock on', on)):
+            print(f"  {name:<17} {elapsed:6.2f}s  {elapsed / total * 1e6:7.1f} us/query")
+
+        report = profiled.report(top=5)
+        print(f"\n{report['acquisitions']} acquisitions, {report['contended']} contended, "
+              f"wait {report['wait_total_ms']:.0f} ms, hold {report['hold_total_ms']:.0f} ms")
+        for site in report['sites']:
+            print(f"  wait {site['wait_total_ms']:8.1f} ms  max {site['wait_max_ms']:6.1f}  "
+                  f"hold avg {site['hold_avg_ms']:5.2f} ms  {site['count']:>6}x  {site['site']}")
+
+
+if __name__ == '__main__':
+    main()
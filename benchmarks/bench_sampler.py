@@ -0,0 +1,86 @@
+"""Overhead and output of the on-demand stack sampler.
+
+A few threads run a CPU-bound workload with deep-ish call stacks while
+many more sit idle, as the bot's worker pools do. The workload is timed
+alone and with StackSampler running at several intervals; prints the
+slowdown, the sampler's own reported overhead and the hottest functions.
+
+    python benchmarks/bench_sampler.py [--busy 4] [--idle 40] [--seconds 3]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sampler import StackSampler  # noqa: E402
+
+
+def leaf(n):
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+
+
+def middle(depth, n):
+    if depth:
+        return middle(depth - 1, n)
+    return leaf(n)
+
+
+def busy(stop, counter):
+    while not stop.is_set():
+        middle(20, 2000)
+        counter[0] += 1
+
+
+def run(args, sampler_interval=None):
+    stop = threading.Event()
+    idle_stop = threading.Event()
+    counters = [[0] for _ in range(args.busy)]
+    threads = [threading.Thread(target=idle_stop.wait, daemon=True) for _ in range(args.idle)]
+    threads += [threading.Thread(target=busy, args=(stop, c), daemon=True) for c in counters]
+    for t in threads:
+        t.start()
+    profile = None
+    if sampler_interval is None:
+        time.sleep(args.seconds)
+    else:
+        profile = StackSampler(sampler_interval).run(args.seconds)
+    stop.set()
+    idle_stop.set()
+    for t in threads:
+        t.join()
+    return sum(c[0] for c in counters), profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--busy', type=int, default=4)
+    parser.add_argument('--idle', type=int, default=40)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    baseline, _ = run(args)
+    print(f"{args.busy} busy + {args.idle} idle threads, {args.seconds:.0f}s per run")
+    print(f"  {'no sampler':<16} {baseline:>8} iterations")
+    profile = None
+    for interval in (0.05, 0.01, 0.005, 0.001):
+        done, profile = run(args, interval)
+        print(f"  {f'every {interval * 1000:g} ms':<16} {done:>8} iterations  "
+              f"slowdown {(1 - done / baseline) * 100:5.1f}%  "
+              f"{profile.samples:>5} samples  sampler overhead {profile.overhead * 100:5.2f}%")
+
+    print(f"\n{profile.idle_share * 100:.0f}% of thread samples idle; hottest busy functions "
+          f"(self / total samples), last run:")
+    for frame, own, total in profile.top_functions(5):
+        print(f"  {own:>6} {total:>6}  {frame}")
+    print(f"\n{len(profile.stacks)} distinct stacks, e.g.:")
+    print('  ' + profile.collapsed().splitlines()[0][:160])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Benchmark bot cold start: plain subprocess.Popen vs the zygote fork server.
+
+Launches N copies of a bot script that imports the usual hosting
+dependencies, waits until each prints "ready", and reports spawn latency
+(p50/p99/total) and the combined proportional memory (PSS) of the fleet.
+Linux only.
+
+    python benchmarks/bench_spawn.py [--bots 20]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import procfs  # noqa: E402
+from supervisor import BotSupervisor  # noqa: E402
+from zygote import ForkServer  # noqa: E402
+
+BOT_SCRIPT = """
+import json, logging, sqlite3, threading
+try:
+    import telebot
+except ImportError:
+    pass
+try:
+    import requests
+except ImportError:
+    pass
+print("ready", flush=True)
+import time
+time.sleep(600)
+"""
+
+
+def wait_ready(log_path, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if b'ready' in log_path.read_bytes():
+                return True
+        except FileNotFoundError:
+            pass
+        time.sleep(0.002)
+    return False
+
+
+def run(name, supervisor, script, count):
+    latencies = []
+    for bot_id in range(count):
+        start = time.perf_counter()
+        managed = supervisor.launch(bot_id, script)
+        if not wait_ready(managed.log_path):
+            print(f"bot {bot_id} never became ready")
+        latencies.append(time.perf_counter() - start)
+
+    time.sleep(0.5)
+    pss = sum(procfs.proportional_rss(m.pid) for m in supervisor.bots.values())
+
+    for bot_id in list(supervisor.bots):
+        supervisor.stop(bot_id, timeout=5)
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:<12} {statistics.median(latencies) * 1000:>9.1f} {p99 * 1000:>9.1f} "
+          f"{sum(latencies):>10.2f} {pss / 1048576:>12.1f} {pss / count / 1048576:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bots', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        script = root / 'bot.py'
+        script.write_text(BOT_SCRIPT)
+        limits = {'free': {}}
+
+        print(f"{args.bots} bots")
+        print(f"{'launcher':<12} {'p50 ms':>9} {'p99 ms':>9} {'total s':>10} {'fleet PSS MiB':>12} {'MiB/bot':>10}")
+
+        run("popen", BotSupervisor(limits, root / 'logs_popen'), script, args.bots)
+
+        zygote = ForkServer(str(root / 'zygote.sock'))
+        if not zygote.start():
+            print("zygote failed to start")
+            return
+        try:
+            run("zygote", BotSupervisor(limits, root / 'logs_zygote', zygote=zygote), script, args.bots)
+        finally:
+            zygote.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""Control-plane scale test: one supervisor managing N synthetic bots.
+
+Launches N copies of a small bot script that sleeps, logs at a set rate,
+burns a set share of a CPU, holds some ballast memory and crashes with a
+set probability per second. A loop then does what supervise_bots() does
+every tick - reap exits, relaunch crashed bots, sample and police
+resources, check liveness - for a fixed time. Reports:
+
+  - launch time for the whole fleet
+  - control-plane CPU (process time while supervising) and tick duration
+  - crash-to-ready restart latency
+  - log throughput landed in the bots' log files
+  - PSS per bot and control-plane RSS growth per managed bot
+  - recovery after a control-plane restart: a fresh supervisor adopting
+    every running bot, and a cold relaunch of the whole fleet
+
+Linux only.
+
+    python benchmarks/bench_supervisor.py [--bots 300] [--duration 60] [--interval 1]
+        [--log-rate 2] [--crash-rate 0.002] [--cpu 0.01] [--ballast-mb 2]
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import procfs  # noqa: E402
+from liveness import Watchdog  # noqa: E402
+from supervisor import BotSupervisor  # noqa: E402
+
+# Same shape as the free plan, so enforce() does its usual work
+LIMITS = {'free': {'memory_mb': 128, 'max_files': 128, 'nice': 10, 'cpu_quota': 0.25}}
+
+BOT_SCRIPT = '''import os, random, time
+log_rate = float(os.environ['BENCH_LOG_RATE'])
+crash_rate = float(os.environ['BENCH_CRASH_RATE'])
+cpu = float(os.environ['BENCH_CPU'])
+ballast = bytearray(int(float(os.environ['BENCH_BALLAST_MB']) * 1048576))
+for i in range(0, len(ballast), 4096):
+    ballast[i] = 1
+print(f"ready {time.time():.6f}", flush=True)
+tick = 0.1
+logged = 0
+started = time.monotonic()
+while True:
+    now = time.monotonic()
+    if cpu:
+        while time.monotonic() - now < cpu * tick:
+            pass
+    due = int((now - started) * log_rate)
+    while logged < due:
+        logged += 1
+        print(f"{time.strftime('%H:%M:%S')} INFO handled update {logged} for chat {random.randint(1, 10**9)}", flush=True)
+    if crash_rate and random.random() < crash_rate * tick:
+        print(f"crash {time.time():.6f}", flush=True)
+        os._exit(1)
+    time.sleep(max(tick - (time.monotonic() - now), 0))
+'''
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def self_rss_mb():
+    stat = procfs.read_stat(os.getpid())
+    return stat['rss_bytes'] / 1048576 if stat else 0.0
+
+
+def last_marker(log_path, marker):
+    """Timestamp on the last ``marker`` line of a bot log"""
+    try:
+        with open(log_path, 'rb') as f:
+            f.seek(max(os.path.getsize(log_path) - 65536, 0))
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    for line in reversed(lines):
+        if line.startswith(marker):
+            try:
+                return float(line.split()[1])
+            except (IndexError, ValueError):
+                return None
+    return None
+
+
+def launch_fleet(supervisor, watchdog, script, bot_ids, env):
+    """Launch bots and wait until each printed 'ready'; returns seconds taken"""
+    started = time.perf_counter()
+    for bot_id in bot_ids:
+        supervisor.launch(bot_id, script, env=watchdog.env_for(bot_id, env))
+    pending = set(bot_ids)
+    deadline = time.monotonic() + 120
+    while pending and time.monotonic() < deadline:
+        pending = {b for b in pending if last_marker(supervisor.log_path(b), b'ready') is None}
+        if pending:
+            time.sleep(0.05)
+    if pending:
+        print(f"  {len(pending)} bots never became ready")
+    return time.perf_counter() - started
+
+
+def log_totals(supervisor, bot_ids):
+    """(bytes, lines) across the bots' log files"""
+    size = lines = 0
+    for bot_id in bot_ids:
+        try:
+            with open(supervisor.log_path(bot_id), 'rb') as f:
+                data = f.read()
+        except OSError:
+            continue
+        size += len(data)
+        lines += data.count(b'\n')
+    return size, lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bots', type=int, default=300)
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--interval', type=float, default=1.0, help='supervise tick, seconds')
+    parser.add_argument('--log-rate', type=float, default=2.0, help='lines per second per bot')
+    parser.add_argument('--crash-rate', type=float, default=0.002, help='crash probability per second per bot')
+    parser.add_argument('--cpu', type=float, default=0.01, help='share of one CPU each bot burns')
+    parser.add_argument('--ballast-mb', type=float, default=2.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        script = root / 'bot.py'
+        script.write_text(BOT_SCRIPT)
+        logs = root / 'logs'
+        env = dict(os.environ, BENCH_LOG_RATE=str(args.log_rate), BENCH_CRASH_RATE=str(args.crash_rate),
+                   BENCH_CPU=str(args.cpu), BENCH_BALLAST_MB=str(args.ballast_mb))
+        bot_ids = list(range(1, args.bots + 1))
+
+        supervisor = BotSupervisor(LIMITS, logs)
+        watchdog = Watchdog(logs, timeout=300)
+        rss_before = self_rss_mb()
+        launch = launch_fleet(supervisor, watchdog, script, bot_ids, env)
+        print(f"{args.bots} bots launched and ready in {launch:.2f}s ({launch / args.bots * 1000:.1f} ms/bot)")
+
+        # Steady state: the supervise_bots() tick, with auto-restart
+        ticks = []
+        restarts = []
+        crashes = 0
+        pending_restart = {}
+        bytes_start, lines_start = log_totals(supervisor, bot_ids)
+        cpu_start = time.process_time()
+        usage_start = resource.getrusage(resource.RUSAGE_SELF)
+        started = time.perf_counter()
+        while time.perf_counter() - started < args.duration:
+            tick_start = time.perf_counter()
+            for bot_id, _, _ in supervisor.poll():
+                crashes += 1
+                crashed_at = last_marker(supervisor.log_path(bot_id), b'crash') or time.time()
+                supervisor.launch(bot_id, script, env=watchdog.env_for(bot_id, env))
+                pending_restart[bot_id] = crashed_at
+            supervisor.enforce()
+            watchdog.check(list(supervisor.bots.values()))
+            for bot_id, crashed_at in list(pending_restart.items()):
+                ready = last_marker(supervisor.log_path(bot_id), b'ready')
+                if ready and ready > crashed_at:
+                    restarts.append(ready - crashed_at)
+                    del pending_restart[bot_id]
+            ticks.append(time.perf_counter() - tick_start)
+            time.sleep(max(args.interval - (time.perf_counter() - tick_start), 0))
+        wall = time.perf_counter() - started
+        cpu = time.process_time() - cpu_start
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        bytes_end, lines_end = log_totals(supervisor, bot_ids)
+        logged, lines = bytes_end - bytes_start, lines_end - lines_start
+
+        print(f"\nsupervising {len(supervisor.bots)} bots for {wall:.0f}s, tick every {args.interval:g}s")
+        print(f"  control-plane CPU   {cpu:.2f}s ({cpu / wall * 100:.2f}% of one core, "
+              f"{cpu / max(len(ticks), 1) / max(args.bots, 1) * 1e6:.0f} us per bot per tick)")
+        print(f"  tick duration       p50 {percentile(ticks, 0.5) * 1000:.1f} ms, "
+              f"p99 {percentile(ticks, 0.99) * 1000:.1f} ms, max {max(ticks, default=0) * 1000:.1f} ms")
+        print(f"  context switches    {usage.ru_nvcsw - usage_start.ru_nvcsw} voluntary, "
+              f"{usage.ru_nivcsw - usage_start.ru_nivcsw} involuntary")
+        print(f"  crashes             {crashes} ({len(pending_restart)} restarts still pending)")
+        if restarts:
+            print(f"  restart latency     p50 {percentile(restarts, 0.5) * 1000:.0f} ms, "
+                  f"p99 {percentile(restarts, 0.99) * 1000:.0f} ms (crash -> ready, includes tick wait)")
+        expected = args.log_rate * args.bots * wall
+        print(f"  bot logs            {lines / wall:.0f} lines/s, {logged / wall / 1024:.1f} KiB/s "
+              f"({lines / max(expected, 1) * 100:.0f}% of the {expected / wall:.0f} lines/s requested)")
+
+        alive = [m for m in supervisor.bots.values() if procfs.is_alive(m.pid)]
+        pss = [procfs.proportional_rss(m.pid) / 1048576 for m in alive]
+        rss_after = self_rss_mb()
+        print(f"  bot memory          PSS p50 {percentile(pss, 0.5):.1f} MB, total {sum(pss):.0f} MB")
+        print(f"  control-plane RSS   {rss_before:.1f} -> {rss_after:.1f} MB "
+              f"({(rss_after - rss_before) * 1024 / max(args.bots, 1):.1f} KB per managed bot)")
+
+        # Control-plane restart: a new process re-adopts bots by pid and start time
+        records = [(m.bot_id, m.pid, m.start_ticks) for m in supervisor.bots.values()]
+        fresh = BotSupervisor(LIMITS, logs)
+        started = time.perf_counter()
+        adopted = sum(1 for bot_id, pid, ticks_ in records if fresh.adopt(bot_id, pid, ticks_, script))
+        adopt = time.perf_counter() - started
+        print("\nrecovery after a control-plane restart")
+        print(f"  reattach            {adopted}/{len(records)} bots in {adopt * 1000:.0f} ms")
+
+        # Host restart: every bot is gone and the fleet is relaunched
+        supervisor.stop_many(list(supervisor.bots), timeout=5)
+        fresh.bots.clear()
+        cold = BotSupervisor(LIMITS, logs)
+        relaunch = launch_fleet(cold, watchdog, script, bot_ids, env)
+        print(f"  cold relaunch       {len(bot_ids)} bots ready in {relaunch:.2f}s")
+        cold.stop_many(list(cold.bots), timeout=5)
+
+
+if __name__ == '__main__':
+    main()
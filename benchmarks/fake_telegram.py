@@ -0,0 +1,274 @@
+"""Local stand-in for the Telegram Bot API, for load tests.
+
+Serves /bot<token>/<method> and /file/bot<token>/<path> on localhost.
+Tests queue updates (messages, documents, callback queries) that the bot
+receives through getUpdates long polling; everything the bot sends back
+is recorded per chat so a driver can wait for the reply to each step.
+
+Implemented methods: getMe, getUpdates, sendMessage, editMessageText,
+editMessageReplyMarkup, sendDocument, getFile and file downloads.
+Anything else (answerCallbackQuery, deleteMessage, ...) succeeds with
+``true``. Telebot passes parameters in the query string, including for
+multipart uploads, so only file bodies are read from the request body.
+
+    python benchmarks/fake_telegram.py --port 8081
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+BOT_USER = {'id': 999000001, 'is_bot': True, 'first_name': 'Zen X Host', 'username': 'zen_xbot'}
+
+MESSAGE_METHODS = ('sendMessage', 'editMessageText', 'editMessageReplyMarkup', 'sendDocument')
+
+
+class Reply:
+    __slots__ = ('seq', 'at', 'method', 'chat_id', 'text')
+
+    def __init__(self, seq, at, method, chat_id, text):
+        self.seq = seq
+        self.at = at
+        self.method = method
+        self.chat_id = chat_id
+        self.text = text
+
+
+class FakeTelegram:
+    """Bot API double: an update queue in, a per-chat reply log out.
+
+    ``latency`` seconds are slept in every outbound API call to model the
+    round trip to Telegram's servers.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, keep_replies=20):
+        self.latency = latency
+        self.keep_replies = keep_replies
+        self.updates = []
+        self.next_update_id = 1
+        self.message_ids = itertools.count(1)
+        self.reply_seq = itertools.count(1)
+        self.query_ids = itertools.count(1)
+        self.files = {}
+        self.replies = defaultdict(list)
+        self.calls = Counter()
+        self.bytes_in = 0
+        self.cond = threading.Condition()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    # Lifecycle
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self):
+        """Value for telebot.apihelper.API_URL"""
+        return self.base_url + "/bot{0}/{1}"
+
+    @property
+    def file_url(self):
+        """Value for telebot.apihelper.FILE_URL"""
+        return self.base_url + "/file/bot{0}/{1}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-telegram", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.cond:
+            self.cond.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+    # Incoming updates
+
+    def _push(self, payload):
+        with self.cond:
+            update_id = self.next_update_id
+            self.next_update_id += 1
+            payload['update_id'] = update_id
+            self.updates.append(payload)
+            self.cond.notify_all()
+        return update_id
+
+    def _message(self, user_id, username=None, **fields):
+        message = {'message_id': next(self.message_ids), 'date': int(time.time()),
+                   'chat': {'id': user_id, 'type': 'private'},
+                   'from': {'id': user_id, 'is_bot': False, 'first_name': username or str(user_id),
+                            'username': username or f"user{user_id}"}}
+        message.update(fields)
+        return message
+
+    def send_text(self, user_id, text, username=None):
+        entities = None
+        if text.startswith('/'):
+            entities = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        message = self._message(user_id, username, text=text)
+        if entities:
+            message['entities'] = entities
+        return self._push({'message': message})
+
+    def send_document(self, user_id, file_name, content, username=None):
+        file_id = f"doc{len(self.files) + 1}"
+        self.files[file_id] = content
+        document = {'file_id': file_id, 'file_unique_id': file_id, 'file_name': file_name,
+                    'mime_type': 'application/octet-stream', 'file_size': len(content)}
+        return self._push({'message': self._message(user_id, username, document=document)})
+
+    def press_button(self, user_id, data, message_id=None, username=None):
+        """A callback query from an inline button on one of the bot's messages"""
+        message = {'message_id': message_id or next(self.message_ids), 'date': int(time.time()),
+                   'chat': {'id': user_id, 'type': 'private'}, 'from': BOT_USER, 'text': '...'}
+        query = {'id': str(next(self.query_ids)), 'chat_instance': str(user_id), 'data': data, 'message': message,
+                 'from': {'id': user_id, 'is_bot': False, 'first_name': username or str(user_id),
+                          'username': username or f"user{user_id}"}}
+        return self._push({'callback_query': query})
+
+    def pending(self):
+        with self.cond:
+            return len(self.updates)
+
+    # Outgoing replies
+
+    def mark(self):
+        """Sequence number to pass as ``since`` to wait_reply"""
+        with self.cond:
+            return next(self.reply_seq)
+
+    def wait_reply(self, chat_id, since, match=None, timeout=30.0):
+        """First reply to ``chat_id`` after ``since`` whose text contains ``match``, or None"""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while True:
+                for reply in self.replies.get(chat_id, ()):
+                    if reply.seq > since and (match is None or match in (reply.text or '')):
+                        return reply
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+
+    def _record(self, method, params):
+        try:
+            chat_id = int(params.get('chat_id'))
+        except (TypeError, ValueError):
+            return
+        with self.cond:
+            replies = self.replies[chat_id]
+            replies.append(Reply(next(self.reply_seq), time.perf_counter(), method, chat_id,
+                                 params.get('text') or params.get('caption')))
+            del replies[:-self.keep_replies]
+            self.cond.notify_all()
+
+    # Bot API
+
+    def _get_updates(self, params):
+        offset = int(params.get('offset', 0))
+        limit = int(params.get('limit', 100))
+        timeout = float(params.get('timeout', 0))
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            self.updates = [u for u in self.updates if u['update_id'] >= offset]
+            while not self.updates and time.monotonic() < deadline:
+                self.cond.wait(deadline - time.monotonic())
+            return list(self.updates[:limit])
+
+    def call(self, method, params, body_size=0):
+        self.calls[method] += 1
+        self.bytes_in += body_size
+        if method == 'getUpdates':
+            return self._get_updates(params)
+        if self.latency:
+            time.sleep(self.latency)
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'getFile':
+            file_id = params.get('file_id')
+            if file_id not in self.files:
+                raise KeyError(file_id)
+            return {'file_id': file_id, 'file_unique_id': file_id, 'file_size': len(self.files[file_id]),
+                    'file_path': f"documents/{file_id}"}
+        if method in MESSAGE_METHODS:
+            self._record(method, params)
+            message = {'message_id': int(params.get('message_id') or next(self.message_ids)),
+                       'date': int(time.time()), 'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+                       'from': BOT_USER}
+            if method == 'sendDocument':
+                message['document'] = {'file_id': 'out', 'file_unique_id': 'out', 'file_size': body_size}
+                message['caption'] = params.get('caption', '')
+            else:
+                message['text'] = params.get('text', '')
+            return message
+        return True
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type='application/json'):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self):
+                url = urlsplit(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+                parts = url.path.strip('/').split('/')
+                if parts[0] == 'file' and len(parts) >= 4:
+                    content = fake.files.get(parts[-1])
+                    if content is None:
+                        self._send(404, b'Not Found', 'text/plain')
+                    else:
+                        self._send(200, content, 'application/octet-stream')
+                    return
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                try:
+                    result = fake.call(parts[-1], params, length)
+                    body = {'ok': True, 'result': result}
+                    status = 200
+                except Exception as e:
+                    body = {'ok': False, 'error_code': 400, 'description': f"Bad Request: {e}"}
+                    status = 400
+                self._send(status, json.dumps(body).encode())
+
+            do_GET = _handle
+            do_POST = _handle
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    args = parser.parse_args()
+    fake = FakeTelegram(port=args.port, latency=args.latency_ms / 1000).start()
+    print(f"Bot API stand-in on {fake.base_url}; set apihelper.API_URL = {fake.api_url!r}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
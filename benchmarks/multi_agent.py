@@ -0,0 +1,169 @@
+"""Run several node agents on this machine and drive them like the control plane.
+
+Starts N agent processes on Unix sockets, then:
+- starts a batch of bots on each, comparing one batched status call
+  with per-bot calls
+- kills a bot behind an agent's back and waits for the 'exited' event
+- rebalances a skewed placement across the agents through
+  RemoteNodeAgent
+- stops everything in one batched call per node
+
+    python benchmarks/multi_agent.py [--nodes 3] [--bots 20]
+"""
+import argparse
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from node_agent import NodeAgentClient, RemoteNodeAgent  # noqa: E402
+from rebalancer import Rebalancer  # noqa: E402
+from schema import init_schema  # noqa: E402
+
+BOT_SCRIPT = "import time\nprint('ready', flush=True)\ntime.sleep(600)\n"
+
+
+def start_agent(node_id, root):
+    address = f"unix:{root / f'node{node_id}.sock'}"
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'node_agent.py'), '--node-id', str(node_id),
+         '--listen', address, '--logs-dir', str(root / f"node{node_id}_logs"), '--poll-interval', '0.2'],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, cwd=str(root),
+    )
+    line = process.stdout.readline()
+    if b'ready' not in line:
+        raise RuntimeError(f"agent {node_id} failed to start")
+    return process, address
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--bots', type=int, default=20, help="bots per node")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        # Agents only start scripts under their --bots-dir (projects/ in their cwd)
+        script = root / 'projects' / 'bot.py'
+        script.parent.mkdir()
+        script.write_text(BOT_SCRIPT)
+        processes, clients = {}, {}
+        events = []
+        exited = threading.Event()
+
+        def on_event(node_id):
+            def handle(event):
+                events.append((node_id, event))
+                if event['event'] == 'exited':
+                    exited.set()
+            return handle
+
+        try:
+            for node_id in range(1, args.nodes + 1):
+                processes[node_id], address = start_agent(node_id, root)
+                clients[node_id] = NodeAgentClient(address, on_event=on_event(node_id))
+                clients[node_id].connect()
+            print(f"{args.nodes} agents up")
+
+            # Batched start
+            start = time.perf_counter()
+            for node_id, client in clients.items():
+                specs = [{'bot_id': node_id * 1000 + i, 'script': str(script)} for i in range(args.bots)]
+                failed = [r for r in client.start(specs) if 'error' in r]
+                if failed:
+                    print(f"node {node_id}: {len(failed)} starts failed: {failed[0]['error']}")
+            print(f"started {args.nodes * args.bots} bots in {time.perf_counter() - start:.2f}s")
+
+            # Batched vs per-bot status
+            client = clients[1]
+            bot_ids = [1000 + i for i in range(args.bots)]
+            start = time.perf_counter()
+            for _ in range(20):
+                client.status(bot_ids)
+            batched = (time.perf_counter() - start) / 20
+            start = time.perf_counter()
+            for _ in range(20):
+                for bot_id in bot_ids:
+                    client.status([bot_id])
+            single = (time.perf_counter() - start) / 20
+            print(f"status of {len(bot_ids)} bots: batched {batched * 1000:.2f} ms, "
+                  f"one call per bot {single * 1000:.2f} ms")
+
+            time.sleep(0.5)
+            metrics = clients[1].metrics()
+            print(f"node 1 metrics: {len(metrics['bots'])} bots, {metrics['rss_mb']} MB RSS")
+
+            # Lifecycle event stream
+            victim = clients[2].status([2000])[0]
+            os.kill(victim['pid'], signal.SIGKILL)
+            start = time.perf_counter()
+            got = exited.wait(10)
+            exit_events = [e for _, e in events if e['event'] == 'exited']
+            print(f"exited event {'received' if got else 'MISSING'} after {(time.perf_counter() - start) * 1000:.0f} ms: "
+                  f"{exit_events[-1] if exit_events else None}")
+
+            # Rebalance a skewed placement across the agents
+            db_name = str(root / 'sim.db')
+            conn = sqlite3.connect(db_name)
+            init_schema(conn)
+            for node_id in clients:
+                conn.execute("INSERT INTO nodes (id, name, status, capacity) VALUES (?, ?, 'active', 100)",
+                             (node_id, f"Node-{node_id}"))
+            for node_id, client in clients.items():
+                running = [s for s in client.status() if s['running']]
+                # Pretend node 1's bots are heavier
+                for s in running:
+                    conn.execute('''INSERT INTO deployments (id, user_id, filename, pid, status, node_id, ram_usage)
+                                    VALUES (?, 1, 'bot.py', ?, 'Running', ?, ?)''',
+                                 (s['bot_id'], s['pid'], node_id, 60 if node_id == 1 else 20))
+            conn.commit()
+
+            def spec_for(bot_id):
+                return {'bot_id': bot_id, 'script': str(script)}
+
+            agents = {node_id: RemoteNodeAgent(node_id, client, spec_for) for node_id, client in clients.items()}
+            rebalancer = Rebalancer(db_name, threading.RLock(), agents, max_concurrent=4,
+                                    skew_threshold=0.15, max_moves=50)
+            start = time.perf_counter()
+            result = rebalancer.run()
+            print(f"rebalance: {len(result['succeeded'])}/{len(result['planned'])} moves in "
+                  f"{time.perf_counter() - start:.2f}s, counters corrected on {len(result['drift'])} nodes")
+
+            problems = 0
+            for bot_id, node_id, pid in conn.execute("SELECT id, node_id, pid FROM deployments WHERE status='Running'"):
+                where = [n for n, c in clients.items() if c.status([bot_id])[0]['running']]
+                if where != [node_id]:
+                    problems += 1
+            for node_id, load, count in conn.execute('''SELECT n.id, n.current_load, COUNT(d.id) FROM nodes n
+                                                        LEFT JOIN deployments d ON d.node_id=n.id AND d.status='Running'
+                                                        GROUP BY n.id'''):
+                print(f"  node {node_id}: {count} bots (counter {load})")
+                problems += load != count
+            print(f"consistency check: {'OK' if not problems else f'{problems} problems'}")
+            conn.close()
+
+            # Batched stop
+            start = time.perf_counter()
+            for client in clients.values():
+                client.stop([s['bot_id'] for s in client.status()], timeout=5)
+            print(f"stopped all bots in {time.perf_counter() - start:.2f}s")
+        finally:
+            for client in clients.values():
+                client.close()
+            for process in processes.values():
+                process.terminate()
+            for process in processes.values():
+                process.wait(10)
+
+
+if __name__ == '__main__':
+    main()
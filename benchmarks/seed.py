@@ -0,0 +1,206 @@
+"""Seed a cyber_v2.db-compatible database at a chosen scale.
+
+Creates users (a share of them prime), nodes, deployments across the
+non-running statuses, their side tables, bot log lines, backups,
+notifications and unused keys, in one transaction. No deployment is marked Running: there
+are no processes behind seeded bots, and reattach_bots() would try to
+restart them if the bot were started on this file.
+
+    python benchmarks/seed.py bench.db --scale large
+    python benchmarks/seed.py bench.db --users 10000 --bots 900 --project-dir projects
+    python benchmarks/seed.py bench.db --rows 1m
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schema import init_schema  # noqa: E402
+
+# (users, bots)
+SCALES = {
+    'small': (1000, 90),
+    'medium': (5000, 450),
+    'large': (10000, 900),
+    'xlarge': (100000, 9000),
+}
+
+# Row counts for users, deployments, bot_backups and notifications alike
+ROW_SCALES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+
+# Seeded ids start here, clear of real Telegram admin ids in tests
+FIRST_USER_ID = 1000000
+
+STATUSES = [('Stopped', 0.55), ('Uploaded', 0.2), ('Crashed', 0.1), ('Hibernated', 0.1), ('Banned', 0.05)]
+
+BOT_SOURCE = '''import time
+
+BOT_TOKEN = "{token}"
+BOT_USERNAME = "@{username}"
+
+while True:
+    time.sleep(60)
+'''
+
+FMT = '%Y-%m-%d %H:%M:%S'
+
+
+class _Stamps:
+    """Random past timestamps from a pre-formatted pool per window; strftime dominated seeding"""
+
+    def __init__(self, now, rng, size=4096):
+        self.now = now
+        self.rng = rng
+        self.size = size
+        self.pools = {}
+
+    def __call__(self, days):
+        pool = self.pools.get(days)
+        if pool is None:
+            pool = self.pools[days] = [(self.now - timedelta(seconds=self.rng.randint(0, days * 86400))).strftime(FMT)
+                                       for _ in range(self.size)]
+        return pool[int(self.rng.random() * self.size)]
+
+
+def _fake_token(rng):
+    return f"{rng.randint(10 ** 9, 10 ** 10 - 1)}:{rng.getrandbits(140):035x}"
+
+
+def seed(conn, users, bots, nodes=3, logs_per_bot=20, notifications=None, backups=None, log_lines=50,
+         keys=200, rng=None, admin_id=None):
+    """Fill a database; returns row counts per table.
+
+    ``notifications`` defaults to three per user and ``backups`` to one
+    per two bots.
+    """
+    rng = rng or random.Random(1)
+    notifications = users * 3 if notifications is None else notifications
+    backups = bots // 2 if backups is None else backups
+    now = datetime.now()
+    stamp = _Stamps(now, rng)
+    init_schema(conn)
+    conn.commit()
+    conn.execute("BEGIN")
+
+    user_ids = list(range(FIRST_USER_ID, FIRST_USER_ID + users))
+    prime = set(rng.sample(user_ids, users // 5))
+    if admin_id is not None:
+        conn.execute("INSERT OR IGNORE INTO users VALUES (?, 'admin', ?, 100, 1, ?, ?, 0, 0, ?, 'admin')",
+                     (admin_id, (now + timedelta(days=3650)).strftime(FMT), now.strftime(FMT),
+                      now.strftime(FMT), now.strftime(FMT)))
+    conn.executemany(
+        "INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?, 0, 0, ?, ?)",
+        ((uid, f"user{uid}",
+          (now + timedelta(days=rng.randint(-30, 90))).strftime(FMT) if uid in prime else None,
+          10 if uid in prime else 1, int(uid in prime), stamp(365),
+          stamp(30) if uid in prime else None, stamp(30), f"user{uid}")
+         for uid in user_ids))
+
+    capacity = max(bots * 3 // (2 * nodes), 10)
+    conn.executemany("INSERT INTO nodes (id, name, status, capacity, last_check, region) VALUES (?, ?, 'active', ?, ?, 'Global')",
+                     ((n, f"Node-{n}", capacity, now.strftime(FMT)) for n in range(1, nodes + 1)))
+
+    # Bots mostly belong to prime users, a few users own several
+    owners = list(prime) or user_ids
+    names, weights = zip(*STATUSES)
+    deployments = []
+    for bot_id in range(1, bots + 1):
+        owner = rng.choice(owners)
+        status = rng.choices(names, weights)[0]
+        created = stamp(180)
+        username = f"seed{bot_id}_bot"
+        deployments.append((bot_id, owner, f"Seed Bot {bot_id}", f"seed_bot_{bot_id}.py", 0, None, status,
+                            0.0, 0.0, created, rng.randint(1, nodes), rng.randint(0, 5), 1, created, created,
+                            username, int(status == 'Banned'), _fake_token(rng), 0, None))
+    conn.executemany(f"INSERT INTO deployments VALUES ({', '.join('?' * 20)})", deployments)
+    conn.executemany("INSERT INTO deployment_deps VALUES (?, ?, ?, ?)",
+                     ((d[0], json.dumps([]), json.dumps(['time']), d[13])
+                      for d in deployments))
+    if log_lines:
+        conn.executemany("INSERT INTO deployment_logs VALUES (?, ?, ?)",
+                         ((d[0], '\n'.join(f"[{d[13]}] seed log line {i}" for i in range(log_lines)), d[14])
+                          for d in deployments))
+    conn.executemany("INSERT INTO hibernation VALUES (?, ?, NULL, ?)",
+                     ((d[0], d[14], rng.uniform(20, 80)) for d in deployments if d[6] == 'Hibernated'))
+    conn.executemany("INSERT INTO bot_logs (bot_id, timestamp, log_type, message) VALUES (?, ?, ?, ?)",
+                     ((d[0], stamp(30), rng.choice(('info', 'info', 'warning', 'error')),
+                       f"Seeded event {i} for bot {d[0]}")
+                      for d in deployments for i in range(logs_per_bot)))
+    conn.execute('''UPDATE users SET total_bots_deployed =
+                        (SELECT COUNT(*) FROM deployments WHERE deployments.user_id = users.id)''')
+
+    if bots:
+        conn.executemany("INSERT INTO bot_backups (bot_id, backup_name, backup_path, created_at, size_kb) VALUES (?, ?, ?, ?, ?)",
+                         ((bot_id, f"backup_{bot_id}_{n}.zip", f"backups/backup_{bot_id}_{n}.zip",
+                           stamp(90), rng.uniform(2, 500))
+                          for n, bot_id in enumerate((rng.randint(1, bots) for _ in range(backups)), 1)))
+
+    rows = []
+    unread = {}
+    for _ in range(notifications):
+        uid = rng.choice(user_ids)
+        is_read = rng.random() < 0.7
+        rows.append((uid, "Seeded notification", int(is_read), stamp(60)))
+        if not is_read:
+            unread[uid] = unread.get(uid, 0) + 1
+    conn.executemany("INSERT INTO notifications (user_id, message, is_read, created_at) VALUES (?, ?, ?, ?)", rows)
+    conn.executemany("INSERT INTO notification_counters VALUES (?, ?)", unread.items())
+
+    conn.executemany("INSERT INTO keys VALUES (?, ?, 10, ?, NULL, NULL, 0)",
+                     ((f"ZENX-SEED-{i:06d}", rng.choice((7, 30, 90)), stamp(30)) for i in range(keys)))
+    conn.commit()
+
+    return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ('users', 'nodes', 'deployments', 'bot_logs', 'bot_backups', 'notifications', 'keys')}
+
+
+def write_bot_files(conn, project_dir):
+    """Write a small script for every seeded deployment, as an upload would"""
+    os.makedirs(project_dir, exist_ok=True)
+    for filename, token, username in conn.execute("SELECT filename, token, bot_username FROM deployments"):
+        with open(os.path.join(project_dir, filename), 'w') as f:
+            f.write(BOT_SOURCE.format(token=token, username=username))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', nargs='?', default='cyber_v2.db')
+    parser.add_argument('--scale', choices=SCALES, default='large')
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--bots', type=int)
+    parser.add_argument('--rows', choices=ROW_SCALES,
+                        help='same row count in users, deployments, bot_backups and notifications')
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--logs-per-bot', type=int, default=20)
+    parser.add_argument('--project-dir', help='also write a script per bot here')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--force', action='store_true', help='replace an existing database file')
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        if not args.force:
+            parser.error(f"{args.path} exists; pass --force to replace it")
+        os.unlink(args.path)
+
+    conn = sqlite3.connect(args.path, isolation_level=None)
+    if args.rows:
+        rows = ROW_SCALES[args.rows]
+        counts = seed(conn, rows, rows, args.nodes, 0, notifications=rows, backups=rows, log_lines=0,
+                      rng=random.Random(args.seed))
+    else:
+        users, bots = SCALES[args.scale]
+        counts = seed(conn, args.users or users, args.bots or bots, args.nodes, args.logs_per_bot,
+                      rng=random.Random(args.seed))
+    if args.project_dir:
+        write_bot_files(conn, args.project_dir)
+    conn.close()
+    print(f"seeded {args.path}: " + ', '.join(f"{count} {table}" for table, count in counts.items()))
+
+
+if __name__ == '__main__':
+    main()
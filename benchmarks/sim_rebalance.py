@@ -0,0 +1,139 @@
+"""Simulate node rebalancing with several local node agents.
+
+Each simulated node owns its own BotSupervisor and runs real (sleeping)
+bot processes on this machine. Bots start skewed onto one node with
+drifted load counters; the rebalancer reconciles, plans and migrates,
+optionally with injected start failures to exercise rollback. Finally
+the database is checked against what each node really runs.
+
+    python benchmarks/sim_rebalance.py [--bots 40] [--nodes 3] [--fail-rate 0.1]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rebalancer import NodeAgent, Rebalancer  # noqa: E402
+from schema import init_schema  # noqa: E402
+from supervisor import BotSupervisor  # noqa: E402
+
+BOT_SCRIPT = "import time\nprint('ready', flush=True)\ntime.sleep(600)\n"
+
+
+class SimulatedNodeAgent(NodeAgent):
+    """A node with its own supervisor, optionally failing some starts"""
+
+    def __init__(self, node_id, root, script, fail_rate=0.0, latency=0.05):
+        super().__init__(node_id)
+        self.supervisor = BotSupervisor({'free': {}}, root / f"node_{node_id}")
+        self.script = script
+        self.fail_rate = fail_rate
+        self.latency = latency
+
+    def start(self, bot_id):
+        time.sleep(self.latency)
+        if random.random() < self.fail_rate:
+            raise RuntimeError(f"node {self.node_id} refused bot {bot_id}")
+        managed = self.supervisor.launch(bot_id, self.script)
+        return managed.pid, managed.start_ticks
+
+    def stop(self, bot_id):
+        time.sleep(self.latency)
+        return self.supervisor.stop(bot_id, timeout=5) if bot_id in self.supervisor.bots else True
+
+
+def pressures(conn):
+    rows = conn.execute('''SELECT n.id, n.capacity, n.current_load, COUNT(d.id), COALESCE(SUM(d.ram_usage), 0)
+                           FROM nodes n LEFT JOIN deployments d ON d.node_id = n.id AND d.status = 'Running'
+                           GROUP BY n.id ORDER BY n.id''').fetchall()
+    return rows
+
+
+def show(title, conn):
+    print(title)
+    print(f"  {'node':>4} {'stored':>7} {'bots':>5} {'RSS MB':>8} {'MB/slot':>8}")
+    for node_id, capacity, stored, count, ram in pressures(conn):
+        print(f"  {node_id:>4} {stored:>7} {count:>5} {ram:>8.0f} {ram / capacity:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bots', type=int, default=40)
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--capacity', type=int, default=50)
+    parser.add_argument('--fail-rate', type=float, default=0.1)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        script = root / 'bot.py'
+        script.write_text(BOT_SCRIPT)
+        db_name = str(root / 'sim.db')
+        lock = threading.RLock()
+
+        conn = sqlite3.connect(db_name)
+        init_schema(conn)
+        for node_id in range(1, args.nodes + 1):
+            # Stored counters deliberately wrong, as after crashes and bans
+            conn.execute("INSERT INTO nodes (id, name, status, capacity, current_load) VALUES (?, ?, 'active', ?, ?)",
+                         (node_id, f"Node-{node_id}", args.capacity, random.randint(0, 10)))
+
+        agents = {node_id: SimulatedNodeAgent(node_id, root, script, args.fail_rate)
+                  for node_id in range(1, args.nodes + 1)}
+        for bot_id in range(1, args.bots + 1):
+            # 80% of bots start on node 1
+            node_id = 1 if random.random() < 0.8 else random.randint(2, args.nodes)
+            pid = agents[node_id].supervisor.launch(bot_id, script).pid
+            conn.execute('''INSERT INTO deployments (id, user_id, bot_name, filename, pid, status, node_id, ram_usage)
+                            VALUES (?, 1, ?, 'bot.py', ?, 'Running', ?, ?)''',
+                         (bot_id, f"bot{bot_id}", pid, node_id, random.uniform(20, 60)))
+        conn.commit()
+
+        show("before", conn)
+        for agent in agents.values():
+            agent.fail_rate = args.fail_rate
+
+        rebalancer = Rebalancer(db_name, lock, agents, max_concurrent=args.concurrency,
+                                skew_threshold=0.15, max_moves=args.bots)
+        start = time.perf_counter()
+        result = rebalancer.run()
+        elapsed = time.perf_counter() - start
+
+        print(f"\ncorrected {len(result['drift'])} node counters, planned {len(result['planned'])} moves, "
+              f"{len(result['succeeded'])} succeeded, {len(result['failed'])} rolled back in {elapsed:.2f}s "
+              f"(concurrency {args.concurrency})")
+        for move in result['failed']:
+            print(f"  {move}: {move.error}")
+        show("\nafter", conn)
+
+        # Every Running deployment must be running on exactly the node the DB says
+        problems = 0
+        for bot_id, node_id, pid in conn.execute("SELECT id, node_id, pid FROM deployments WHERE status='Running'"):
+            owners = [n for n, agent in agents.items() if agent.supervisor.is_running(bot_id)]
+            if owners != [node_id] or agents[node_id].supervisor.bots[bot_id].pid != pid:
+                problems += 1
+                print(f"  inconsistent: bot {bot_id} db node {node_id} pid {pid}, running on {owners}")
+        for node_id, _, stored, count, _ in pressures(conn):
+            if stored != count:
+                problems += 1
+                print(f"  node {node_id} counter {stored} != {count} running")
+        print(f"\nconsistency check: {'OK' if not problems else f'{problems} problems'}")
+
+        for agent in agents.values():
+            for bot_id in list(agent.supervisor.bots):
+                agent.supervisor.stop(bot_id, timeout=5)
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
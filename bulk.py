@@ -0,0 +1,388 @@
+"""Bulk admin operations over many deployments.
+
+Targets are chosen by explicit ids, by owner or by node. Processes are
+stopped with one concurrent signal round per node (a single batched call
+for agent nodes), node groups and launches run in parallel, and every
+database change of an operation is applied in one transaction. Results
+are aggregated per bot.
+
+Requests from the web API are queued in the bulk_jobs table and executed
+by the control plane, which owns the bot processes.
+"""
+import json
+import sqlite3
+import time
+import logging
+from collections import Counter
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from dal import Deployment, DEPLOYMENT_VIEWS, projection
+
+logger = logging.getLogger(__name__)
+
+ACTIONS = ('stop', 'restart', 'ban', 'unban', 'delete', 'backup')
+
+# Actions that need the bot's process gone before the database changes
+STOPPING = ('stop', 'restart', 'ban', 'delete')
+
+
+class BulkError(Exception):
+    pass
+
+
+def normalize_selector(data):
+    """Validate a selector dict: exactly one of bot_ids, user_id or node_id"""
+    if not isinstance(data, dict):
+        raise BulkError("selector must be an object")
+    keys = [key for key in ('bot_ids', 'user_id', 'node_id') if data.get(key) not in (None, [], '')]
+    if len(keys) != 1:
+        raise BulkError("select bots with exactly one of bot_ids, user_id or node_id")
+    key = keys[0]
+    try:
+        if key == 'bot_ids':
+            if not isinstance(data['bot_ids'], (list, tuple)):
+                raise BulkError("bot_ids must be a list")
+            bot_ids = sorted({int(bot_id) for bot_id in data['bot_ids']})
+            if len(bot_ids) > 1000:
+                raise BulkError("at most 1000 bot ids per request")
+            return {'bot_ids': bot_ids}
+        return {key: int(data[key])}
+    except (TypeError, ValueError):
+        raise BulkError(f"{key} must be numeric")
+
+
+def parse_selector(text):
+    """Parse 'user:<id>', 'node:<id>' or a comma separated list of bot ids"""
+    text = (text or '').strip()
+    kind, sep, value = text.partition(':')
+    if sep and kind in ('user', 'node'):
+        return normalize_selector({f"{kind}_id": value.strip()})
+    return normalize_selector({'bot_ids': [part for part in text.replace(' ', ',').split(',') if part]})
+
+
+def describe_selector(selector):
+    if 'user_id' in selector:
+        return f"user {selector['user_id']}"
+    if 'node_id' in selector:
+        return f"node {selector['node_id']}"
+    return f"{len(selector['bot_ids'])} selected bots"
+
+
+def select_targets(conn, selector):
+    """Deployments matched by a selector, as 'bulk' view records"""
+    columns = projection(DEPLOYMENT_VIEWS, 'bulk')
+    if 'user_id' in selector:
+        cursor = conn.execute(f"SELECT {columns} FROM deployments WHERE user_id=? ORDER BY id",
+                              (selector['user_id'],))
+    elif 'node_id' in selector:
+        cursor = conn.execute(f"SELECT {columns} FROM deployments WHERE node_id=? ORDER BY id",
+                              (selector['node_id'],))
+    else:
+        bot_ids = selector['bot_ids']
+        placeholders = ','.join('?' * len(bot_ids))
+        cursor = conn.execute(f"SELECT {columns} FROM deployments WHERE id IN ({placeholders}) ORDER BY id",
+                              bot_ids)
+    names = [d[0] for d in cursor.description]
+    return [Deployment.from_row(names, row) for row in cursor.fetchall()]
+
+
+class BulkResult:
+    """Aggregated outcome of one bulk operation"""
+
+    __slots__ = ('action', 'selector', 'targets', 'succeeded', 'failed', 'skipped', 'elapsed')
+
+    def __init__(self, action, selector):
+        self.action = action
+        self.selector = selector
+        self.targets = {}
+        self.succeeded = []
+        self.failed = {}
+        self.skipped = {}
+        self.elapsed = 0.0
+
+    def fail(self, bot_id, error):
+        self.failed[bot_id] = str(error)
+
+    def to_dict(self):
+        return {
+            'action': self.action,
+            'selector': self.selector,
+            'targets': len(self.targets),
+            'succeeded': self.succeeded,
+            'failed': {str(bot_id): error for bot_id, error in self.failed.items()},
+            'skipped': {str(bot_id): reason for bot_id, reason in self.skipped.items()},
+            'elapsed': round(self.elapsed, 3),
+        }
+
+
+class BulkOperations:
+    """Runs bulk actions with injected process and archive hooks.
+
+    ``stop_group(node_id, bot_ids)`` stops bots on one node and returns
+    {bot_id: stopped}; ``launch(bot_info, node_id)`` starts a bot on the
+    node assigned to it and returns (pid, start_ticks, node_id), raising
+    on failure; ``archive(bot_info)``
+    writes a backup and returns (backup_name, backup_path, size_kb).
+    """
+
+    def __init__(self, db_name, lock, stop_group, launch=None, archive=None, max_workers=8):
+        self.db_name = db_name
+        self.lock = lock
+        self.stop_group = stop_group
+        self.launch = launch
+        self.archive = archive
+        self.max_workers = max_workers
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def targets(self, selector):
+        with self.lock:
+            conn = self._connect()
+            try:
+                return select_targets(conn, selector)
+            finally:
+                conn.close()
+
+    def run(self, action, selector):
+        """Execute ``action`` on every deployment matched by ``selector``"""
+        if action not in ACTIONS:
+            raise BulkError(f"unknown action {action!r}")
+        selector = normalize_selector(selector)
+        started = time.perf_counter()
+        result = BulkResult(action, selector)
+        targets = self.targets(selector)
+        result.targets = {t.id: t for t in targets}
+        if 'bot_ids' in selector:
+            for bot_id in set(selector['bot_ids']) - set(result.targets):
+                result.skipped[bot_id] = 'not found'
+
+        if action == 'unban':
+            targets = self._skip(result, targets, lambda t: t.is_banned != 1, 'not banned')
+        elif action == 'ban':
+            targets = self._skip(result, targets, lambda t: t.is_banned == 1, 'already banned')
+        elif action == 'restart':
+            targets = self._skip(result, targets, lambda t: t.is_banned == 1, 'banned')
+        elif action == 'stop':
+            targets = self._skip(result, targets, lambda t: t.status != 'Running', 'not running')
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            stopped = self._stop(pool, result, targets) if action in STOPPING else {t.id: True for t in targets}
+            launched = self._launch(pool, result, targets, stopped) if action == 'restart' else {}
+            archives = self._archive(pool, result, targets) if action == 'backup' else {}
+
+        try:
+            self._apply(action, result, targets, stopped, launched, archives)
+        except sqlite3.Error as e:
+            logger.error(f"Bulk {action} transaction failed: {e}")
+            for t in targets:
+                if t.id not in result.failed:
+                    result.fail(t.id, f"database update failed: {e}")
+            result.succeeded = []
+        result.elapsed = time.perf_counter() - started
+        logger.info(f"Bulk {action} on {describe_selector(selector)}: {len(result.succeeded)} ok, "
+                    f"{len(result.failed)} failed, {len(result.skipped)} skipped in {result.elapsed:.2f}s")
+        return result
+
+    def _skip(self, result, targets, predicate, reason):
+        kept = []
+        for t in targets:
+            if predicate(t):
+                result.skipped[t.id] = reason
+            else:
+                kept.append(t)
+        return kept
+
+    def _stop(self, pool, result, targets):
+        """Stop every target, one concurrent group per node; {bot_id: stopped}"""
+        groups = {}
+        stopped = {}
+        for t in targets:
+            if t.status == 'Running' or t.pid:
+                groups.setdefault(t.node_id, []).append(t.id)
+            else:
+                stopped[t.id] = True
+
+        futures = {pool.submit(self.stop_group, node_id, bot_ids): (node_id, bot_ids)
+                   for node_id, bot_ids in groups.items()}
+        for future, (node_id, bot_ids) in futures.items():
+            try:
+                outcome = future.result()
+            except Exception as e:
+                outcome = {}
+                for bot_id in bot_ids:
+                    result.fail(bot_id, f"node {node_id}: {e}")
+            for bot_id in bot_ids:
+                stopped[bot_id] = bool(outcome.get(bot_id))
+                if bot_id in outcome and not outcome[bot_id]:
+                    result.fail(bot_id, "process did not stop")
+        return stopped
+
+    def _place(self, targets):
+        """{bot_id: node_id}: bots keep their node, the rest go to the least loaded
+        active node with room, counting each bot as it is placed"""
+        with self.lock:
+            conn = self._connect()
+            try:
+                nodes = conn.execute("SELECT id, current_load, capacity FROM nodes WHERE status='active'").fetchall()
+            finally:
+                conn.close()
+        load = {node_id: current_load or 0 for node_id, current_load, _ in nodes}
+        capacity = {node_id: capacity or 0 for node_id, _, capacity in nodes}
+        placement = {}
+        for t in targets:
+            if t.node_id:
+                placement[t.id] = t.node_id
+                continue
+            free = [node_id for node_id in load if load[node_id] < capacity[node_id]]
+            node_id = min(free, key=lambda n: (load[n], n)) if free else None
+            if node_id is not None:
+                load[node_id] += 1
+            placement[t.id] = node_id
+        return placement
+
+    def _launch(self, pool, result, targets, stopped):
+        targets = [t for t in targets if stopped.get(t.id)]
+        # Parallel launches would all see the same least-loaded node otherwise
+        placement = self._place(targets)
+        futures = {t.id: pool.submit(self.launch, t, placement[t.id]) for t in targets}
+        launched = {}
+        for bot_id, future in futures.items():
+            try:
+                launched[bot_id] = future.result()
+            except Exception as e:
+                result.fail(bot_id, f"start failed: {e}")
+        return launched
+
+    def _archive(self, pool, result, targets):
+        futures = {t.id: pool.submit(self.archive, t) for t in targets}
+        archives = {}
+        for bot_id, future in futures.items():
+            try:
+                archives[bot_id] = future.result()
+            except Exception as e:
+                result.fail(bot_id, f"backup failed: {e}")
+        return archives
+
+    def _apply(self, action, result, targets, stopped, launched, archives):
+        """All database changes of the operation in one transaction"""
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        loads = Counter()
+        deployed = Counter()
+        succeeded = []
+
+        with self.lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for t in targets:
+                    # A ban sticks even if the process could not be stopped
+                    if action in STOPPING and not stopped.get(t.id) and action != 'ban':
+                        continue
+                    was_running = t.node_id and t.status == 'Running'
+
+                    if action in ('stop', 'ban'):
+                        if action == 'ban':
+                            conn.execute("UPDATE deployments SET status='Banned', is_banned=1, pid=0, updated_at=? WHERE id=?",
+                                         (now, t.id))
+                            conn.execute("DELETE FROM hibernation WHERE deployment_id=?", (t.id,))
+                        else:
+                            conn.execute("UPDATE deployments SET status='Stopped', pid=0, updated_at=? WHERE id=?",
+                                         (now, t.id))
+                        if was_running:
+                            loads[t.node_id] -= 1
+                    elif action == 'restart':
+                        if was_running:
+                            loads[t.node_id] -= 1
+                        if t.id not in launched:
+                            conn.execute("UPDATE deployments SET status='Stopped', pid=0, updated_at=? WHERE id=?",
+                                         (now, t.id))
+                            continue
+                        pid, start_ticks, node_id = launched[t.id]
+                        conn.execute("DELETE FROM hibernation WHERE deployment_id=?", (t.id,))
+                        conn.execute('''UPDATE deployments SET pid=?, pid_start_ticks=?, start_time=?, status='Running',
+                                        node_id=?, last_active=?, updated_at=? WHERE id=?''',
+                                     (pid, start_ticks, now, node_id, now, now, t.id))
+                        if node_id:
+                            loads[node_id] += 1
+                            deployed[node_id] += 1
+                    elif action == 'unban':
+                        conn.execute("UPDATE deployments SET status='Stopped', is_banned=0, updated_at=? WHERE id=?",
+                                     (now, t.id))
+                    elif action == 'delete':
+                        conn.execute("DELETE FROM deployments WHERE id=?", (t.id,))
+                        if was_running:
+                            loads[t.node_id] -= 1
+                    elif action == 'backup':
+                        if t.id not in archives:
+                            continue
+                        name, path, size_kb = archives[t.id]
+                        conn.execute("INSERT INTO bot_backups (bot_id, backup_name, backup_path, created_at, size_kb) VALUES (?, ?, ?, ?, ?)",
+                                     (t.id, name, str(path), now, size_kb))
+                    if t.id not in result.failed:
+                        succeeded.append(t.id)
+
+                conn.executemany("UPDATE nodes SET current_load=current_load+?, total_deployed=total_deployed+? WHERE id=?",
+                                 [(loads[node_id], deployed[node_id], node_id)
+                                  for node_id in set(loads) | set(deployed)
+                                  if loads[node_id] or deployed[node_id]])
+                if action == 'delete':
+                    conn.executemany('''UPDATE users SET total_bots_deployed=
+                                        (SELECT COUNT(*) FROM deployments WHERE user_id=users.id) WHERE id=?''',
+                                     [(user_id,) for user_id in {t.user_id for t in targets}])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+        result.succeeded = succeeded
+
+
+def enqueue_job(conn, action, selector, requested_by=None):
+    """Queue a bulk operation for the control plane; returns the job id"""
+    if action not in ACTIONS:
+        raise BulkError(f"unknown action {action!r}")
+    selector = normalize_selector(selector)
+    cursor = conn.execute('''INSERT INTO bulk_jobs (action, selector, status, requested_by, created_at)
+                             VALUES (?, ?, 'pending', ?, ?)''',
+                          (action, json.dumps(selector), requested_by,
+                           datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def claim_jobs(conn, limit=5):
+    """Mark up to ``limit`` pending jobs as running and return them"""
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute("SELECT id, action, selector FROM bulk_jobs WHERE status='pending' ORDER BY id LIMIT ?",
+                            (limit,)).fetchall()
+        conn.executemany("UPDATE bulk_jobs SET status='running', started_at=? WHERE id=?",
+                         [(now, job_id) for job_id, _, _ in rows])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return [(job_id, action, json.loads(selector)) for job_id, action, selector in rows]
+
+
+def finish_job(conn, job_id, result=None, error=None):
+    conn.execute("UPDATE bulk_jobs SET status=?, finished_at=?, result=? WHERE id=?",
+                 ('failed' if error else 'done', datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                  json.dumps({'error': error} if error else result.to_dict()), job_id))
+    conn.commit()
+
+
+def fail_interrupted_jobs(conn):
+    """Jobs left running by a previous control-plane process will not finish"""
+    cursor = conn.execute('''UPDATE bulk_jobs SET status='failed', finished_at=?, result=?
+                             WHERE status='running' ''',
+                          (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                           json.dumps({'error': 'interrupted by a control-plane restart'})))
+    conn.commit()
+    return cursor.rowcount
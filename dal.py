@@ -0,0 +1,254 @@
+import json
+import sqlite3
+import logging
+from typing import Optional
+
+from lockprof import tag
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class Record:
+    """Lightweight row object backed by __slots__.
+
+    Fields that were not part of the projection are None. Item access and
+    ``get`` are kept so handlers written against sqlite3.Row keep working.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, columns, row):
+        obj = cls.__new__(cls)
+        for name in cls.__slots__:
+            object.__setattr__(obj, name, None)
+        for name, value in zip(columns, row):
+            object.__setattr__(obj, name, value)
+        return obj
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+    def keys(self):
+        return list(self.__slots__)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__
+                           if getattr(self, name) is not None)
+        return f"{self.__class__.__name__}({fields})"
+
+
+class Deployment(Record):
+    """A row of the deployments table (without the logs/metadata blobs)"""
+
+    __slots__ = ('id', 'user_id', 'bot_name', 'filename', 'pid', 'start_time', 'status',
+                 'cpu_usage', 'ram_usage', 'last_active', 'node_id', 'restart_count',
+                 'auto_restart', 'created_at', 'updated_at', 'bot_username', 'is_banned',
+                 'token', 'hang_restart_count', 'pid_start_ticks', 'user_username')
+
+    id: int
+    user_id: int
+    bot_name: str
+    filename: str
+    pid: Optional[int]
+    start_time: Optional[str]
+    status: str
+    cpu_usage: Optional[float]
+    ram_usage: Optional[float]
+    last_active: Optional[str]
+    node_id: Optional[int]
+    restart_count: int
+    auto_restart: int
+    created_at: str
+    updated_at: str
+    bot_username: Optional[str]
+    is_banned: int
+    token: Optional[str]
+    hang_restart_count: int
+    pid_start_ticks: Optional[int]
+    user_username: Optional[str]
+
+
+class User(Record):
+    """A row of the users table"""
+
+    __slots__ = ('id', 'username', 'expiry', 'file_limit', 'is_prime', 'join_date',
+                 'last_renewal', 'total_bots_deployed', 'total_deployments',
+                 'last_active', 'bot_username')
+
+    id: int
+    username: Optional[str]
+    expiry: Optional[str]
+    file_limit: int
+    is_prime: int
+    join_date: str
+    last_renewal: Optional[str]
+    total_bots_deployed: int
+    total_deployments: int
+    last_active: Optional[str]
+    bot_username: Optional[str]
+
+
+class Node(Record):
+    """A row of the nodes table"""
+
+    __slots__ = ('id', 'name', 'status', 'capacity', 'current_load', 'last_check',
+                 'region', 'total_deployed')
+
+    id: int
+    name: str
+    status: str
+    capacity: int
+    current_load: int
+    last_check: Optional[str]
+    region: Optional[str]
+    total_deployed: int
+
+
+# Column projections per handler view. Only what the view reads is fetched.
+DEPLOYMENT_VIEWS = {
+    'list': ('id', 'bot_name', 'filename', 'pid', 'start_time', 'status', 'node_id',
+             'restart_count', 'hang_restart_count', 'auto_restart', 'created_at', 'bot_username',
+             'is_banned'),
+    'admin_list': ('id', 'user_id', 'bot_name', 'status', 'bot_username', 'is_banned'),
+    'backup': ('id', 'user_id', 'bot_name', 'filename'),
+    'export': ('id', 'bot_username', 'status', 'token'),
+    'bundle': ('id', 'bot_name', 'filename', 'bot_username', 'status', 'token'),
+    'control': ('id', 'user_id', 'pid', 'node_id', 'status'),
+    'reattach': ('id', 'user_id', 'filename', 'pid', 'pid_start_ticks', 'node_id', 'status'),
+    'bulk': ('id', 'user_id', 'bot_name', 'filename', 'pid', 'node_id', 'status', 'is_banned'),
+    'hibernate': ('id', 'user_id', 'bot_name', 'status', 'last_active', 'node_id'),
+    'launch': ('id', 'user_id', 'filename', 'node_id', 'status', 'auto_restart', 'is_banned'),
+    'info': ('id', 'bot_name', 'filename', 'status', 'bot_username', 'token', 'created_at',
+             'restart_count', 'hang_restart_count', 'auto_restart'),
+    'detail': ('id', 'user_id', 'bot_name', 'filename', 'pid', 'start_time', 'status',
+               'cpu_usage', 'ram_usage', 'last_active', 'node_id', 'restart_count',
+               'hang_restart_count', 'auto_restart', 'created_at', 'updated_at', 'bot_username',
+               'is_banned'),
+}
+
+USER_VIEWS = {
+    'profile': ('id', 'username', 'expiry', 'file_limit', 'is_prime', 'join_date',
+                'total_bots_deployed', 'total_deployments'),
+    'expiry': ('id', 'expiry'),
+}
+
+NODE_VIEWS = {
+    'summary': ('id', 'name', 'region'),
+    'load': ('id', 'name', 'status', 'capacity', 'current_load'),
+}
+
+
+def projection(views, view, alias=None):
+    """Build the SELECT column list for a view"""
+    columns = views[view]
+    if alias:
+        return ', '.join(f"{alias}.{name}" for name in columns)
+    return ', '.join(columns)
+
+
+class DataAccess:
+    """Projected queries returning slotted records instead of sqlite3.Row"""
+
+    def __init__(self, db_name, lock):
+        self.db_name = db_name
+        self.lock = lock
+
+    def _query(self, query, params=(), one=False):
+        with span('db', 'dal'):
+            return self._locked_query(query, params, one)
+
+    def _locked_query(self, query, params, one):
+        tag(self.lock, query)
+        with self.lock:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False)
+            try:
+                c = conn.execute(query, params)
+                columns = [d[0] for d in c.description]
+                rows = c.fetchone() if one else c.fetchall()
+                return columns, rows
+            except Exception as e:
+                logger.error(f"Database error: {e}")
+                return None, None
+            finally:
+                conn.close()
+
+    def _one(self, cls, query, params=()):
+        columns, row = self._query(query, params, one=True)
+        if not row:
+            return None
+        return cls.from_row(columns, row)
+
+    def _many(self, cls, query, params=()):
+        columns, rows = self._query(query, params)
+        if not rows:
+            return []
+        return [cls.from_row(columns, row) for row in rows]
+
+    def deployment(self, bot_id, view='detail'):
+        return self._one(Deployment,
+                         f"SELECT {projection(DEPLOYMENT_VIEWS, view)} FROM deployments WHERE id=?",
+                         (bot_id,))
+
+    def user_deployments(self, user_id, view='list'):
+        return self._many(Deployment,
+                          f"SELECT {projection(DEPLOYMENT_VIEWS, view)} FROM deployments "
+                          f"WHERE user_id=? ORDER BY status DESC, id DESC",
+                          (user_id,))
+
+    def deployment_with_owner(self, bot_id, view='detail', banned_only=False):
+        where = "WHERE d.id=? AND d.is_banned=1" if banned_only else "WHERE d.id=?"
+        return self._one(Deployment,
+                         f"SELECT {projection(DEPLOYMENT_VIEWS, view, 'd')}, u.username AS user_username "
+                         f"FROM deployments d LEFT JOIN users u ON d.user_id = u.id {where}",
+                         (bot_id,))
+
+    def all_deployments(self, view='admin_list', banned_only=False):
+        where = "WHERE d.is_banned = 1 " if banned_only else ""
+        return self._many(Deployment,
+                          f"SELECT {projection(DEPLOYMENT_VIEWS, view, 'd')}, u.username AS user_username "
+                          f"FROM deployments d LEFT JOIN users u ON d.user_id = u.id {where}ORDER BY d.id DESC")
+
+    def load_metadata(self, bot_id):
+        """Fetch the metadata payload of a deployment on demand"""
+        _, row = self._query("SELECT metadata FROM deployment_metadata WHERE deployment_id=?",
+                             (bot_id,), one=True)
+        return row[0] if row else None
+
+    def load_logs(self, bot_id):
+        """Fetch the stored log payload of a deployment on demand"""
+        _, row = self._query("SELECT logs FROM deployment_logs WHERE deployment_id=?",
+                             (bot_id,), one=True)
+        return row[0] if row else None
+
+    def load_requirements(self, bot_id):
+        """Requirements a deployment is installed with: known at upload time or confirmed by its owner"""
+        _, row = self._query("SELECT requirements FROM deployment_deps WHERE deployment_id=?",
+                             (bot_id,), one=True)
+        return json.loads(row[0]) if row and row[0] else []
+
+    def load_imports(self, bot_id):
+        """Third-party imports found in a deployment's script at upload time"""
+        _, row = self._query("SELECT imports FROM deployment_deps WHERE deployment_id=?",
+                             (bot_id,), one=True)
+        return json.loads(row[0]) if row and row[0] else []
+
+    def user(self, user_id, view='profile'):
+        return self._one(User, f"SELECT {projection(USER_VIEWS, view)} FROM users WHERE id=?", (user_id,))
+
+    def node(self, node_id, view='summary'):
+        return self._one(Node, f"SELECT {projection(NODE_VIEWS, view)} FROM nodes WHERE id=?", (node_id,))
+
+    def nodes(self, view='load'):
+        return self._many(Node, f"SELECT {projection(NODE_VIEWS, view)} FROM nodes ORDER BY id")
@@ -0,0 +1,58 @@
+"""Cheap change detection for the SQLite database file.
+
+SQLite increments the file change counter in the database header (four
+big-endian bytes at offset 24) every time a write transaction commits in
+rollback-journal mode, whichever process or connection made it. Reading
+it is a single pread() on a kept-open descriptor, so request handlers can
+tell whether anything changed without opening a connection or running a
+query.
+"""
+import os
+import threading
+
+CHANGE_COUNTER_OFFSET = 24
+
+
+class DataVersion:
+    """Opaque version token for a database file that changes on every commit"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._fd = None
+        self._key = None
+        self._lock = threading.Lock()
+
+    def _descriptor(self, path, inode):
+        with self._lock:
+            if self._key != (path, inode):
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self._fd = os.open(path, os.O_RDONLY)
+                self._key = (path, inode)
+            return self._fd
+
+    def current(self, path=None):
+        """Token for the database as it is now; equal tokens mean no commit in between"""
+        path = str(path or self.path)
+        try:
+            st = os.stat(path)
+            header = os.pread(self._descriptor(path, st.st_ino), 4, CHANGE_COUNTER_OFFSET)
+        except OSError:
+            return 'missing'
+        counter = int.from_bytes(header, 'big') if len(header) == 4 else 0
+        token = f"{st.st_ino:x}.{counter:x}"
+        # In WAL mode commits land in the -wal file; the header only moves on checkpoints
+        try:
+            wal = os.stat(path + '-wal')
+            token += f".{wal.st_mtime_ns:x}.{wal.st_size:x}"
+        except OSError:
+            pass
+        return token
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+            self._fd = None
+            self._key = None
@@ -0,0 +1,293 @@
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import time
+import threading
+import subprocess
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Requirement strings users may submit: a name with optional extras and
+# version specifiers. Anything that could be read as a pip option is refused.
+REQUIREMENT_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._\-]*(\[[A-Za-z0-9._,\-]+\])?([<>=!~]=?[A-Za-z0-9.*+!\-]+,?)*$')
+
+
+class DependencyError(Exception):
+    pass
+
+
+def normalize_name(name):
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def parse_requirements(text):
+    """Split user input (commas, spaces or newlines) into requirement strings"""
+    requirements = []
+    # A comma followed by a name starts a new requirement; one followed by a
+    # specifier (requests>=2,<3) belongs to the current one
+    for item in re.split(r'\s+|,(?=\s*[A-Za-z])', text.strip()):
+        item = item.strip().rstrip(',')
+        if not item:
+            continue
+        if not REQUIREMENT_PATTERN.match(item):
+            raise DependencyError(f"Invalid requirement: {item}")
+        requirements.append(item)
+    return requirements
+
+
+# Written into every overlay; runs at interpreter start when the overlay is on PYTHONPATH
+SITECUSTOMIZE = """import os, site, sys
+_before = list(sys.path)
+site.addsitedir(os.path.dirname(os.path.abspath(__file__)))
+# addsitedir appends; overlay packages must win over the interpreter's own site-packages
+_added = [p for p in sys.path if p not in _before]
+_site = set(site.getsitepackages()) | {site.getusersitepackages()}
+_at = next((i for i, p in enumerate(_before) if p in _site), len(_before))
+sys.path[:] = _before[:_at] + _added + _before[_at:]
+"""
+
+
+def activate(site_dirs):
+    """Activate overlays in this process, ahead of site-packages (as SITECUSTOMIZE does)"""
+    import site
+    before = list(sys.path)
+    for path in site_dirs:
+        site.addsitedir(str(path))
+    added = [p for p in sys.path if p not in before]
+    site_packages = set(site.getsitepackages()) | {site.getusersitepackages()}
+    at = next((i for i, p in enumerate(before) if p in site_packages), len(before))
+    sys.path[:] = before[:at] + added + before[at:]
+
+
+def overlay_packages(site_dir):
+    """{normalized name: version} of the store entries an overlay activates"""
+    try:
+        lines = (Path(site_dir) / 'zenx-deps.pth').read_text().splitlines()
+    except OSError:
+        return {}
+    packages = {}
+    for line in lines:
+        name, sep, version = os.path.basename(line.strip()).rpartition('-')
+        if sep:
+            packages[name] = version
+    return packages
+
+
+def wheel_key(filename):
+    """'Foo_Bar-1.2-py3-none-any.whl' -> 'foo-bar-1.2'"""
+    name, version = filename.split('-')[:2]
+    return f"{normalize_name(name)}-{version}"
+
+
+class DependencyManager:
+    """Shared wheel cache plus layered per-bot environments.
+
+    Layout under ``root``:
+
+    * ``wheels/`` - every wheel ever resolved, shared by all bots
+    * ``store/<name>-<version>/`` - each wheel unpacked exactly once
+    * ``sets/<hash>.json`` - resolved store keys for a requirement set
+    * ``envs/bot_<id>/`` - overlay: a .pth listing store dirs, plus a
+      sitecustomize that activates it when the dir is on PYTHONPATH
+
+    A bot overlay is two small files, so installing an already-resolved set
+    costs a cache lookup. Locks are per requirement set and per store entry,
+    so unrelated installs run in parallel.
+    """
+
+    def __init__(self, root, base_packages=(), index_args=None, python=None):
+        self.root = Path(root)
+        self.wheels = self.root / 'wheels'
+        self.store = self.root / 'store'
+        self.sets = self.root / 'sets'
+        self.envs = self.root / 'envs'
+        self.tmp = self.root / 'tmp'
+        for path in (self.wheels, self.store, self.sets, self.envs, self.tmp):
+            path.mkdir(parents=True, exist_ok=True)
+
+        self.base_packages = list(base_packages)
+        self.index_args = list(index_args or [])
+        self.python = python or sys.executable
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _lock(self, key):
+        with self._locks_guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    def _set_hash(self, requirements):
+        canonical = '\n'.join(sorted(r.replace(' ', '').lower() for r in requirements))
+        canonical += '\n' + ' '.join(self.index_args)
+        return hashlib.sha256(canonical.encode()).hexdigest()[:24]
+
+    def _pip(self, *args):
+        result = subprocess.run([self.python, '-m', 'pip', '--disable-pip-version-check', *args],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            lines = (result.stderr or result.stdout).strip().splitlines()
+            raise DependencyError(lines[-1] if lines else 'pip failed')
+        return result
+
+    def _fetch_wheels(self, requirements):
+        """Resolve requirements to wheels, filling the shared cache.
+
+        Only prebuilt wheels are accepted: building an sdist would run its
+        setup.py here, on the control-plane host and outside any bot limits.
+        """
+        with tempfile.TemporaryDirectory(dir=self.tmp) as wheel_dir:
+            try:
+                self._pip('wheel', '--only-binary=:all:', '--wheel-dir', wheel_dir,
+                          '--find-links', str(self.wheels), *self.index_args, *requirements)
+            except DependencyError as e:
+                if 'No matching distribution' in str(e) or 'from versions: none' in str(e):
+                    raise DependencyError(f"{e} (only packages published as wheels can be installed; "
+                                          f"source-only packages are not supported)")
+                raise
+            files = []
+            for entry in os.scandir(wheel_dir):
+                if not entry.name.endswith('.whl'):
+                    continue
+                cached = self.wheels / entry.name
+                if not cached.exists():
+                    os.replace(entry.path, cached)
+                files.append(cached)
+            return files
+
+    def _unpack(self, wheel):
+        """Install one wheel into its own store directory, once"""
+        key = wheel_key(wheel.name)
+        target = self.store / key
+        if target.exists():
+            return key
+        with self._lock(f"store:{key}"):
+            if target.exists():
+                return key
+            staging = Path(tempfile.mkdtemp(prefix=f"{key}.", dir=self.tmp))
+            try:
+                self._pip('install', '--no-deps', '--no-index', '--no-compile',
+                          '--target', str(staging), str(wheel))
+                os.replace(staging, target)
+            except OSError:
+                # Another process won the race; keep its copy
+                if not target.exists():
+                    raise
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+        return key
+
+    def resolve(self, requirements):
+        """Return the store keys for a requirement set, fetching if needed"""
+        requirements = list(requirements)
+        if not requirements:
+            return []
+        digest = self._set_hash(requirements)
+        manifest = self.sets / f"{digest}.json"
+
+        with self._lock(f"set:{digest}"):
+            if manifest.exists():
+                keys = json.loads(manifest.read_text())['keys']
+                if all((self.store / key).exists() for key in keys):
+                    return keys
+
+            keys = [self._unpack(wheel) for wheel in self._fetch_wheels(requirements)]
+            tmp_manifest = manifest.with_suffix('.tmp')
+            tmp_manifest.write_text(json.dumps({'requirements': requirements, 'keys': keys}))
+            os.replace(tmp_manifest, manifest)
+            return keys
+
+    def ensure_base(self):
+        """Resolve the shared base layer"""
+        return self.resolve(self.base_packages)
+
+    def overlay_path(self, bot_id):
+        return self.envs / f"bot_{bot_id}"
+
+    def install(self, bot_id, requirements):
+        """Build the overlay for a bot and return its directory.
+
+        Bot packages come first on sys.path so they win over the base layer.
+        """
+        keys = self.resolve(requirements)
+        base_keys = [key for key in self.ensure_base() if key not in keys] if self.base_packages else []
+
+        overlay = self.overlay_path(bot_id)
+        overlay.mkdir(parents=True, exist_ok=True)
+        lines = [str((self.store / key).resolve()) for key in keys + base_keys]
+        tmp_pth = overlay / 'zenx-deps.pth.tmp'
+        tmp_pth.write_text('\n'.join(lines) + '\n')
+        os.replace(tmp_pth, overlay / 'zenx-deps.pth')
+        (overlay / 'sitecustomize.py').write_text(SITECUSTOMIZE)
+        (overlay / 'requirements.txt').write_text('\n'.join(requirements) + '\n')
+        return overlay
+
+    def prefetch(self, requirements):
+        """Warm the wheel cache and store for a set without building an overlay"""
+        try:
+            return self.resolve(requirements)
+        except DependencyError as e:
+            logger.warning(f"Prefetch failed for {requirements}: {e}")
+            return []
+
+    def remove(self, bot_id):
+        shutil.rmtree(self.overlay_path(bot_id), ignore_errors=True)
+
+
+class BackgroundInstaller:
+    """Builds bot overlays on an executor so launches never wait on pip.
+
+    A set that failed is not retried for the same bot until its backoff
+    (doubling from ``retry_base`` up to ``retry_max`` seconds) has passed,
+    so a crash-looping bot does not run pip on every restart.
+    """
+
+    def __init__(self, manager, executor, retry_base=60, retry_max=3600):
+        self.manager = manager
+        self.executor = executor
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._pending = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def ensure(self, bot_id, requirements):
+        """Queue an overlay build unless one is running or backing off; True if queued"""
+        key = self.manager._set_hash(requirements)
+        with self._lock:
+            if bot_id in self._pending:
+                return False
+            failure = self._failures.get(bot_id)
+            if failure and failure[0] == key and time.monotonic() < failure[2]:
+                return False
+            self._pending[bot_id] = self.executor.submit(self._install, bot_id, list(requirements), key)
+        return True
+
+    def _install(self, bot_id, requirements, key):
+        try:
+            self.manager.install(bot_id, requirements)
+        except Exception as e:
+            with self._lock:
+                previous = self._failures.get(bot_id)
+                count = previous[1] + 1 if previous and previous[0] == key else 1
+                delay = min(self.retry_base * 2 ** (count - 1), self.retry_max)
+                self._failures[bot_id] = (key, count, time.monotonic() + delay)
+            logger.error(f"Library install failed for bot {bot_id}, retrying in {delay}s: {e}")
+        else:
+            with self._lock:
+                self._failures.pop(bot_id, None)
+        finally:
+            with self._lock:
+                self._pending.pop(bot_id, None)
+
+    def forget(self, bot_id):
+        """Drop the failure record, e.g. after the user installed a new set"""
+        with self._lock:
+            self._failures.pop(bot_id, None)
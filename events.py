@@ -0,0 +1,235 @@
+"""Change events from the bot control plane, pushed to dashboard viewers.
+
+The bot process appends one JSON line per change (a deployment changing
+status, a user joining, node load moving) to an events file, rotated
+once it grows past a size limit. The web process runs one Broadcaster
+thread that tails that file, recomputes the stats snapshot at a fixed
+interval while anyone is watching (pushing only the keys that changed),
+and hands each event to every connected viewer through a small bounded
+queue. A viewer that cannot keep up is dropped;
+its EventSource reconnects and starts again from a fresh snapshot, so a
+slow client never holds up the others.
+"""
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class EventLog:
+    """Appends change events to a JSON-lines file shared with the web process"""
+
+    def __init__(self, path, max_file_bytes=2 * 1024 * 1024):
+        self.path = str(path)
+        self.max_file_bytes = max_file_bytes
+        self._lock = threading.Lock()
+
+    def emit(self, kind, **fields):
+        """Record one event; never raises, a lost event only delays the dashboard"""
+        line = json.dumps(dict(fields, kind=kind, ts=round(time.time(), 3)), default=str) + '\n'
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_file_bytes:
+                    os.replace(self.path, self.path + '.1')
+                # One O_APPEND write per line, so a reader never sees half an event
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, line.encode())
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass
+
+
+class EventTail:
+    """Reads events appended to an EventLog file since the last call, across rotations"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._file = None
+        self._inode = None
+        self._buffer = b''
+        self._open(at_end=True)
+
+    def _open(self, at_end):
+        try:
+            f = open(self.path, 'rb')
+        except OSError:
+            return False
+        if at_end:
+            f.seek(0, os.SEEK_END)
+        self._file = f
+        self._inode = os.fstat(f.fileno()).st_ino
+        self._buffer = b''
+        return True
+
+    def _drain(self):
+        events = []
+        data = self._buffer + self._file.read()
+        end = data.rfind(b'\n') + 1
+        self._buffer = data[end:]
+        offset = self._file.tell() - len(self._buffer) - end
+        for line in data[:end].splitlines(keepends=True):
+            offset += len(line)
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            events.append((f"{self._inode:x}-{offset:x}", event))
+        return events
+
+    def read(self):
+        """[(event id, event dict)] in file order"""
+        if self._file is None:
+            # Events written before the file existed are all new
+            return self._drain() if self._open(at_end=False) else []
+        events = self._drain()
+        try:
+            rotated = os.stat(self.path).st_ino != self._inode
+        except OSError:
+            rotated = False
+        if rotated:
+            self._file.close()
+            self._file = None
+            if self._open(at_end=False):
+                events.extend(self._drain())
+        return events
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class Subscriber:
+    __slots__ = ('queue', 'dropped')
+
+    def __init__(self, size):
+        self.queue = queue.Queue(size)
+        self.dropped = False
+
+
+class TooManySubscribers(RuntimeError):
+    pass
+
+
+class Broadcaster:
+    """One producer thread fanning events out to bounded per-viewer queues.
+
+    ``snapshot()`` returns the stats dict pushed to viewers; it is called
+    at most once per ``min_snapshot_interval`` while there are viewers,
+    and only keys whose values changed (``volatile`` ones aside) are sent.
+    The thread starts on the first subscriber, after gunicorn has forked.
+    """
+
+    def __init__(self, path, snapshot, poll_interval=0.5, min_snapshot_interval=2.0,
+                 queue_size=64, max_subscribers=200, history=256, volatile=('timestamp',)):
+        self.tail_path = path
+        self.snapshot = snapshot
+        self.poll_interval = poll_interval
+        self.min_snapshot_interval = min_snapshot_interval
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.volatile = set(volatile)
+        self.history = deque(maxlen=history)
+        self.stats = None
+        self.subscribers = set()
+        self.published = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        # Serialises snapshots between the thread and subscribers that find none yet
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self._snapshot_at = 0.0
+
+    def subscribe(self, last_event_id=None):
+        """Register a viewer; returns (subscriber, backlog events to send first)"""
+        with self._lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                raise TooManySubscribers(f"{len(self.subscribers)} viewers connected")
+            self._ensure_thread()
+            sub = Subscriber(self.queue_size)
+            self.subscribers.add(sub)
+            backlog = []
+            if last_event_id:
+                ids = [event_id for event_id, _ in self.history]
+                if last_event_id in ids:
+                    backlog = list(self.history)[ids.index(last_event_id) + 1:]
+        with self._stats_lock:
+            stats = self.stats
+            if stats is None:
+                stats = self._refresh_stats(force=True) or {}
+        return sub, [(None, dict(stats, kind='stats'))] + backlog
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self.subscribers.discard(sub)
+
+    def publish(self, event_id, event):
+        with self._lock:
+            if event_id is not None:
+                self.history.append((event_id, event))
+            subscribers = list(self.subscribers)
+        self.published += 1
+        for sub in subscribers:
+            try:
+                sub.queue.put_nowait((event_id, event))
+            except queue.Full:
+                # Too slow to keep up: cut it loose rather than buffer without bound
+                sub.dropped = True
+                self.dropped += 1
+                self.unsubscribe(sub)
+                with sub.queue.mutex:
+                    sub.queue.queue.clear()
+                sub.queue.put_nowait(None)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._tail = EventTail(self.tail_path)
+            self._thread = threading.Thread(target=self._run, name="event-broadcaster", daemon=True)
+            self._thread.start()
+
+    def _refresh_stats(self, force=False):
+        """Recompute the snapshot when due and push what changed; call with _stats_lock held.
+
+        Returns the new stats, or None if it was not due.
+        """
+        now = time.monotonic()
+        if not force and now - self._snapshot_at < self.min_snapshot_interval:
+            return None
+        self._snapshot_at = now
+        stats = self.snapshot()
+        previous, self.stats = self.stats, stats
+        if previous is not None and not force:
+            delta = {k: v for k, v in stats.items() if k not in self.volatile and previous.get(k) != v}
+            if delta:
+                self.publish(None, dict(delta, kind='stats'))
+        return stats
+
+    def _run(self):
+        while True:
+            try:
+                for event_id, event in self._tail.read():
+                    self.publish(event_id, event)
+                if self.subscribers:
+                    with self._stats_lock:
+                        self._refresh_stats()
+            except Exception as e:
+                # Keep broadcasting; the next poll retries
+                logger.error(f"Event broadcaster error: {e}")
+            time.sleep(self.poll_interval)
+
+
+def format_sse(event_id, event):
+    """One SSE message; the event name is the event's kind"""
+    lines = [f"event: {event.get('kind', 'message')}"]
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(event, default=str)}")
+    return '\n'.join(lines) + '\n\n'
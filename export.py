@@ -0,0 +1,207 @@
+"""Streaming exports of users, deployments and bot logs.
+
+Rows are read in primary-key order, one bounded chunk at a time
+(``WHERE id > ? ORDER BY id LIMIT n``), with the database lock held only
+while a chunk is fetched. Memory stays constant whatever the table size,
+and writers are never blocked for longer than one chunk read. Since rows
+come out in id order, the id of the last row received is a resume
+cursor: pass it back as ``after`` to continue an interrupted export.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+
+class ExportError(Exception):
+    pass
+
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d')
+
+
+def _int(value):
+    return int(value)
+
+
+def _flag(value):
+    if value.lower() in ('1', 'true', 'yes'):
+        return 1
+    if value.lower() in ('0', 'false', 'no'):
+        return 0
+    raise ValueError(value)
+
+
+def _date(value):
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            continue
+    raise ValueError(value)
+
+
+def _strings(value):
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+# name -> table, exported columns (id first), filters: param -> (SQL with one ? per value, parser).
+# Bot tokens and process ids stay out of deployment exports.
+EXPORTS = {
+    'users': {
+        'table': 'users',
+        'columns': ['id', 'username', 'expiry', 'file_limit', 'is_prime', 'join_date', 'last_renewal',
+                    'total_bots_deployed', 'total_deployments', 'last_active', 'bot_username'],
+        'filters': {
+            'user': ('id = ?', _int),
+            'prime': ('is_prime = ?', _flag),
+            'since': ('join_date >= ?', _date),
+            'until': ('join_date < ?', _date),
+        },
+    },
+    'deployments': {
+        'table': 'deployments',
+        'columns': ['id', 'user_id', 'bot_name', 'filename', 'status', 'bot_username', 'node_id', 'is_banned',
+                    'auto_restart', 'restart_count', 'hang_restart_count', 'cpu_usage', 'ram_usage',
+                    'start_time', 'last_active', 'created_at', 'updated_at'],
+        'filters': {
+            'status': ('status IN ({})', _strings),
+            'node': ('node_id = ?', _int),
+            'user': ('user_id = ?', _int),
+            'since': ('created_at >= ?', _date),
+            'until': ('created_at < ?', _date),
+        },
+    },
+    'logs': {
+        'table': 'bot_logs',
+        'columns': ['id', 'bot_id', 'timestamp', 'log_type', 'message'],
+        'filters': {
+            'bot': ('bot_id = ?', _int),
+            'type': ('log_type IN ({})', _strings),
+            'user': ('bot_id IN (SELECT id FROM deployments WHERE user_id = ?)', _int),
+            'node': ('bot_id IN (SELECT id FROM deployments WHERE node_id = ?)', _int),
+            'since': ('timestamp >= ?', _date),
+            'until': ('timestamp < ?', _date),
+        },
+    },
+}
+
+
+class ExportSpec:
+    """A validated export request"""
+
+    __slots__ = ('name', 'table', 'columns', 'where', 'params', 'after', 'limit', 'format')
+
+    def __init__(self, name, where, params, after, limit, fmt):
+        self.name = name
+        self.table = EXPORTS[name]['table']
+        self.columns = EXPORTS[name]['columns']
+        self.where = where
+        self.params = params
+        self.after = after
+        self.limit = limit
+        self.format = fmt
+
+    @property
+    def filename(self):
+        return f"zenx_{self.name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{self.format}"
+
+
+def parse_export(name, args, max_limit=None):
+    """Validate an export name and its query arguments (a mapping of strings).
+
+    Besides the per-export filters: ``format`` (ndjson or csv), ``after``
+    (resume after this id) and ``limit`` (stop after this many rows).
+    """
+    if name not in EXPORTS:
+        raise ExportError(f"unknown export {name}; choose from {', '.join(EXPORTS)}")
+    filters = EXPORTS[name]['filters']
+    unknown = [key for key in args if key not in filters and key not in ('format', 'after', 'limit')]
+    if unknown:
+        raise ExportError(f"unknown filter {', '.join(unknown)}; {name} accepts {', '.join(filters)}")
+
+    fmt = (args.get('format') or 'ndjson').lower()
+    if fmt not in FORMATS:
+        raise ExportError(f"format must be one of {', '.join(FORMATS)}")
+    try:
+        after = int(args.get('after') or 0)
+        limit = int(args['limit']) if args.get('limit') else None
+    except ValueError:
+        raise ExportError("after and limit must be numeric")
+    if limit is not None and limit < 1:
+        raise ExportError("limit must be positive")
+    if max_limit and (limit is None or limit > max_limit):
+        limit = max_limit
+
+    clauses, params = [], []
+    for key, (clause, parse) in filters.items():
+        value = args.get(key)
+        if value in (None, ''):
+            continue
+        try:
+            parsed = parse(value)
+        except ValueError:
+            raise ExportError(f"invalid value for {key}: {value}")
+        if isinstance(parsed, list):
+            if not parsed:
+                raise ExportError(f"invalid value for {key}: {value}")
+            clause = clause.format(', '.join('?' * len(parsed)))
+            params.extend(parsed)
+        else:
+            params.append(parsed)
+        clauses.append(clause)
+    return ExportSpec(name, ''.join(f" AND {clause}" for clause in clauses), params, after, limit, fmt)
+
+
+def iter_rows(connect, lock, spec, chunk_size=1000):
+    """Matching rows as tuples in id order; ``lock`` is held per chunk only"""
+    query = (f"SELECT {', '.join(spec.columns)} FROM {spec.table} "
+             f"WHERE id > ?{spec.where} ORDER BY id LIMIT ?")
+    after, remaining = spec.after, spec.limit
+    conn = connect()
+    try:
+        while remaining is None or remaining > 0:
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            with lock:
+                rows = conn.execute(query, (after, *spec.params, size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield tuple(row)
+            after = rows[-1][0]
+            if remaining is not None:
+                remaining -= len(rows)
+            if len(rows) < size:
+                return
+    finally:
+        conn.close()
+
+
+def encode(rows, spec, batch=500):
+    """Text chunks of NDJSON lines, or CSV with a header row"""
+    columns = spec.columns
+    buffer = io.StringIO()
+    if spec.format == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        write = writer.writerow
+    else:
+        def write(row):
+            buffer.write(json.dumps(dict(zip(columns, row)), default=str))
+            buffer.write('\n')
+    pending = 0
+    for row in rows:
+        write(row)
+        pending += 1
+        if pending >= batch:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,70 @@
+import os
+import time
+from collections import deque
+
+
+class IdleState:
+    """Recent resource samples for one bot"""
+
+    __slots__ = ('pid', 'busy_at', 'log_size', 'samples')
+
+    def __init__(self, pid, now, history):
+        self.pid = pid
+        self.busy_at = now
+        self.log_size = None
+        self.samples = deque(maxlen=history)
+
+
+class IdleTracker:
+    """Decides which running bots have been idle long enough to hibernate.
+
+    Fed one (cpu_percent, rss_mb, log_size) sample per bot per supervisor
+    pass. A bot is busy whenever its CPU exceeds ``cpu_threshold`` or its
+    log grows; a restart (new PID) also counts as activity.
+    """
+
+    def __init__(self, idle_seconds, cpu_threshold=1.0, history=60):
+        self.idle_seconds = idle_seconds
+        self.cpu_threshold = cpu_threshold
+        self.history = history
+        self.state = {}
+
+    def record(self, bot_id, pid, cpu_percent, rss_mb, log_size=None, now=None):
+        now = time.time() if now is None else now
+        state = self.state.get(bot_id)
+        if state is None or state.pid != pid:
+            state = self.state[bot_id] = IdleState(pid, now, self.history)
+        if cpu_percent > self.cpu_threshold or (log_size is not None and log_size != state.log_size
+                                                and state.log_size is not None):
+            state.busy_at = now
+        state.log_size = log_size
+        state.samples.append((cpu_percent, rss_mb))
+
+    def observe(self, managed, now=None):
+        """Record the latest supervisor sample of a ManagedBot"""
+        try:
+            log_size = os.stat(managed.log_path).st_size
+        except OSError:
+            log_size = None
+        self.record(managed.bot_id, managed.pid, managed.cpu_percent, managed.rss_mb, log_size, now)
+
+    def idle_for(self, bot_id, now=None):
+        state = self.state.get(bot_id)
+        if state is None:
+            return 0
+        return (time.time() if now is None else now) - state.busy_at
+
+    def average_rss(self, bot_id):
+        state = self.state.get(bot_id)
+        if not state or not state.samples:
+            return 0.0
+        return sum(rss for _, rss in state.samples) / len(state.samples)
+
+    def candidates(self, now=None):
+        """Idle bots, largest average RSS first (they reclaim the most)"""
+        now = time.time() if now is None else now
+        idle = [bot_id for bot_id in self.state if self.idle_for(bot_id, now) >= self.idle_seconds]
+        return sorted(idle, key=self.average_rss, reverse=True)
+
+    def forget(self, bot_id):
+        self.state.pop(bot_id, None)
@@ -0,0 +1,138 @@
+import os
+import logging
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+CGROUP_MOUNT = Path('/sys/fs/cgroup')
+
+
+def apply_rlimits(limits):
+    """Apply address-space, CPU-time and open-file limits plus niceness.
+
+    Runs inside the child process before the bot script starts.
+    """
+    if resource is None:
+        return
+
+    # Address space is kept well above memory_mb: threads and malloc arenas
+    # reserve far more virtual memory than they touch. RSS itself is
+    # policed by the supervisor or by memory.max when cgroups are available.
+    address_space_mb = limits.get('address_space_mb')
+    if address_space_mb:
+        size = address_space_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (size, size))
+
+    cpu_seconds = limits.get('cpu_seconds')
+    if cpu_seconds:
+        # Soft limit sends SIGXCPU first; the hard limit kills shortly after
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 30))
+
+    max_files = limits.get('max_files')
+    if max_files:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (max_files, max_files))
+
+    nice = limits.get('nice')
+    if nice:
+        os.nice(nice)
+
+
+class CgroupManager:
+    """Optional cgroup v2 quotas, one child group per bot.
+
+    Needs a delegated cgroup directory we can write to (e.g. a systemd unit
+    with Delegate=yes). Without one, only rlimits and niceness apply.
+    """
+
+    CONTROLLERS = ('cpu', 'memory', 'pids')
+
+    def __init__(self, root=None):
+        self.root = Path(root) if root else None
+        self.available = False
+        if self.root:
+            self.available = self._setup()
+
+    def _setup(self):
+        try:
+            if not (CGROUP_MOUNT / 'cgroup.controllers').exists():
+                logger.info("cgroup v2 not mounted, using rlimits only")
+                return False
+            self.root.mkdir(parents=True, exist_ok=True)
+            enabled = (self.root / 'cgroup.controllers').read_text().split()
+            wanted = [c for c in self.CONTROLLERS if c in enabled]
+            (self.root / 'cgroup.subtree_control').write_text(' '.join(f"+{c}" for c in wanted))
+            return True
+        except OSError as e:
+            logger.warning(f"cgroup root {self.root} not usable: {e}")
+            return False
+
+    def group_path(self, bot_id):
+        return self.root / f"bot_{bot_id}"
+
+    def create(self, bot_id, limits):
+        """Create (or update) the group for a bot and return its path"""
+        if not self.available:
+            return None
+        path = self.group_path(bot_id)
+        try:
+            path.mkdir(exist_ok=True)
+            memory_mb = limits.get('memory_mb')
+            if memory_mb:
+                (path / 'memory.max').write_text(str(memory_mb * 1024 * 1024))
+            cpu_quota = limits.get('cpu_quota')
+            if cpu_quota:
+                period = 100000
+                (path / 'cpu.max').write_text(f"{int(cpu_quota * period)} {period}")
+            max_pids = limits.get('max_pids')
+            if max_pids:
+                (path / 'pids.max').write_text(str(max_pids))
+            return path
+        except OSError as e:
+            logger.warning(f"Could not configure cgroup for bot {bot_id}: {e}")
+            return None
+
+    def remove(self, bot_id):
+        if not self.available:
+            return
+        try:
+            self.group_path(bot_id).rmdir()
+        except OSError:
+            pass
+
+    def stats(self, bot_id):
+        """Throttling counters for a bot's group"""
+        result = {}
+        if not self.available:
+            return result
+        path = self.group_path(bot_id)
+        try:
+            for line in (path / 'cpu.stat').read_text().splitlines():
+                key, value = line.split()
+                if key in ('nr_throttled', 'throttled_usec'):
+                    result[key] = int(value)
+            for line in (path / 'memory.events').read_text().splitlines():
+                key, value = line.split()
+                if key in ('high', 'max', 'oom_kill'):
+                    result[f"memory_{key}"] = int(value)
+        except (OSError, ValueError):
+            pass
+        return result
+
+
+def make_preexec(limits, cgroup_path=None):
+    """Build a preexec_fn for subprocess.Popen that isolates the child"""
+    def preexec():
+        if cgroup_path:
+            try:
+                # Writing 0 moves the calling (child) process into the group
+                with open(cgroup_path / 'cgroup.procs', 'w') as f:
+                    f.write('0')
+            except OSError:
+                pass
+        apply_rlimits(limits)
+    return preexec
@@ -0,0 +1,121 @@
+import os
+import time
+import logging
+from pathlib import Path
+
+import procfs
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_ENV = 'ZENX_HEARTBEAT_FILE'
+
+
+class Liveness:
+    """Last observed progress signals for one bot"""
+
+    __slots__ = ('pid', 'log_size', 'cpu_ticks', 'heartbeat', 'last_progress', 'signal')
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.log_size = None
+        self.cpu_ticks = None
+        self.heartbeat = None
+        self.last_progress = time.monotonic()
+        self.signal = 'start'
+
+
+class Watchdog:
+    """Detects bots that are alive but no longer making progress.
+
+    Progress is any growth of the bot's log, any CPU tick movement, or a
+    touch of the heartbeat file named in ``$ZENX_HEARTBEAT_FILE``. Once a
+    bot has touched its heartbeat file, only the heartbeat counts, so a
+    wedged bot spinning in a loop is still caught.
+    """
+
+    def __init__(self, heartbeat_dir, timeout):
+        self.heartbeat_dir = Path(heartbeat_dir)
+        self.heartbeat_dir.mkdir(parents=True, exist_ok=True)
+        self.timeout = timeout
+        self.state = {}
+        self.hung = set()
+
+    def heartbeat_path(self, bot_id):
+        return self.heartbeat_dir / f"bot_{bot_id}.heartbeat"
+
+    def env_for(self, bot_id, env=None):
+        """Environment for a bot launch, with the heartbeat file injected"""
+        path = self.heartbeat_path(bot_id)
+        path.unlink(missing_ok=True)
+        self.state.pop(bot_id, None)
+        self.hung.discard(bot_id)
+        return {**(os.environ if env is None else env), HEARTBEAT_ENV: str(path.resolve())}
+
+    def _mtime(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def observe(self, managed):
+        """Update a bot's signals; return seconds since it last made progress"""
+        live = self.state.get(managed.bot_id)
+        if live is None or live.pid != managed.pid:
+            live = self.state[managed.bot_id] = Liveness(managed.pid)
+
+        heartbeat = self._mtime(self.heartbeat_path(managed.bot_id))
+        log_size = None
+        try:
+            log_size = os.stat(managed.log_path).st_size
+        except OSError:
+            pass
+        ticks = procfs.cpu_ticks(managed.pid)
+
+        progressed = None
+        if heartbeat is not None:
+            if heartbeat != live.heartbeat:
+                progressed = 'heartbeat'
+        else:
+            if log_size is not None and log_size != live.log_size:
+                progressed = 'log'
+            elif ticks is not None and ticks != live.cpu_ticks:
+                progressed = 'cpu'
+
+        live.heartbeat, live.log_size, live.cpu_ticks = heartbeat, log_size, ticks
+        now = time.monotonic()
+        if progressed:
+            live.last_progress = now
+            live.signal = progressed
+        return now - live.last_progress
+
+    def check(self, bots):
+        """Return the ManagedBots that have stalled for longer than the timeout"""
+        stalled = []
+        seen = set()
+        for managed in bots:
+            seen.add(managed.bot_id)
+            if managed.bot_id in self.hung:
+                continue
+            idle = self.observe(managed)
+            if idle > self.timeout:
+                live = self.state[managed.bot_id]
+                logger.warning(f"Bot {managed.bot_id} made no progress for {idle:.0f}s "
+                               f"(last signal: {live.signal})")
+                self.hung.add(managed.bot_id)
+                stalled.append(managed)
+
+        for bot_id in set(self.state) - seen:
+            del self.state[bot_id]
+        return stalled
+
+    def consume(self, bot_id):
+        """True (once) if the bot's last exit was a watchdog kill"""
+        if bot_id in self.hung:
+            self.hung.discard(bot_id)
+            return True
+        return False
+
+    def forget(self, bot_id):
+        self.state.pop(bot_id, None)
+        self.hung.discard(bot_id)
+        self.heartbeat_path(bot_id).unlink(missing_ok=True)
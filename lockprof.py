@@ -0,0 +1,236 @@
+"""Contention profiler for the shared database lock.
+
+ProfiledLock wraps a threading.RLock. While profiling is on, every
+outermost acquisition records how long the caller waited, how long the
+lock was then held and where it was taken: the query text when the
+caller tagged it, otherwise file:function:line of the caller. Nested
+re-acquisitions by the owning thread are folded into the outer one.
+
+Profiling is switched on and off at runtime through a flag file, so all
+processes sharing the database (bot control plane and web workers) follow
+the same switch without a restart. While off, acquire/release cost one
+extra attribute check.
+"""
+import os
+import re
+import sys
+import json
+import time
+import threading
+
+_THIS_FILE = os.path.normcase(__file__)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_site(text, limit=120):
+    """Collapse whitespace in a query so equal statements aggregate together"""
+    text = _WHITESPACE.sub(' ', str(text)).strip()
+    return text if len(text) <= limit else text[:limit - 3] + '...'
+
+
+class SiteStats:
+    __slots__ = ('count', 'contended', 'wait_total', 'wait_max', 'hold_total', 'hold_max')
+
+    def __init__(self):
+        self.count = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.hold_total = 0.0
+        self.hold_max = 0.0
+
+    def add(self, wait, hold, contended):
+        self.count += 1
+        self.contended += contended
+        self.wait_total += wait
+        self.hold_total += hold
+        if wait > self.wait_max:
+            self.wait_max = wait
+        if hold > self.hold_max:
+            self.hold_max = hold
+
+    def to_dict(self, site):
+        return {
+            'site': site,
+            'count': self.count,
+            'contended': self.contended,
+            'wait_total_ms': round(self.wait_total * 1000, 3),
+            'wait_avg_ms': round(self.wait_total / self.count * 1000, 3) if self.count else 0.0,
+            'wait_max_ms': round(self.wait_max * 1000, 3),
+            'hold_total_ms': round(self.hold_total * 1000, 3),
+            'hold_avg_ms': round(self.hold_total / self.count * 1000, 3) if self.count else 0.0,
+            'hold_max_ms': round(self.hold_max * 1000, 3),
+        }
+
+
+class ProfiledLock:
+    """Drop-in RLock replacement that can profile its own contention.
+
+    ``flag_path`` is a file whose existence turns profiling on; it is
+    checked at most every ``check_interval`` seconds. Without a flag
+    file, ``enabled`` alone decides.
+    """
+
+    def __init__(self, lock=None, enabled=False, flag_path=None, check_interval=5.0, max_sites=500):
+        self._lock = lock or threading.RLock()
+        self.enabled = enabled
+        self.flag_path = flag_path
+        self.check_interval = check_interval
+        self.max_sites = max_sites
+        self._next_check = 0.0
+        self._local = threading.local()
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        self.since = time.time()
+
+    # Switch
+
+    def _profiling(self):
+        if self.flag_path is not None:
+            now = time.monotonic()
+            if now >= self._next_check:
+                self._next_check = now + self.check_interval
+                enabled = os.path.exists(self.flag_path)
+                if enabled and not self.enabled:
+                    self.reset()
+                self.enabled = enabled
+        return self.enabled
+
+    def set_enabled(self, enabled):
+        """Turn profiling on or off here and, through the flag file, everywhere"""
+        if self.flag_path is not None:
+            if enabled:
+                os.makedirs(os.path.dirname(self.flag_path) or '.', exist_ok=True)
+                with open(self.flag_path, 'w') as f:
+                    f.write(str(time.time()))
+            else:
+                try:
+                    os.unlink(self.flag_path)
+                except FileNotFoundError:
+                    pass
+            self._next_check = time.monotonic() + self.check_interval
+        if enabled and not self.enabled:
+            self.reset()
+        self.enabled = enabled
+
+    # Lock protocol
+
+    def tag(self, site):
+        """Name the call site of this thread's next acquisition, e.g. the query text"""
+        if self.enabled:
+            self._local.tag = site
+
+    def _site(self):
+        tag = getattr(self._local, 'tag', None)
+        if tag is not None:
+            self._local.tag = None
+            return normalize_site(tag)
+        frame = sys._getframe(2)
+        while frame is not None and os.path.normcase(frame.f_code.co_filename) == _THIS_FILE:
+            frame = frame.f_back
+        if frame is None:
+            return 'unknown'
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+    def acquire(self, blocking=True, timeout=-1):
+        if not self._profiling():
+            return self._lock.acquire(blocking, timeout)
+        local = self._local
+        depth = getattr(local, 'depth', 0)
+        if depth:
+            # Re-entrant acquisition by the owner never waits
+            acquired = self._lock.acquire(blocking, timeout)
+            if acquired:
+                local.depth = depth + 1
+            return acquired
+
+        started = time.perf_counter()
+        contended = not self._lock.acquire(False)
+        if contended and not (blocking and self._lock.acquire(True, timeout)):
+            local.tag = None
+            return False
+        now = time.perf_counter()
+        local.depth = 1
+        local.acquired_at = now
+        local.wait = now - started
+        local.contended = contended
+        local.site = self._site()
+        return True
+
+    def release(self):
+        local = self._local
+        depth = getattr(local, 'depth', 0)
+        if not depth:
+            # Taken while profiling was off
+            self._lock.release()
+            return
+        local.depth = depth - 1
+        if depth > 1:
+            self._lock.release()
+            return
+        hold = time.perf_counter() - local.acquired_at
+        self._lock.release()
+        self._record(local.site, local.wait, hold, local.contended)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    # Statistics
+
+    def _record(self, site, wait, hold, contended):
+        with self._stats_lock:
+            stats = self._stats.get(site)
+            if stats is None:
+                if len(self._stats) >= self.max_sites:
+                    site = 'other'
+                stats = self._stats.setdefault(site, SiteStats())
+            stats.add(wait, hold, contended)
+
+    def reset(self):
+        with self._stats_lock:
+            self._stats = {}
+        self.since = time.time()
+
+    def report(self, top=10, sort_by='wait_total'):
+        """Totals plus the ``top`` call sites ordered by ``sort_by``"""
+        with self._stats_lock:
+            sites = [stats.to_dict(site) for site, stats in self._stats.items()]
+        key = sort_by if sort_by in ('count', 'contended') else f"{sort_by}_ms"
+        sites.sort(key=lambda s: s[key], reverse=True)
+        return {
+            'enabled': self.enabled,
+            'since': self.since,
+            'acquisitions': sum(s['count'] for s in sites),
+            'contended': sum(s['contended'] for s in sites),
+            'wait_total_ms': round(sum(s['wait_total_ms'] for s in sites), 3),
+            'hold_total_ms': round(sum(s['hold_total_ms'] for s in sites), 3),
+            'sites': sites[:top],
+        }
+
+    def write_report(self, path, top=25):
+        """Atomically write a JSON report for another process to read"""
+        path = str(path)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.report(top), f)
+        os.replace(tmp, path)
+
+
+def tag(lock, site):
+    """Tag the next acquisition of ``lock`` if it is a ProfiledLock"""
+    if isinstance(lock, ProfiledLock):
+        lock.tag(site)
+
+
+def read_report(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
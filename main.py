@@ -1,4 +1,5 @@
 import os
+import sys
 import subprocess
 import sqlite3
 import telebot
@@ -11,12 +12,38 @@ import platform
 import zipfile
 import json
 import logging
+import atexit
+import tempfile
+import gzip
 from pathlib import Path
-from telebot import types
+from telebot import types, apihelper
+from telebot.handler_backends import BaseMiddleware
 from datetime import datetime, timedelta
 from werkzeug.utils import secure_filename
 from concurrent.futures import ThreadPoolExecutor
 import shutil
+from notifications import NotificationStore
+from dal import DataAccess
+from schema import init_schema
+from writebuffer import WriteBuffer
+from archive import BundleWriter, write_bot_archive
+from supervisor import BotSupervisor, LIMIT_DESCRIPTIONS, limit_kill
+import procfs
+from zygote import ForkServer
+from deps import DependencyManager, DependencyError, BackgroundInstaller, parse_requirements
+from analysis import analyze_file, compiled_path, distribution_for, launch_target
+from liveness import Watchdog
+from hibernation import IdleTracker
+from rebalancer import Rebalancer, LocalNodeAgent
+from node_agent import NodeAgentClient, RemoteNodeAgent, RemoteBot, AgentError, parse_agent_map
+from metrics import Registry, statement_kind
+from lockprof import ProfiledLock
+from tracing import Tracer, span, traced
+from sampler import StackSampler
+from events import EventLog
+from export import EXPORTS, ExportError, encode as encode_export, iter_rows, parse_export
+from bulk import (ACTIONS as BULK_ACTIONS, BulkOperations, BulkError, parse_selector, describe_selector,
+                  claim_jobs, finish_job, fail_interrupted_jobs)
 
 # Configure logging
 logging.basicConfig(
@@ -29,9 +56,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Database lock for thread safety
-db_lock = threading.RLock()
-
 # Configuration
 class Config:
     TOKEN = os.environ.get('BOT_TOKEN', '8494225623:AAG_HRSHoBpt36bdeUvYJL4ONnh-2bf6BnY')
@@ -51,6 +75,57 @@ class Config:
     BACKUP_INTERVAL = 3600
     BOT_TIMEOUT = 300
     MAX_LOG_SIZE = 10000
+    NOTIFICATION_FLUSH_INTERVAL = 2
+    NOTIFICATION_RETENTION_DAYS = 30
+    WRITE_FLUSH_INTERVAL = 5
+    SUPERVISE_INTERVAL = 10
+    HANG_KILL_GRACE = 10
+    # Nodes served by a node agent process: "node_id=unix:/path,node_id=tcp:host:port".
+    # Nodes not listed run their bots inside this process. Agents detect hung bots
+    # themselves (their --hang-timeout, default BOT_TIMEOUT) and report usage for hibernation.
+    NODE_AGENTS = parse_agent_map(os.environ.get('ZENX_NODE_AGENTS'))
+    AGENT_TOKEN = os.environ.get('ZENX_AGENT_TOKEN')
+    REBALANCE_INTERVAL = 900
+    REBALANCE_MAX_CONCURRENT = 2
+    REBALANCE_SKEW = 0.25
+    HIBERNATION_ENABLED = True
+    HIBERNATE_IDLE_SECONDS = 6 * 3600
+    HIBERNATE_CPU_THRESHOLD = 1.0
+    HIBERNATE_BATCH = 20
+    HIBERNATION_WAKE_AFTER = None  # seconds; wake hibernated bots on a schedule when set
+    CGROUP_ROOT = os.environ.get('ZENX_CGROUP_ROOT')
+    USE_ZYGOTE = os.environ.get('ZENX_ZYGOTE', '1') == '1'
+    ZYGOTE_SOCKET = 'zygote.sock'
+    DEPS_DIR = 'deps'
+    BASE_PACKAGES = ['pyTelegramBotAPI', 'requests', 'aiogram']
+    MAX_LIBRARIES = 20
+    # Backoff after a failed background install: doubles per failure, capped
+    INSTALL_RETRY_BASE = 60
+    INSTALL_RETRY_MAX = 3600
+    METRICS_DIR = 'metrics'
+    # Lock profiling is on while this file exists (shared with the web process)
+    LOCKPROF_FLAG = os.path.join(METRICS_DIR, 'lockprof.enabled')
+    TRACE_BUFFER_SIZE = 500
+    TRACE_SLOW_MS = 1000
+    TRACE_SLOW_FILE = os.path.join(LOGS_DIR, 'slow_traces.jsonl')
+    PROFILE_DEFAULT_SECONDS = 15
+    PROFILE_MAX_SECONDS = 120
+    PROFILE_INTERVAL = 0.01
+    # Change events for the web dashboard's /api/events feed
+    EVENTS_FILE = os.path.join(LOGS_DIR, 'events.jsonl')
+    # Compressed /export files stop here, under Telegram's 50 MB upload limit
+    EXPORT_MAX_BYTES = 45 * 1024 * 1024
+    
+    # Per-plan resource limits for hosted bots. CPU is capped as a rate (cpu_quota,
+    # via cpu.max or the supervisor's averaged sample); cpu_seconds is a lifetime
+    # RLIMIT_CPU and would kill healthy long-running bots, so no plan sets it.
+    CPU_QUOTA_WINDOW = 60
+    RESOURCE_LIMITS = {
+        'free': {'memory_mb': 128, 'address_space_mb': 1024, 'cpu_seconds': None,
+                 'max_files': 128, 'nice': 10, 'cpu_quota': 0.25, 'max_pids': 64},
+        'prime': {'memory_mb': 512, 'address_space_mb': 4096, 'cpu_seconds': None,
+                  'max_files': 1024, 'nice': 0, 'cpu_quota': 1.0, 'max_pids': 256}
+    }
     
     # Updated to 300 capacity nodes
     HOSTING_NODES = [
@@ -59,9 +134,12 @@ class Config:
         {"name": "Node-3", "status": "active", "capacity": 300, "region": "Europe"}
     ]
 
+# Database lock for thread safety; profiles its own contention when switched on
+db_lock = ProfiledLock(threading.RLock(), flag_path=Config.LOCKPROF_FLAG)
+
 # Create bot instance
 try:
-    bot = telebot.TeleBot(Config.TOKEN, parse_mode="Markdown")
+    bot = telebot.TeleBot(Config.TOKEN, parse_mode="Markdown", use_class_middlewares=True)
     logger.info("TeleBot instance created successfully")
 except Exception as e:
     logger.error(f"Failed to create TeleBot instance: {e}")
@@ -78,6 +156,142 @@ user_sessions = {}
 user_message_history = {}
 bot_monitors = {}
 
+# Projected, slotted-record queries for handler views
+dal = DataAccess(Config.DB_NAME, db_lock)
+
+# Hosted bot processes, forked from a pre-warmed zygote when it is running
+zygote = ForkServer(Config.ZYGOTE_SOCKET)
+supervisor = BotSupervisor(Config.RESOURCE_LIMITS, Config.LOGS_DIR, cgroup_root=Config.CGROUP_ROOT,
+                           zygote=zygote, cpu_window=Config.CPU_QUOTA_WINDOW)
+
+# Restarts bots that stay alive but stop making progress for BOT_TIMEOUT seconds
+watchdog = Watchdog(Config.LOGS_DIR, Config.BOT_TIMEOUT)
+
+# Connections to remote node agents, by node id (see connect_node_agents)
+node_clients = {}
+
+# Moves running bots between nodes; agents are registered once nodes are loaded
+rebalancer = Rebalancer(Config.DB_NAME, db_lock, {}, max_concurrent=Config.REBALANCE_MAX_CONCURRENT,
+                        skew_threshold=Config.REBALANCE_SKEW)
+
+# Idle free-tier bots are hibernated to free node memory
+idle_tracker = IdleTracker(Config.HIBERNATE_IDLE_SECONDS, Config.HIBERNATE_CPU_THRESHOLD)
+
+# Shared wheel cache and per-bot library overlays
+deps = DependencyManager(Config.DEPS_DIR, Config.BASE_PACKAGES)
+installer = BackgroundInstaller(deps, executor, Config.INSTALL_RETRY_BASE, Config.INSTALL_RETRY_MAX)
+
+# Write-behind buffer for stats and counter updates
+write_buffer = WriteBuffer(Config.DB_NAME, db_lock, flush_interval=Config.WRITE_FLUSH_INTERVAL)
+
+# Buffered notification writer
+notification_store = NotificationStore(Config.DB_NAME, db_lock,
+                                        flush_interval=Config.NOTIFICATION_FLUSH_INTERVAL,
+                                        retention_days=Config.NOTIFICATION_RETENTION_DAYS)
+
+# Control-plane metrics, written to METRICS_DIR for the web process's /metrics
+PROCESS_START_TIME = time.time()
+registry = Registry({'process': 'control_plane'})
+db_query_seconds = registry.histogram('zenx_db_query_seconds', "execute_db query time", ['statement'])
+db_lock_wait_seconds = registry.histogram('zenx_db_lock_wait_seconds', "Time execute_db waited for db_lock",
+                                          buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0))
+callback_seconds = registry.histogram('zenx_callback_seconds', "Callback query handling time", ['kind'])
+telegram_seconds = registry.histogram('zenx_telegram_request_seconds', "Telegram Bot API call latency", ['method'],
+                                      buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 90.0))
+telegram_errors = registry.counter('zenx_telegram_errors_total', "Failed Telegram Bot API calls", ['method', 'error'])
+bot_starts = registry.counter('zenx_bot_starts_total', "Bot process starts", ['result'])
+bot_exits = registry.counter('zenx_bot_exits_total', "Bot process exits by recorded status", ['status'])
+registry.gauge('zenx_task_queue_depth', "Background tasks (deploys, installs, bulk jobs) waiting for a worker",
+               callback=lambda: executor._work_queue.qsize())
+registry.gauge('zenx_supervised_bots', "Bots supervised by this process", callback=lambda: len(supervisor.bots))
+registry.gauge('zenx_process_start_time_seconds', "Control-plane start time", callback=lambda: PROCESS_START_TIME)
+metrics_exported = registry.gauge('zenx_metrics_export_timestamp_seconds', "When this snapshot was written")
+
+def timed_telegram_request(make_request):
+    """Wrap apihelper._make_request to record latency and errors per API method"""
+    def request(token, method_name, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            with span('telegram', method_name):
+                return make_request(token, method_name, *args, **kwargs)
+        except Exception as e:
+            error_code = getattr(e, 'error_code', None)
+            telegram_errors.labels(method_name, str(error_code) if error_code else type(e).__name__).inc()
+            raise
+        finally:
+            telegram_seconds.labels(method_name).observe(time.perf_counter() - started)
+    return request
+
+apihelper._make_request = timed_telegram_request(apihelper._make_request)
+apihelper.download_file = traced('telegram', 'downloadFile')(apihelper.download_file)
+
+def callback_kind(data):
+    """Low-cardinality label for callback data: 'confirm_delete_12' -> 'confirm_delete'"""
+    parts = []
+    for part in (data or '').split('_')[:3]:
+        if not part.isalpha():
+            break
+        parts.append(part)
+    return '_'.join(parts) or 'other'
+
+# Per-update traces: slowest recent ones via /traces, slow ones also on disk
+tracer = Tracer(Config.TRACE_BUFFER_SIZE, Config.TRACE_SLOW_MS, Config.TRACE_SLOW_FILE)
+
+# Deployment, user and node changes, tailed by the web process and pushed to dashboards
+events = EventLog(Config.EVENTS_FILE)
+
+def emit_deployment(bot_id, status, node_id=None, node_delta=0):
+    """Announce a deployment status change and the node load it moved"""
+    events.emit('deployment', id=bot_id, status=status, node_id=node_id)
+    if node_id and node_delta:
+        events.emit('node', id=node_id, delta=node_delta)
+
+def update_kind(update):
+    """Trace label for an incoming message or callback query"""
+    if isinstance(update, types.CallbackQuery):
+        return f"callback:{callback_kind(update.data)}"
+    text = update.text or ''
+    if text.startswith('/'):
+        return f"command:{text.split()[0].split('@')[0]}"
+    return f"message:{update.content_type}"
+
+class TracingMiddleware(BaseMiddleware):
+    """Opens a trace when an update is dispatched and closes it after the handler"""
+    
+    def __init__(self):
+        super().__init__()
+        self.update_types = ['message', 'callback_query']
+    
+    def pre_process(self, update, data):
+        tracer.start(update_kind(update), update.from_user.id if update.from_user else None)
+    
+    def post_process(self, update, data, exception):
+        tracer.finish(exception)
+
+bot.setup_middleware(TracingMiddleware())
+
+def timed_callback(handler):
+    """Record handling time per callback kind"""
+    def wrapper(call):
+        started = time.perf_counter()
+        try:
+            return handler(call)
+        finally:
+            callback_seconds.labels(callback_kind(call.data)).observe(time.perf_counter() - started)
+    wrapper.__name__ = handler.__name__
+    wrapper.__doc__ = handler.__doc__
+    return wrapper
+
+def export_metrics():
+    """Write the control-plane metrics snapshot for the web process"""
+    metrics_exported.set(time.time())
+    try:
+        registry.write_textfile(Path(Config.METRICS_DIR) / 'control_plane.prom')
+        if db_lock.enabled:
+            db_lock.write_report(Path(Config.METRICS_DIR) / 'lockprof_control_plane.json')
+    except OSError as e:
+        logger.error(f"Metrics export failed: {e}")
+
 # Database helper functions with thread safety
 def get_db():
     """Get database connection with thread safety"""
@@ -88,7 +302,15 @@ def get_db():
 
 def execute_db(query, params=(), fetchone=False, fetchall=False, commit=False):
     """Execute database query with thread safety"""
+    with span('db', statement_kind(query)):
+        return _execute_db(query, params, fetchone, fetchall, commit)
+
+def _execute_db(query, params, fetchone, fetchall, commit):
+    db_lock.tag(query)
+    waiting = time.perf_counter()
     with db_lock:
+        started = time.perf_counter()
+        db_lock_wait_seconds.observe(started - waiting)
         conn = sqlite3.connect(Config.DB_NAME, check_same_thread=False)
         conn.row_factory = sqlite3.Row
         c = conn.cursor()
@@ -113,54 +335,18 @@ def execute_db(query, params=(), fetchone=False, fetchall=False, commit=False):
             logger.error(f"Database error: {e}")
             conn.close()
             return None
+        finally:
+            db_query_seconds.labels(statement_kind(query)).observe(time.perf_counter() - started)
 
 # Database Functions
 def init_db():
     """Initialize database with recovery support"""
     try:
-        db_exists = os.path.exists(Config.DB_NAME)
-        
         conn = get_db()
         c = conn.cursor()
         
-        # Create tables
-        c.execute('''CREATE TABLE IF NOT EXISTS users 
-                    (id INTEGER PRIMARY KEY, username TEXT, expiry TEXT, file_limit INTEGER, 
-                     is_prime INTEGER, join_date TEXT, last_renewal TEXT, total_bots_deployed INTEGER DEFAULT 0,
-                     total_deployments INTEGER DEFAULT 0, last_active TEXT, bot_username TEXT)''')
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS keys 
-                    (key TEXT PRIMARY KEY, duration_days INTEGER, file_limit INTEGER, created_date TEXT, 
-                     used_by TEXT, used_date TEXT, is_used INTEGER DEFAULT 0)''')
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS deployments 
-                    (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, bot_name TEXT, 
-                     filename TEXT, pid INTEGER, start_time TEXT, status TEXT, 
-                     cpu_usage REAL, ram_usage REAL, last_active TEXT, node_id INTEGER,
-                     logs TEXT, restart_count INTEGER DEFAULT 0, auto_restart INTEGER DEFAULT 1,
-                     created_at TEXT, updated_at TEXT, bot_username TEXT, is_banned INTEGER DEFAULT 0,
-                     token TEXT, metadata TEXT)''')
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS nodes
-                    (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, status TEXT, 
-                     capacity INTEGER, current_load INTEGER DEFAULT 0, last_check TEXT,
-                     region TEXT, total_deployed INTEGER DEFAULT 0)''')
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS server_logs
-                    (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, 
-                     event TEXT, details TEXT, user_id INTEGER)''')
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS bot_logs
-                    (id INTEGER PRIMARY KEY AUTOINCREMENT, bot_id INTEGER, timestamp TEXT,
-                     log_type TEXT, message TEXT)''')
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS notifications
-                    (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, message TEXT,
-                     is_read INTEGER DEFAULT 0, created_at TEXT)''')
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS bot_backups
-                    (id INTEGER PRIMARY KEY AUTOINCREMENT, bot_id INTEGER, backup_name TEXT,
-                     backup_path TEXT, created_at TEXT, size_kb REAL)''')
+        # Create tables and run pending migrations
+        init_schema(conn)
         
         # Check if admin exists
         c.execute("SELECT * FROM users WHERE id=?", (Config.ADMIN_ID,))
@@ -182,10 +368,7 @@ def init_db():
                 c.execute("INSERT INTO nodes (name, status, capacity, last_check, region) VALUES (?, ?, ?, ?, ?)",
                          (node['name'], node['status'], node['capacity'], join_date, node.get('region', 'Global')))
         
-        # Update all running bots to "Stopped" status for recovery
-        if db_exists:
-            c.execute("UPDATE deployments SET status='Stopped', pid=0, updated_at=? WHERE status='Running'",
-                     (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
+        # Running deployments are left alone here; reattach_bots() picks them up
         
         conn.commit()
         conn.close()
@@ -206,15 +389,9 @@ def update_user_bot_count(user_id):
         count = count[0] or 0
     else:
         count = 0
-        
-    deployments = execute_db("SELECT COUNT(*) FROM deployments WHERE user_id=? AND status='Running'", (user_id,), fetchone=True)
-    if deployments:
-        deployments = deployments[0] or 0
-    else:
-        deployments = 0
-        
-    execute_db("UPDATE users SET total_bots_deployed=?, total_deployments=total_deployments+1 WHERE id=?", 
-              (count, user_id), commit=True)
+    
+    write_buffer.set('users', user_id, total_bots_deployed=count)
+    write_buffer.add('users', user_id, total_deployments=1)
 
 def is_prime(user_id):
     user = get_user(user_id)
@@ -227,33 +404,17 @@ def is_prime(user_id):
     return False
 
 def get_user_bots(user_id):
-    bots = execute_db("""
-        SELECT id, bot_name, filename, pid, start_time, status, node_id, 
-               restart_count, auto_restart, created_at, bot_username, is_banned 
-        FROM deployments 
-        WHERE user_id=? 
-        ORDER BY status DESC, id DESC
-    """, (user_id,), fetchall=True)
-    
-    if bots:
-        return bots
-    return []
+    return dal.user_deployments(user_id, 'list')
 
 def get_all_bots():
     """Get all bots for admin"""
-    bots = execute_db("""
-        SELECT d.*, u.username as user_username 
-        FROM deployments d 
-        LEFT JOIN users u ON d.user_id = u.id 
-        ORDER BY d.id DESC
-    """, fetchall=True)
-    
-    return bots or []
+    return dal.all_deployments('admin_list')
 
 def update_bot_stats(bot_id, cpu, ram):
-    last_active = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    execute_db("UPDATE deployments SET cpu_usage=?, ram_usage=?, last_active=?, updated_at=? WHERE id=?", 
-              (cpu, ram, last_active, last_active, bot_id), commit=True)
+    # Not last_active: this runs every supervisor pass, and hibernation reads
+    # last_active as the time the bot was last started or touched by its owner
+    updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    write_buffer.set('deployments', bot_id, cpu_usage=cpu, ram_usage=ram, updated_at=updated_at)
 
 def generate_random_key():
     prefix = "ZENX-"
@@ -265,49 +426,46 @@ def create_progress_bar(percentage, length=10):
     filled = int(percentage * length / 100)
     return "█" * filled + "░" * (length - filled)
 
+def build_bot_metadata(bot_id, bot_name, filename, user_id, bot_info=None, user_info=None):
+    """Build the metadata.json payload stored in bot backups"""
+    return {
+        'bot_id': bot_id,
+        'bot_name': bot_name,
+        'filename': filename,
+        'user_id': user_id,
+        'user_username': user_info['username'] if user_info else 'Unknown',
+        'bot_username': bot_info['bot_username'] if bot_info else '',
+        'status': bot_info['status'] if bot_info else '',
+        'export_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'version': 'ZEN X HOST BOT v3.3.2',
+        'node_info': '300-Capacity Multi-Node Hosting',
+        'recovery_info': 'Auto-recovery enabled',
+        'token': bot_info['token'] if bot_info else ''
+    }
+
+@traced('io', 'zip_export')
+def write_bot_export(bot_id, bot_name, filename, user_id):
+    """Write a bot's export archive; returns (name, path, size_kb)"""
+    export_dir = Path(Config.EXPORTS_DIR)
+    export_dir.mkdir(exist_ok=True)
+    
+    zip_filename = f"bot_export_{bot_id}_{int(time.time())}.zip"
+    zip_path = export_dir / zip_filename
+    
+    bot_info = dal.deployment(bot_id, 'export')
+    user_info = get_user(user_id)
+    metadata = build_bot_metadata(bot_id, bot_name, filename, user_id, bot_info, user_info)
+    log_file = Path(Config.LOGS_DIR) / f"bot_{bot_id}.log"
+    
+    write_bot_archive(zip_path, project_path / filename, metadata, log_file)
+    return zip_filename, zip_path, zip_path.stat().st_size / 1024
+
 def create_zip_file(bot_id, bot_name, filename, user_id):
     """Create a zip file for bot export"""
     try:
-        export_dir = Path(Config.EXPORTS_DIR)
-        export_dir.mkdir(exist_ok=True)
-        
-        zip_filename = f"bot_export_{bot_id}_{int(time.time())}.zip"
-        zip_path = export_dir / zip_filename
-        
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            bot_file_path = project_path / filename
-            if bot_file_path.exists():
-                zipf.write(bot_file_path, arcname=filename)
-            
-            # Add metadata
-            bot_info = execute_db("SELECT * FROM deployments WHERE id=?", (bot_id,), fetchone=True)
-            user_info = get_user(user_id)
-            
-            metadata = {
-                'bot_id': bot_id,
-                'bot_name': bot_name,
-                'filename': filename,
-                'user_id': user_id,
-                'user_username': user_info['username'] if user_info else 'Unknown',
-                'bot_username': bot_info['bot_username'] if bot_info else '',
-                'status': bot_info['status'] if bot_info else '',
-                'export_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'version': 'ZEN X HOST BOT v3.3.2',
-                'node_info': '300-Capacity Multi-Node Hosting',
-                'recovery_info': 'Auto-recovery enabled',
-                'token': bot_info['token'] if bot_info else ''
-            }
-            
-            metadata_str = json.dumps(metadata, indent=4)
-            zipf.writestr('metadata.json', metadata_str)
-            
-            # Add bot logs if exist
-            log_file = Path(Config.LOGS_DIR) / f"bot_{bot_id}.log"
-            if log_file.exists():
-                zipf.write(log_file, arcname='bot_logs.log')
+        zip_filename, zip_path, size_kb = write_bot_export(bot_id, bot_name, filename, user_id)
         
         # Save backup record
-        size_kb = zip_path.stat().st_size / 1024
         created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         execute_db("INSERT INTO bot_backups (bot_id, backup_name, backup_path, created_at, size_kb) VALUES (?, ?, ?, ?, ?)",
                   (bot_id, zip_filename, str(zip_path), created_at, size_kb), commit=True)
@@ -430,6 +588,37 @@ def extract_bot_username_from_file(filename):
         logger.error(f"Error extracting username: {e}")
         return None
 
+@traced('io', 'analyze')
+def analyze_upload(message, filename):
+    """Check an uploaded script and start fetching its libraries.
+
+    Returns the analysis, or None after telling the user about a syntax
+    error (the file is removed so they can upload a fixed one).
+    """
+    file_path = project_path / filename
+    try:
+        result = analyze_file(file_path)
+    except Exception as e:
+        logger.error(f"Analysis error for {filename}: {e}")
+        return None
+    
+    if not result.ok:
+        file_path.unlink(missing_ok=True)
+        compiled_path(file_path).unlink(missing_ok=True)
+        line = f" (line {result.line})" if result.line else ""
+        bot.reply_to(message, f"""
+❌ **Syntax Error{line}**
+━━━━━━━━━━━━━━━━━━━━
+`{str(result.error)[:200]}`
+━━━━━━━━━━━━━━━━━━━━
+Fix the file and upload it again.
+        """)
+        return None
+    
+    if result.requirements:
+        executor.submit(deps.prefetch, result.requirements)
+    return result
+
 def get_bot_backups(bot_id):
     """Get all backups for a bot"""
     backups = execute_db("SELECT * FROM bot_backups WHERE bot_id=? ORDER BY id DESC", (bot_id,), fetchall=True)
@@ -437,31 +626,33 @@ def get_bot_backups(bot_id):
 
 def create_bot_backup(bot_id):
     """Create a backup for a bot"""
-    bot_info = execute_db("SELECT * FROM deployments WHERE id=?", (bot_id,), fetchone=True)
+    bot_info = dal.deployment(bot_id, 'backup')
     if not bot_info:
         return None
     
-    return create_zip_file(bot_id, bot_info['bot_name'], bot_info['filename'], bot_info['user_id'])
+    return create_zip_file(bot_id, bot_info.bot_name, bot_info.filename, bot_info.user_id)
 
 def ban_bot(bot_id):
     """Ban a bot"""
-    bot_info = execute_db("SELECT * FROM deployments WHERE id=?", (bot_id,), fetchone=True)
+    bot_info = dal.deployment(bot_id, 'control')
     if not bot_info:
         return False
     
     # Stop bot if running
-    if bot_info['pid']:
+    if not stop_on_node(bot_info.id, bot_info.node_id) and bot_info['pid'] and bot_info.node_id not in node_clients:
         try:
             os.kill(bot_info['pid'], signal.SIGTERM)
         except:
             pass
     
-    execute_db("UPDATE deployments SET status='Banned', is_banned=1, updated_at=? WHERE id=?", 
+    execute_db("UPDATE deployments SET status='Banned', is_banned=1, pid=0, updated_at=? WHERE id=?", 
               (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), bot_id), commit=True)
     
     # Update node load
-    if bot_info['node_id']:
+    was_running = bot_info['node_id'] and bot_info['status'] == 'Running'
+    if was_running:
         execute_db("UPDATE nodes SET current_load=current_load-1 WHERE id=?", (bot_info['node_id'],), commit=True)
+    emit_deployment(bot_id, 'Banned', bot_info['node_id'], -1 if was_running else 0)
     
     return True
 
@@ -469,6 +660,7 @@ def unban_bot(bot_id):
     """Unban a bot"""
     execute_db("UPDATE deployments SET status='Stopped', is_banned=0, updated_at=? WHERE id=?", 
               (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), bot_id), commit=True)
+    emit_deployment(bot_id, 'Stopped')
     return True
 
 def visit_bot_user(bot_info):
@@ -482,6 +674,17 @@ def visit_bot_user(bot_info):
     
     return f"https://t.me/{username.lstrip('@')}"
 
+def send_notification(user_id, message):
+    """Queue a notification for a user"""
+    notification_store.send(user_id, message)
+
+def clear_notifications(call):
+    """Mark all notifications of the calling user as read"""
+    if notification_store.mark_all_read(call.from_user.id):
+        bot.answer_callback_query(call.id, "✅ All notifications marked as read!")
+    else:
+        bot.answer_callback_query(call.id, "❌ Failed to clear notifications!")
+
 # Keyboard Functions
 def get_main_keyboard(user_id):
     """Get main menu keyboard"""
@@ -537,7 +740,8 @@ def get_admin_keyboard():
         "📊 System Info",
         "🔔 Broadcast",
         "🔄 Cleanup",
-        "🚫 Banned Bots"
+        "🚫 Banned Bots",
+        "⚡ Bulk Actions"
     ]
     
     for i in range(0, len(buttons), 2):
@@ -662,6 +866,8 @@ def handle_commands(message):
         execute_db("INSERT OR IGNORE INTO users (id, username, expiry, file_limit, is_prime, join_date, last_renewal, last_active, bot_username) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", 
                   (uid, username, None, 1, 0, join_date, None, join_date, username), commit=True)
         user = get_user(uid)
+        if user:
+            events.emit('user', id=uid)
     
     clear_user_session(uid)
     cleanup_old_messages(uid)
@@ -677,12 +883,7 @@ def handle_commands(message):
         expiry_msg = f"{prime_status['days_left']} days left"
         plan = "Prime"
     
-    unread_notifications = execute_db("SELECT COUNT(*) FROM notifications WHERE user_id=? AND is_read=0", 
-                                     (uid,), fetchone=True)
-    if unread_notifications:
-        unread_notifications = unread_notifications[0] or 0
-    else:
-        unread_notifications = 0
+    unread_notifications = notification_store.unread_count(uid)
     
     text = f"""
 🤖 **ZEN X HOST BOT v3.3.2**
@@ -727,6 +928,402 @@ Select an option from the keyboard below:
     else:
         bot.reply_to(message, "⛔ **Access Denied!**")
 
+@bot.message_handler(commands=['throttled'])
+def handle_throttled(message):
+    """Show bots that hit their plan's resource limits"""
+    uid = message.from_user.id
+    if uid != Config.ADMIN_ID:
+        bot.reply_to(message, "⛔ **Access Denied!**")
+        return
+    
+    throttled = supervisor.throttled()
+    if not throttled:
+        bot.reply_to(message, "✅ **No bots have been throttled.**")
+        return
+    
+    text = f"""
+⚠️ **THROTTLED BOTS**
+━━━━━━━━━━━━━━━━━━━━
+Total: {len(throttled)}
+━━━━━━━━━━━━━━━━━━━━
+"""
+    for bot_id, events in sorted(throttled.items(), key=lambda item: item[1][-1][0], reverse=True)[:20]:
+        timestamp, reason, detail = events[-1]
+        text += f"• Bot `{bot_id}`: {reason} - {detail} ({datetime.fromtimestamp(timestamp).strftime('%H:%M:%S')}, {len(events)}x)\n"
+    
+    bot.reply_to(message, text)
+
+@bot.message_handler(commands=['lockprof'])
+def handle_lockprof(message):
+    """Switch db_lock profiling and show the most contended call sites"""
+    uid = message.from_user.id
+    if uid != Config.ADMIN_ID:
+        bot.reply_to(message, "⛔ **Access Denied!**")
+        return
+    
+    parts = message.text.split()
+    command = parts[1].lower() if len(parts) > 1 else None
+    if command in ('on', 'off'):
+        db_lock.set_enabled(command == 'on')
+        bot.reply_to(message, f"🔒 Lock profiling **{command.upper()}** (web workers follow within a few seconds)")
+        return
+    if command == 'reset':
+        db_lock.reset()
+        bot.reply_to(message, "🔒 Lock profile reset.")
+        return
+    
+    report = db_lock.report(top=8)
+    text = f"""
+🔒 **DB LOCK PROFILE**
+━━━━━━━━━━━━━━━━━━━━
+**Status:** {'ON' if report['enabled'] else 'OFF'} since {datetime.fromtimestamp(report['since']).strftime('%H:%M:%S')}
+**Acquisitions:** {report['acquisitions']} ({report['contended']} contended)
+**Total wait:** {report['wait_total_ms']:.1f} ms
+**Total hold:** {report['hold_total_ms']:.1f} ms
+━━━━━━━━━━━━━━━━━━━━
+"""
+    for i, site in enumerate(report['sites'], 1):
+        text += (f"{i}. `{site['site'][:80]}`\n"
+                 f"   wait {site['wait_total_ms']:.1f} ms (max {site['wait_max_ms']:.1f}), "
+                 f"hold avg {site['hold_avg_ms']:.2f} ms, {site['count']}x\n")
+    if not report['sites']:
+        text += "No samples yet. Use `/lockprof on` to start profiling.\n"
+    bot.reply_to(message, text)
+
+def format_trace_line(trace):
+    """One-line span breakdown of a finished trace"""
+    parts = [f"{category} {seconds * 1000:.1f}ms" + (f" ({count})" if category != 'handler' else '')
+             for category, seconds, count in trace.breakdown()]
+    return " · ".join(parts)
+
+@bot.message_handler(commands=['traces'])
+def handle_traces(message):
+    """Slowest recent updates broken down by span, or one trace in detail"""
+    uid = message.from_user.id
+    if uid != Config.ADMIN_ID:
+        bot.reply_to(message, "⛔ **Access Denied!**")
+        return
+    
+    parts = message.text.split()
+    arg = parts[1] if len(parts) > 1 else None
+    
+    if arg and not arg.isdigit():
+        trace = tracer.find(arg)
+        if not trace:
+            bot.reply_to(message, "❌ Trace not found (it may have left the buffer).")
+            return
+        text = f"""
+🔎 **TRACE** `{trace.trace_id}`
+━━━━━━━━━━━━━━━━━━━━
+**Update:** {trace.kind}
+**User:** `{trace.user_id}`
+**Time:** {datetime.fromtimestamp(trace.started_at).strftime('%H:%M:%S')}
+**Total:** {trace.duration * 1000:.0f} ms{f" ({trace.error})" if trace.error else ""}
+━━━━━━━━━━━━━━━━━━━━
+{format_trace_line(trace)}
+━━━━━━━━━━━━━━━━━━━━
+"""
+        for s in trace.spans[:30]:
+            offset = (s.start - trace.start) * 1000
+            text += f"`+{offset:6.0f}ms` {'  ' * s.depth}{s.category}:{s.name} {s.duration * 1000:.1f}ms\n"
+        hidden = max(len(trace.spans) - 30, 0) + trace.dropped
+        if hidden:
+            text += f"... {hidden} more spans\n"
+        bot.reply_to(message, text)
+        return
+    
+    limit = min(int(arg), 15) if arg else 5
+    traces = tracer.slowest(limit)
+    if not traces:
+        bot.reply_to(message, "🔎 No traced updates yet.")
+        return
+    
+    text = f"""
+🐢 **SLOWEST RECENT UPDATES**
+━━━━━━━━━━━━━━━━━━━━
+Buffer: last {len(tracer.buffer)} updates
+━━━━━━━━━━━━━━━━━━━━
+"""
+    for i, trace in enumerate(traces, 1):
+        text += (f"{i}. **{trace.kind}** {trace.duration * 1000:.0f} ms - user `{trace.user_id}`, "
+                 f"{datetime.fromtimestamp(trace.started_at).strftime('%H:%M:%S')} `{trace.trace_id}`\n"
+                 f"   {format_trace_line(trace)}\n")
+    text += "\nUse `/traces <id>` for the span timeline."
+    bot.reply_to(message, text)
+
+@bot.message_handler(commands=['profile'])
+def handle_profile(message):
+    """Sample every thread's stack for a few seconds and send a collapsed-stack file"""
+    uid = message.from_user.id
+    if uid != Config.ADMIN_ID:
+        bot.reply_to(message, "⛔ **Access Denied!**")
+        return
+    
+    parts = message.text.split()
+    try:
+        seconds = int(parts[1]) if len(parts) > 1 else Config.PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        bot.reply_to(message, f"Usage: `/profile [seconds]` (1-{Config.PROFILE_MAX_SECONDS})")
+        return
+    seconds = max(1, min(seconds, Config.PROFILE_MAX_SECONDS))
+    
+    status_msg = bot.reply_to(message, f"🔬 Sampling all threads for {seconds}s...")
+    
+    def done(profile, error):
+        if error:
+            edit_or_send_message(message.chat.id, status_msg.message_id, f"❌ Profiling failed: {error}")
+            return
+        
+        text = f"""
+🔬 **PROFILE**
+━━━━━━━━━━━━━━━━━━━━
+**Duration:** {profile.duration:.1f}s
+**Samples:** {profile.samples} ({len(profile.stacks)} distinct stacks)
+**Sampler overhead:** {profile.overhead * 100:.2f}%
+**Idle threads:** {profile.idle_share * 100:.0f}% of thread samples
+━━━━━━━━━━━━━━━━━━━━
+**Top busy functions (self / total samples):**
+"""
+        for frame, own, total in profile.top_functions(8):
+            text += f"• `{frame[:70]}` {own} / {total}\n"
+        if profile.truncated:
+            text += "\n⚠️ Stack table full; rare stacks grouped as [other].\n"
+        edit_or_send_message(message.chat.id, status_msg.message_id, text)
+        
+        collapsed = profile.collapsed().encode()
+        name = f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.collapsed.txt"
+        try:
+            bot.send_document(message.chat.id, collapsed, visible_file_name=name,
+                             caption="🔥 Collapsed stacks - open with speedscope or flamegraph.pl")
+        except Exception as e:
+            logger.error(f"Error sending profile: {e}")
+    
+    # Own thread rather than the shared executor, which it would tie up
+    StackSampler(Config.PROFILE_INTERVAL).start(seconds, done)
+
+@bot.message_handler(commands=['export'])
+def handle_export(message):
+    """Send users, deployments or bot logs as a gzipped NDJSON or CSV file"""
+    uid = message.from_user.id
+    if uid != Config.ADMIN_ID:
+        bot.reply_to(message, "⛔ **Access Denied!**")
+        return
+    
+    parts = message.text.split()[1:]
+    usage = (f"Usage: `/export <{'|'.join(EXPORTS)}> [csv] [filter=value ...]`\n"
+             f"e.g. `/export deployments status=Running,Crashed node=2 since=2024-01-01`\n"
+             f"`after=<id>` resumes a cut-off export")
+    if not parts:
+        bot.reply_to(message, usage)
+        return
+    args = {}
+    for part in parts[1:]:
+        key, sep, value = part.partition('=')
+        if sep:
+            args[key] = value
+        else:
+            args['format'] = key
+    try:
+        spec = parse_export(parts[0], args)
+    except ExportError as e:
+        bot.reply_to(message, f"❌ {e}\n\n{usage}")
+        return
+    
+    status_msg = bot.reply_to(message, f"⏳ Exporting {spec.name}...")
+    
+    def run():
+        last = {'id': None, 'rows': 0}
+        
+        def tracked(rows):
+            for row in rows:
+                last['id'] = row[0]
+                last['rows'] += 1
+                yield row
+        
+        truncated = False
+        try:
+            with tempfile.TemporaryFile() as raw:
+                with gzip.open(raw, 'wt', encoding='utf-8', newline='') as out:
+                    # The encoder yields only whole rows, so last['id'] is always a clean resume point
+                    for chunk in encode_export(tracked(iter_rows(get_db, db_lock, spec)), spec):
+                        out.write(chunk)
+                        if raw.tell() >= Config.EXPORT_MAX_BYTES:
+                            truncated = True
+                            break
+                size = raw.tell()
+                raw.seek(0)
+                text = f"""
+🗄️ **EXPORT: {spec.name.upper()}**
+━━━━━━━━━━━━━━━━━━━━
+**Rows:** {last['rows']}
+**Size:** {size / 1024:.1f} KB gzipped
+"""
+                if truncated:
+                    text += f"\n⚠️ Cut off at the upload limit. Continue with `after={last['id']}`.\n"
+                edit_or_send_message(message.chat.id, status_msg.message_id, text)
+                bot.send_document(message.chat.id, raw, visible_file_name=spec.filename + '.gz')
+        except Exception as e:
+            logger.error(f"Export of {spec.name} failed: {e}")
+            edit_or_send_message(message.chat.id, status_msg.message_id, f"❌ Export failed: {e}")
+    
+    executor.submit(run)
+
+@bot.message_handler(commands=['rebalance'])
+def handle_rebalance(message):
+    """Reconcile node counters and run one rebalancing round now"""
+    uid = message.from_user.id
+    if uid != Config.ADMIN_ID:
+        bot.reply_to(message, "⛔ **Access Denied!**")
+        return
+    
+    status_msg = bot.reply_to(message, "⏳ Rebalancing nodes...")
+    
+    def run():
+        result = rebalancer.run()
+        if result is None:
+            edit_or_send_message(message.chat.id, status_msg.message_id, "⏳ A rebalance is already running.")
+            return
+        emit_rebalance(result)
+        
+        text = f"""
+⚖️ **NODE REBALANCE**
+━━━━━━━━━━━━━━━━━━━━
+🔧 **Counters corrected:** {len(result['drift'])}
+📦 **Moves planned:** {len(result['planned'])}
+✅ **Succeeded:** {len(result['succeeded'])}
+❌ **Failed:** {len(result['failed'])}
+━━━━━━━━━━━━━━━━━━━━
+"""
+        for node_id, (stored, actual) in result['drift'].items():
+            text += f"• Node {node_id}: {stored} → {actual}\n"
+        for move in result['succeeded'][:15]:
+            text += f"• Bot `{move.bot_id}`: Node {move.source} → Node {move.target}\n"
+        for move in result['failed'][:10]:
+            text += f"• Bot `{move.bot_id}` failed: {move.error}\n"
+        edit_or_send_message(message.chat.id, status_msg.message_id, text)
+    
+    executor.submit(run)
+
+@bot.message_handler(commands=['wake'])
+def handle_wake(message):
+    """List the user's hibernated bots with wake buttons"""
+    uid = message.from_user.id
+    hibernated = execute_db("""
+        SELECT d.id, d.bot_name, h.hibernated_at 
+        FROM deployments d JOIN hibernation h ON h.deployment_id = d.id 
+        WHERE d.user_id=? AND d.status='Hibernated' 
+        ORDER BY h.hibernated_at DESC
+    """, (uid,), fetchall=True) or []
+    if not hibernated:
+        bot.reply_to(message, "✅ **None of your bots are hibernated.**")
+        return
+    
+    markup = types.InlineKeyboardMarkup()
+    text = f"""
+😴 **HIBERNATED BOTS**
+━━━━━━━━━━━━━━━━━━━━
+Total: {len(hibernated)}
+━━━━━━━━━━━━━━━━━━━━
+"""
+    for row in hibernated:
+        text += f"• {row['bot_name']} (since {row['hibernated_at']})\n"
+        markup.add(types.InlineKeyboardButton(f"☀️ Wake {row['bot_name']}", callback_data=f"wake_{row['id']}"))
+    
+    bot.reply_to(message, text, reply_markup=markup)
+
+BULK_USAGE = """
+⚡ **BULK ACTIONS**
+━━━━━━━━━━━━━━━━━━━━
+`/bulk <action> <target>`
+━━━━━━━━━━━━━━━━━━━━
+**Actions:** stop, restart, ban, unban, delete, backup
+**Target:**
+• `user:<user id>` - all bots of a user
+• `node:<node id>` - all bots on a node
+• `12,15,20` - selected bot IDs
+━━━━━━━━━━━━━━━━━━━━
+Example: `/bulk ban user:123456789`
+"""
+
+@bot.message_handler(func=lambda message: message.text == "⚡ Bulk Actions")
+def handle_bulk_actions(message):
+    if message.from_user.id != Config.ADMIN_ID:
+        return
+    bot.reply_to(message, BULK_USAGE)
+
+@bot.message_handler(commands=['bulk'])
+def handle_bulk(message):
+    """Preview a bulk action and ask for confirmation"""
+    uid = message.from_user.id
+    if uid != Config.ADMIN_ID:
+        bot.reply_to(message, "⛔ **Access Denied!**")
+        return
+    
+    parts = message.text.split(maxsplit=2)
+    if len(parts) < 3 or parts[1].lower() not in BULK_ACTIONS:
+        bot.reply_to(message, BULK_USAGE)
+        return
+    action = parts[1].lower()
+    try:
+        selector = parse_selector(parts[2])
+    except BulkError as e:
+        bot.reply_to(message, f"❌ {e}")
+        return
+    
+    targets = bulk_ops.targets(selector)
+    if not targets:
+        bot.reply_to(message, "❌ No bots match that target.")
+        return
+    
+    running = sum(1 for t in targets if t.status == 'Running')
+    banned = sum(1 for t in targets if t.is_banned == 1)
+    text = f"""
+⚠️ **CONFIRM BULK {action.upper()}**
+━━━━━━━━━━━━━━━━━━━━
+🎯 **Target:** {describe_selector(selector)}
+🤖 **Bots:** {len(targets)} ({running} running, {banned} banned)
+━━━━━━━━━━━━━━━━━━━━
+"""
+    for t in targets[:10]:
+        text += f"• `{t.id}` {t.bot_name} - {t.status}\n"
+    if len(targets) > 10:
+        text += f"• ... and {len(targets) - 10} more\n"
+    
+    set_user_session(uid, {'state': 'bulk_confirm', 'bulk_action': action, 'bulk_selector': selector})
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    markup.add(
+        types.InlineKeyboardButton(f"✅ Yes, {action.title()}", callback_data="bulk_go"),
+        types.InlineKeyboardButton("❌ Cancel", callback_data="cancel")
+    )
+    bot.reply_to(message, text, reply_markup=markup)
+
+def run_bulk_action(call):
+    """Execute the bulk action confirmed in the admin's session"""
+    uid = call.from_user.id
+    if uid != Config.ADMIN_ID:
+        bot.answer_callback_query(call.id, "⛔ Access Denied!")
+        return
+    session = get_user_session(uid)
+    if session.get('state') != 'bulk_confirm':
+        bot.answer_callback_query(call.id, "❌ Nothing to run!")
+        return
+    clear_user_session(uid)
+    
+    action, selector = session['bulk_action'], session['bulk_selector']
+    bot.answer_callback_query(call.id, "⏳ Running...")
+    edit_or_send_message(call.message.chat.id, call.message.message_id,
+                         f"⏳ Running bulk {action} on {describe_selector(selector)}...")
+    
+    def run():
+        try:
+            text = format_bulk_result(run_bulk(action, selector))
+        except Exception as e:
+            logger.error(f"Bulk {action} failed: {e}")
+            text = f"❌ Bulk {action} failed: {e}"
+        edit_or_send_message(call.message.chat.id, call.message.message_id, text)
+    
+    executor.submit(run)
+
 # New feature: Backup/Restore handler
 @bot.message_handler(func=lambda message: message.text == "💾 Backup/Restore")
 def handle_backup_restore(message):
@@ -765,13 +1362,7 @@ def handle_banned_bots(message):
     
     last_msg_id = user_message_history.get(uid, [None])[-1] if user_message_history.get(uid) else None
     
-    banned_bots = execute_db("""
-        SELECT d.*, u.username as user_username 
-        FROM deployments d 
-        LEFT JOIN users u ON d.user_id = u.id 
-        WHERE d.is_banned = 1 
-        ORDER BY d.id DESC
-    """, fetchall=True) or []
+    banned_bots = dal.all_deployments('admin_list', banned_only=True)
     
     if not banned_bots:
         text = "🚫 **No banned bots found.**"
@@ -869,6 +1460,10 @@ def handle_document(message):
 ━━━━━━━━━━━━━━━━━━━━
                 """)
                 
+                analysis = analyze_upload(message, safe_name)
+                if analysis is None:
+                    return
+                
                 # Extract bot token and username
                 bot_token = extract_bot_token_from_file(safe_name)
                 bot_username = extract_bot_username_from_file(safe_name)
@@ -878,7 +1473,9 @@ def handle_document(message):
                     'filename': safe_name,
                     'original_name': f"{original_name} (extracted: {py_file.name})",
                     'bot_token': bot_token,
-                    'bot_username': bot_username
+                    'bot_username': bot_username,
+                    'requirements': analysis.requirements,
+                    'imports': analysis.imports
                 })
                 
                 msg = bot.send_message(message.chat.id, f"""
@@ -892,6 +1489,8 @@ Example: `News Bot`, `Music Bot`, `Assistant`
 Detected Info:
 • Token: {'✅ Found' if bot_token else '❌ Not found'}
 • Username: {bot_username or 'Not found'}
+• Libraries: {', '.join(analysis.requirements) or 'None'}
+• Unverified: {', '.join(analysis.suggested) or 'None'}{' (confirm via Install Libraries)' if analysis.suggested else ''}
 ━━━━━━━━━━━━━━━━━━━━
                 """)
                 update_message_history(uid, msg.message_id)
@@ -911,6 +1510,10 @@ Detected Info:
         file_path = project_path / safe_name
         file_path.write_bytes(downloaded)
         
+        analysis = analyze_upload(message, safe_name)
+        if analysis is None:
+            return
+        
         # Extract bot token and username
         bot_token = extract_bot_token_from_file(safe_name)
         bot_username = extract_bot_username_from_file(safe_name)
@@ -920,7 +1523,9 @@ Detected Info:
             'filename': safe_name,
             'original_name': original_name,
             'bot_token': bot_token,
-            'bot_username': bot_username
+            'bot_username': bot_username,
+            'requirements': analysis.requirements,
+            'imports': analysis.imports
         })
         
         msg = bot.send_message(message.chat.id, f"""
@@ -934,6 +1539,8 @@ Example: `News Bot`, `Music Bot`, `Assistant`
 Detected Info:
 • Token: {'✅ Found' if bot_token else '❌ Not found'}
 • Username: {bot_username or 'Not found'}
+• Libraries: {', '.join(analysis.requirements) or 'None'}
+• Unverified: {', '.join(analysis.suggested) or 'None'}{' (confirm via Install Libraries)' if analysis.suggested else ''}
 ━━━━━━━━━━━━━━━━━━━━
         """)
         update_message_history(uid, msg.message_id)
@@ -997,17 +1604,28 @@ def handle_backup_upload(message):
                         bot_username = metadata.get('bot_username', '')
                         token = metadata.get('token', '')
                         
-                        execute_db("""
-                            INSERT INTO deployments 
-                            (user_id, bot_name, filename, pid, start_time, status, last_active, 
-                             auto_restart, created_at, updated_at, bot_username, token, metadata) 
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """, (
-                            uid, bot_name, filename, 0, None, "Uploaded", created_at, 
-                            1, created_at, created_at, bot_username, token, metadata_str
-                        ), commit=True)
+                        with db_lock:
+                            conn = get_db()
+                            try:
+                                c = conn.cursor()
+                                c.execute("""
+                                    INSERT INTO deployments 
+                                    (user_id, bot_name, filename, pid, start_time, status, last_active, 
+                                     auto_restart, created_at, updated_at, bot_username, token) 
+                                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                                """, (
+                                    uid, bot_name, filename, 0, None, "Uploaded", created_at, 
+                                    1, created_at, created_at, bot_username, token
+                                ))
+                                new_bot_id = c.lastrowid
+                                c.execute("INSERT INTO deployment_metadata (deployment_id, metadata) VALUES (?, ?)",
+                                          (new_bot_id, metadata_str))
+                                conn.commit()
+                            finally:
+                                conn.close()
                         
                         update_user_bot_count(uid)
+                        emit_deployment(new_bot_id, 'Uploaded')
                         
                         text = f"""
 ✅ **BOT RESTORED SUCCESSFULLY**
@@ -1056,19 +1674,29 @@ def process_bot_name_input(message):
     bot_token = session.get('bot_token', '')
     bot_username = session.get('bot_username', '')
     
-    # Save to database
+    # Save to database, with the libraries found at upload time
     created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    execute_db("""
-        INSERT INTO deployments 
-        (user_id, bot_name, filename, pid, start_time, status, last_active, 
-         auto_restart, created_at, updated_at, bot_username, token) 
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        uid, bot_name, filename, 0, None, "Uploaded", created_at, 
-        1, created_at, created_at, bot_username, bot_token
-    ), commit=True)
+    with db_lock:
+        conn = get_db()
+        try:
+            cursor = conn.execute("""
+                INSERT INTO deployments 
+                (user_id, bot_name, filename, pid, start_time, status, last_active, 
+                 auto_restart, created_at, updated_at, bot_username, token) 
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                uid, bot_name, filename, 0, None, "Uploaded", created_at, 
+                1, created_at, created_at, bot_username, bot_token
+            ))
+            conn.execute("INSERT OR REPLACE INTO deployment_deps (deployment_id, requirements, imports, analyzed_at) VALUES (?, ?, ?, ?)",
+                         (cursor.lastrowid, json.dumps(session.get('requirements', [])),
+                          json.dumps(session.get('imports', [])), created_at))
+            conn.commit()
+        finally:
+            conn.close()
     
     update_user_bot_count(uid)
+    emit_deployment(cursor.lastrowid, 'Uploaded')
     
     clear_user_session(uid)
     
@@ -1095,8 +1723,100 @@ def process_bot_name_input(message):
     edit_or_send_message(chat_id, None, text, reply_markup=markup)
     send_notification(uid, f"Bot '{bot_name}' uploaded successfully!")
 
+def ask_for_libraries(call):
+    uid = call.from_user.id
+    chat_id = call.message.chat.id
+    
+    bot_info = execute_db("SELECT id, bot_name FROM deployments WHERE user_id=? ORDER BY id DESC LIMIT 1",
+                          (uid,), fetchone=True)
+    if not bot_info:
+        bot.answer_callback_query(call.id, "❌ Upload a bot first!")
+        return
+    
+    set_user_session(uid, {'libs_bot_id': bot_info['id']})
+    detected = dal.load_requirements(bot_info['id'])
+    # Import names with no known distribution; the PyPI name is only a guess
+    unverified = sorted({distribution_for(name) for name in dal.load_imports(bot_info['id'])
+                         if not distribution_for(name, guess=False)})
+    text = f"""
+📚 **INSTALL LIBRARIES**
+━━━━━━━━━━━━━━━━━━━━
+🤖 **Bot:** {bot_info['bot_name']}
+🔍 **Detected:** {', '.join(f'`{r}`' for r in detected) or 'None'}
+❔ **Unverified:** {', '.join(f'`{r}`' for r in unverified) or 'None'}
+
+Send the packages your bot needs, separated by spaces, commas or new lines.
+Version pins are allowed, e.g. `requests>=2.28 aiohttp==3.9.1`
+
+`{', '.join(Config.BASE_PACKAGES)}` are always available.
+Type `cancel` to abort.
+━━━━━━━━━━━━━━━━━━━━
+"""
+    msg = bot.send_message(chat_id, text, parse_mode="Markdown")
+    bot.register_next_step_handler(msg, process_libraries_input)
+
+def process_libraries_input(message):
+    uid = message.from_user.id
+    chat_id = message.chat.id
+    
+    if not message.text or message.text.lower() == 'cancel':
+        clear_user_session(uid)
+        bot.reply_to(message, "❌ Cancelled.", reply_markup=get_main_keyboard(uid))
+        return
+    
+    session = get_user_session(uid)
+    bot_id = session.get('libs_bot_id')
+    if not bot_id:
+        bot.reply_to(message, "❌ Session expired. Please try again.")
+        return
+    
+    try:
+        requirements = parse_requirements(message.text)
+    except DependencyError as e:
+        bot.reply_to(message, f"❌ **{e}**\nUse package names with optional versions only.", parse_mode="Markdown")
+        return
+    if not requirements or len(requirements) > Config.MAX_LIBRARIES:
+        bot.reply_to(message, f"❌ Send between 1 and {Config.MAX_LIBRARIES} packages.")
+        return
+    
+    clear_user_session(uid)
+    status_msg = bot.reply_to(message, f"⏳ Installing {len(requirements)} package(s)...")
+    
+    def install():
+        start = time.time()
+        try:
+            deps.install(bot_id, requirements)
+        except DependencyError as e:
+            edit_or_send_message(chat_id, status_msg.message_id, f"❌ **Installation failed:** `{str(e)[:200]}`")
+            return
+        except Exception as e:
+            logger.error(f"Library install error for bot {bot_id}: {e}")
+            edit_or_send_message(chat_id, status_msg.message_id, "❌ Installation failed.")
+            return
+        
+        # Confirmed by the owner, so restarts rebuild the overlay from this set
+        execute_db("""INSERT INTO deployment_deps (deployment_id, requirements, analyzed_at) VALUES (?, ?, ?)
+                      ON CONFLICT(deployment_id) DO UPDATE SET requirements=excluded.requirements""",
+                   (bot_id, json.dumps(requirements), datetime.now().strftime('%Y-%m-%d %H:%M:%S')), commit=True)
+        installer.forget(bot_id)
+        
+        markup = types.InlineKeyboardMarkup()
+        markup.add(types.InlineKeyboardButton("🚀 Deploy Now", callback_data="deploy_new"))
+        text = f"""
+✅ **LIBRARIES INSTALLED**
+━━━━━━━━━━━━━━━━━━━━
+📦 {', '.join(f'`{r}`' for r in requirements)}
+⏱️ **Time:** {time.time() - start:.1f}s
+━━━━━━━━━━━━━━━━━━━━
+*Restart the bot to load new libraries.*
+"""
+        edit_or_send_message(chat_id, status_msg.message_id, text, reply_markup=markup)
+    
+    executor.submit(install)
+
 # Callback Query Handler with new features
 @bot.callback_query_handler(func=lambda call: True)
+@timed_callback
 def callback_manager(call):
     uid = call.from_user.id
     chat_id = call.message.chat.id
@@ -1273,6 +1993,13 @@ def callback_manager(call):
             user_id = call.data.split("_")[1]
             reset_user_limit(call, user_id)
         
+        elif call.data.startswith("wake_"):
+            bot_id = call.data.split("_")[1]
+            wake_bot_action(call, bot_id)
+        
+        elif call.data == "bulk_go":
+            run_bulk_action(call)
+        
         elif call.data == "gen_key":
             if uid == Config.ADMIN_ID:
                 gen_key_step1(call)
@@ -1285,14 +2012,27 @@ def callback_manager(call):
         bot.answer_callback_query(call.id, "⚠️ Error occurred!")
 
 # New Feature Functions
+def wake_bot_action(call, bot_id):
+    """Wake a hibernated bot on its owner's request"""
+    uid = call.from_user.id
+    bot_info = dal.deployment(int(bot_id), 'hibernate')
+    if not bot_info or (bot_info.user_id != uid and uid != Config.ADMIN_ID):
+        bot.answer_callback_query(call.id, "❌ Bot not found!")
+        return
+    if bot_info.status != 'Hibernated':
+        bot.answer_callback_query(call.id, f"ℹ️ Bot is {bot_info.status}")
+        return
+    
+    if wake_bot(bot_info.id):
+        bot.answer_callback_query(call.id, "☀️ Bot is awake!")
+        edit_or_send_message(call.message.chat.id, call.message.message_id,
+                             f"☀️ **{bot_info.bot_name}** is running again.")
+    else:
+        bot.answer_callback_query(call.id, "❌ Could not wake the bot!")
+
 def show_admin_bot_details(call, bot_id):
     """Show bot details for admin with extra options"""
-    bot_info = execute_db("""
-        SELECT d.*, u.username as user_username, u.id as user_id 
-        FROM deployments d 
-        LEFT JOIN users u ON d.user_id = u.id 
-        WHERE d.id=?
-    """, (bot_id,), fetchone=True)
+    bot_info = dal.deployment_with_owner(bot_id, 'detail')
     
     if not bot_info:
         bot.answer_callback_query(call.id, "❌ Bot not found!")
@@ -1305,6 +2045,7 @@ def show_admin_bot_details(call, bot_id):
     status = bot_info['status']
     node_id = bot_info['node_id']
     restart_count = bot_info['restart_count']
+    hang_restart_count = bot_info['hang_restart_count'] or 0
     auto_restart = bot_info['auto_restart']
     created_at = bot_info['created_at']
     bot_username = bot_info['bot_username']
@@ -1335,7 +2076,7 @@ def show_admin_bot_details(call, bot_id):
 📊 **Statistics:**
 • PID: `{pid if pid else "N/A"}`
 • Uptime: {calculate_uptime(start_time) if start_time else "N/A"}
-• Restarts: {restart_count}
+• Restarts: {restart_count} (+{hang_restart_count} hang)
 • Auto-Restart: {'Yes' if auto_restart == 1 else 'No'}
 ━━━━━━━━━━━━━━━━━━━━
 """
@@ -1449,7 +2190,7 @@ Click the button below to visit the bot:
 
 def show_bot_info(call, bot_id):
     """Show detailed bot information"""
-    bot_info = execute_db("SELECT * FROM deployments WHERE id=?", (bot_id,), fetchone=True)
+    bot_info = dal.deployment(bot_id, 'info')
     
     if not bot_info:
         bot.answer_callback_query(call.id, "❌ Bot not found!")
@@ -1462,6 +2203,7 @@ def show_bot_info(call, bot_id):
     token = bot_info['token']
     created_at = bot_info['created_at']
     restart_count = bot_info['restart_count']
+    hang_restart_count = bot_info['hang_restart_count'] or 0
     auto_restart = bot_info['auto_restart']
     
     # Check file size
@@ -1485,6 +2227,7 @@ def show_bot_info(call, bot_id):
 • File Size: {file_size:.2f} KB
 • Created: {created_at}
 • Restart Count: {restart_count}
+• Hang Restarts: {hang_restart_count}
 • Auto-Restart: {'Enabled ✅' if auto_restart == 1 else 'Disabled ❌'}
 • Last Backup: {last_backup}
 • Total Backups: {len(backups)}
@@ -1602,7 +2345,7 @@ def show_backup_menu(call, bot_id):
 def backup_all_bots(call):
     """Create backup of all user's bots"""
     uid = call.from_user.id
-    bots = get_user_bots(uid)
+    bots = dal.user_deployments(uid, 'bundle')
     
     if not bots:
         bot.answer_callback_query(call.id, "❌ No bots to backup!")
@@ -1610,37 +2353,51 @@ def backup_all_bots(call):
     
     bot.answer_callback_query(call.id, "⏳ Creating backups...")
     
-    # Create individual backups
-    backup_files = []
-    for bot_info in bots:
-        zip_path = create_bot_backup(bot_info['id'])
-        if zip_path:
-            backup_files.append(zip_path)
-    
-    if not backup_files:
-        bot.send_message(call.message.chat.id, "❌ Failed to create backups!")
-        return
-    
-    # Create master backup zip
-    export_dir = Path(Config.EXPORTS_DIR)
-    master_zip = export_dir / f"all_bots_backup_{uid}_{int(time.time())}.zip"
-    
-    with zipfile.ZipFile(master_zip, 'w', zipfile.ZIP_DEFLATED) as master_zipf:
-        for backup_file in backup_files:
-            master_zipf.write(backup_file, arcname=backup_file.name)
-    
-    # Send master backup
-    try:
-        with open(master_zip, 'rb') as f:
-            bot.send_document(call.message.chat.id, f,
-                             caption=f"📦 **All Bots Backup**\n\nTotal Bots: {len(backup_files)}\nDate: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\nSize: {master_zip.stat().st_size / 1024:.1f} KB")
-    except Exception as e:
-        logger.error(f"Error sending master backup: {e}")
+    # Build the master archive in one pass, straight into the backup directory;
+    # each bot's record points at the bundle and names its member in it
+    user_info = get_user(uid)
+    stamp = int(time.time())
+    master_name = f"all_bots_backup_{uid}_{stamp}.zip"
+    master_path = Path(Config.BACKUP_DIR) / master_name
+    master_path.parent.mkdir(exist_ok=True)
+    records = []
     
-    # Cleanup
-    master_zip.unlink(missing_ok=True)
-    for backup_file in backup_files:
-        backup_file.unlink(missing_ok=True)
+    with open(master_path, 'w+b') as archive:
+        try:
+            with span('io', 'zip_bundle'), BundleWriter(archive) as bundle:
+                for bot_info in bots:
+                    metadata = build_bot_metadata(bot_info.id, bot_info.bot_name, bot_info.filename,
+                                                  uid, bot_info, user_info)
+                    arcname = f"bot_export_{bot_info.id}_{stamp}.zip"
+                    log_file = Path(Config.LOGS_DIR) / f"bot_{bot_info.id}.log"
+                    size = bundle.add_bot(arcname, project_path / bot_info.filename, metadata, log_file)
+                    records.append((bot_info.id, arcname, str(master_path), size / 1024))
+        except Exception as e:
+            logger.error(f"Error creating master backup: {e}")
+            archive.close()
+            master_path.unlink(missing_ok=True)
+            bot.send_message(call.message.chat.id, "❌ Failed to create backups!")
+            return
+        
+        created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with db_lock:
+            conn = get_db()
+            try:
+                conn.executemany("INSERT INTO bot_backups (bot_id, backup_name, backup_path, created_at, size_kb) VALUES (?, ?, ?, ?, ?)",
+                                 [(bot_id, name, path, created_at, size_kb) for bot_id, name, path, size_kb in records])
+                conn.commit()
+            finally:
+                conn.close()
+        
+        # Send master backup from the file just written
+        archive.seek(0, os.SEEK_END)
+        size_kb = archive.tell() / 1024
+        archive.seek(0)
+        try:
+            bot.send_document(call.message.chat.id, archive, visible_file_name=master_name,
+                             caption=f"📦 **All Bots Backup**\n\nTotal Bots: {len(records)}\nDate: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\nSize: {size_kb:.1f} KB")
+        except Exception as e:
+            logger.error(f"Error sending master backup: {e}")
 
 def start_restore_process(call):
     """Start bot restoration process"""
@@ -1744,12 +2501,7 @@ Page: {page_num + 1}/{(len(bots) + per_page - 1) // per_page}
 
 def view_banned_bot(call, bot_id):
     """View details of a banned bot"""
-    bot_info = execute_db("""
-        SELECT d.*, u.username as user_username 
-        FROM deployments d 
-        LEFT JOIN users u ON d.user_id = u.id 
-        WHERE d.id=? AND d.is_banned=1
-    """, (bot_id,), fetchone=True)
+    bot_info = dal.deployment_with_owner(bot_id, 'detail', banned_only=True)
     
     if not bot_info:
         bot.answer_callback_query(call.id, "❌ Bot not found!")
@@ -1776,13 +2528,7 @@ def view_banned_bot(call, bot_id):
 
 def show_more_banned_bots(call):
     """Show more banned bots"""
-    banned_bots = execute_db("""
-        SELECT d.*, u.username as user_username 
-        FROM deployments d 
-        LEFT JOIN users u ON d.user_id = u.id 
-        WHERE d.is_banned = 1 
-        ORDER BY d.id DESC
-    """, fetchall=True) or []
+    banned_bots = dal.all_deployments('admin_list', banned_only=True)
     
     if len(banned_bots) <= 10:
         bot.answer_callback_query(call.id, "No more bots to show!")
@@ -1805,6 +2551,7 @@ Total Banned: {len(banned_bots)}
     bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup)
 
 # Existing functions (simplified for space)
+@traced('io', 'zip_extract')
 def extract_zip_file(zip_path, extract_dir):
     """Extract ZIP file"""
     try:
@@ -1859,8 +2606,502 @@ def get_process_stats(pid):
         logger.error(f"Error getting process stats for PID {pid}: {e}")
         return None
 
+# Bot Process Management
+def user_plan(user_id):
+    """Resource plan for a user's bots"""
+    return 'prime' if is_prime(user_id) else 'free'
+
+def pick_node():
+    """Least loaded active node with spare capacity"""
+    node = execute_db("""
+        SELECT id FROM nodes 
+        WHERE status='active' AND current_load < capacity 
+        ORDER BY current_load ASC, id ASC LIMIT 1
+    """, fetchone=True)
+    return node['id'] if node else None
+
+def bot_launch_spec(bot_info):
+    """Script, plan and library overlay for a deployment; a missing overlay is built in the background"""
+    bot_id = bot_info.id
+    script = project_path / bot_info.filename
+    if not script.exists():
+        logger.error(f"Bot file missing for bot {bot_id}: {script}")
+        return None
+    
+    overlay = deps.overlay_path(bot_info.id)
+    if not (overlay / 'zenx-deps.pth').exists():
+        # Never run pip on the supervisor thread: start on the base layer now,
+        # the next (auto-)restart picks the overlay up once it is built
+        requirements = dal.load_requirements(bot_info.id)
+        if requirements and installer.ensure(bot_info.id, requirements):
+            logger.info(f"Building library overlay for bot {bot_id} in the background")
+    site_dirs = [str(overlay.resolve())] if (overlay / 'zenx-deps.pth').exists() else None
+    return {'bot_id': bot_id, 'script': str(launch_target(script).resolve()),
+            'plan': user_plan(bot_info.user_id), 'site_dirs': site_dirs}
+
+def launch_bot(bot_info, node_id=None):
+    """Start a deployment's process without touching its database state"""
+    spec = bot_launch_spec(bot_info)
+    if spec is None:
+        return None
+    
+    client = node_clients.get(node_id)
+    if client is not None:
+        try:
+            result = client.start([spec])[0]
+        except AgentError as e:
+            logger.error(f"Node {node_id} agent unreachable for bot {bot_info.id}: {e}")
+            return None
+        if 'error' in result:
+            logger.error(f"Node {node_id} failed to start bot {bot_info.id}: {result['error']}")
+            return None
+        return RemoteBot(bot_info.id, result['pid'], result.get('start_ticks'), node_id)
+    
+    try:
+        return supervisor.launch(spec['bot_id'], spec['script'], spec['plan'],
+                                 env=watchdog.env_for(bot_info.id), site_dirs=spec['site_dirs'])
+    except Exception as e:
+        logger.error(f"Error launching bot {bot_info.id}: {e}")
+        return None
+
+def stop_on_node(bot_id, node_id):
+    """Stop a bot wherever it runs; True if it is no longer running"""
+    client = node_clients.get(node_id)
+    if client is None:
+        return supervisor.stop(bot_id)
+    try:
+        return client.stop([bot_id])[0]['stopped']
+    except AgentError as e:
+        logger.error(f"Node {node_id} agent unreachable while stopping bot {bot_id}: {e}")
+        return False
+
+def start_bot_process(bot_id):
+    """Launch a deployment under the supervisor and mark it Running"""
+    bot_info = dal.deployment(int(bot_id), 'launch')
+    if not bot_info or bot_info.is_banned == 1:
+        return None
+    
+    node_id = bot_info.node_id or pick_node()
+    managed = launch_bot(bot_info, node_id)
+    if managed is None:
+        bot_starts.labels('failed').inc()
+        return None
+    bot_starts.labels('ok').inc()
+    
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    with db_lock:
+        conn = get_db()
+        try:
+            conn.execute("UPDATE deployments SET pid=?, pid_start_ticks=?, start_time=?, status='Running', node_id=?, last_active=?, updated_at=? WHERE id=?",
+                         (managed.pid, managed.start_ticks, now, node_id, now, now, bot_info.id))
+            if node_id and bot_info.status != 'Running':
+                conn.execute("UPDATE nodes SET current_load=current_load+1, total_deployed=total_deployed+1 WHERE id=?", (node_id,))
+            conn.commit()
+        finally:
+            conn.close()
+    emit_deployment(bot_info.id, 'Running', node_id, 1 if bot_info.status != 'Running' else 0)
+    
+    return managed
+
+def stop_bot_process(bot_id, status='Stopped'):
+    """Stop a supervised deployment and release its node slot"""
+    bot_info = dal.deployment(int(bot_id), 'control')
+    if not bot_info:
+        return False
+    
+    stopped = stop_on_node(bot_info.id, bot_info.node_id)
+    watchdog.forget(bot_info.id)
+    idle_tracker.forget(bot_info.id)
+    
+    with db_lock:
+        conn = get_db()
+        try:
+            conn.execute("UPDATE deployments SET status=?, pid=0, updated_at=? WHERE id=?",
+                         (status, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), bot_info.id))
+            if bot_info.node_id and bot_info.status == 'Running':
+                conn.execute("UPDATE nodes SET current_load=current_load-1 WHERE id=?", (bot_info.node_id,))
+            conn.commit()
+        finally:
+            conn.close()
+    emit_deployment(bot_info.id, status, bot_info.node_id, -1 if bot_info.status == 'Running' else 0)
+    
+    return stopped
+
+def stop_group(node_id, bot_ids):
+    """Stop several bots on one node with a single signal round; {bot_id: stopped}"""
+    client = node_clients.get(node_id)
+    if client is None:
+        stopped = supervisor.stop_many(bot_ids, Config.HANG_KILL_GRACE)
+        # Bots the supervisor does not know about are not running here
+        result = {bot_id: stopped.get(bot_id, True) for bot_id in bot_ids}
+    else:
+        result = {r['bot_id']: r['stopped'] for r in client.stop(bot_ids, Config.HANG_KILL_GRACE)}
+        unknown = [bot_id for bot_id, stopped in result.items() if not stopped]
+        if unknown:
+            for r in client.status(unknown):
+                result[r['bot_id']] = not r['running']
+    for bot_id in bot_ids:
+        watchdog.forget(bot_id)
+        idle_tracker.forget(bot_id)
+    return result
+
+def bulk_launch(bot_info, node_id=None):
+    """Start one bot for a bulk restart on its assigned node; (pid, start_ticks, node_id)"""
+    launch_info = dal.deployment(bot_info.id, 'launch')
+    node_id = launch_info.node_id or node_id
+    managed = launch_bot(launch_info, node_id)
+    if managed is None:
+        raise BulkError("launch failed")
+    return managed.pid, managed.start_ticks, node_id
+
+def bulk_archive(bot_info):
+    return write_bot_export(bot_info.id, bot_info.bot_name, bot_info.filename, bot_info.user_id)
+
+# Bulk admin actions by selection, user or node
+bulk_ops = BulkOperations(Config.DB_NAME, db_lock, stop_group, launch=bulk_launch, archive=bulk_archive)
+
+def run_bulk(action, selector):
+    """Run a bulk action and do the per-bot follow-up outside the transaction"""
+    result = bulk_ops.run(action, selector)
+    done = [result.targets[bot_id] for bot_id in result.succeeded]
+    events.emit('bulk', action=action, succeeded=len(result.succeeded), failed=len(result.failed))
+    
+    if action == 'delete':
+        for bot_info in done:
+            script = project_path / bot_info.filename
+            script.unlink(missing_ok=True)
+            compiled_path(script).unlink(missing_ok=True)
+            deps.remove(bot_info.id)
+            installer.forget(bot_info.id)
+    
+    if action in ('ban', 'delete'):
+        # One notification per owner rather than one per bot
+        owners = {}
+        for bot_info in done:
+            owners.setdefault(bot_info.user_id, []).append(bot_info.bot_name)
+        verb = 'banned' if action == 'ban' else 'deleted'
+        for user_id, names in owners.items():
+            send_notification(user_id, f"{len(names)} of your bots were {verb} by admin: {', '.join(names[:10])}")
+    return result
+
+def format_bulk_result(result):
+    """Telegram summary of a BulkResult"""
+    text = f"""
+⚡ **BULK {result.action.upper()}**
+━━━━━━━━━━━━━━━━━━━━
+🎯 **Target:** {describe_selector(result.selector)} ({len(result.targets)} bots)
+✅ **Succeeded:** {len(result.succeeded)}
+❌ **Failed:** {len(result.failed)}
+⏭️ **Skipped:** {len(result.skipped)}
+⏱️ **Time:** {result.elapsed:.2f}s
+━━━━━━━━━━━━━━━━━━━━
+"""
+    for bot_id, error in list(result.failed.items())[:10]:
+        text += f"• Bot `{bot_id}`: {error}\n"
+    return text
+
+def run_bulk_jobs():
+    """Pick up bulk jobs queued through the web API"""
+    with db_lock:
+        conn = get_db()
+        try:
+            jobs = claim_jobs(conn)
+        finally:
+            conn.close()
+    
+    for job_id, action, selector in jobs:
+        executor.submit(run_bulk_job, job_id, action, selector)
+
+def run_bulk_job(job_id, action, selector):
+    try:
+        result, error = run_bulk(action, selector), None
+    except Exception as e:
+        logger.error(f"Bulk job {job_id} failed: {e}")
+        result, error = None, str(e)
+    with db_lock:
+        conn = get_db()
+        try:
+            finish_job(conn, job_id, result, error)
+        finally:
+            conn.close()
+
+def handle_bot_exit(bot_id, returncode, limit=None, hung=False):
+    """Record a bot exit and auto-restart it if enabled.
+
+    ``limit`` names the plan limit it was killed for; ``hung`` is set for
+    bots a node agent's watchdog killed.
+    """
+    bot_info = dal.deployment(bot_id, 'launch')
+    if not bot_info:
+        return
+    
+    hung = watchdog.consume(bot_id) or hung
+    idle_tracker.forget(bot_id)
+    limit = limit or limit_kill(returncode)
+    if hung:
+        status = 'Hung'
+    elif limit:
+        # Killed by a plan limit: not a crash, and restarting would only hit it again
+        status = 'Stopped'
+    else:
+        status = 'Stopped' if returncode == 0 else 'Crashed'
+    if bot_info.is_banned == 1:
+        # Banned while still alive (it outlived SIGKILL); keep the ban visible
+        status = 'Banned'
+    with db_lock:
+        conn = get_db()
+        try:
+            conn.execute("UPDATE deployments SET status=?, pid=0, updated_at=? WHERE id=?",
+                         (status, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), bot_id))
+            if bot_info.node_id and bot_info.status == 'Running':
+                conn.execute("UPDATE nodes SET current_load=current_load-1 WHERE id=?", (bot_info.node_id,))
+            conn.commit()
+        finally:
+            conn.close()
+    emit_deployment(bot_id, status, bot_info.node_id, -1 if bot_info.status == 'Running' else 0)
+    
+    logger.info(f"Bot {bot_id} exited with code {returncode}{' after hanging' if hung else ''}"
+                f"{f' at its {limit} limit' if limit else ''}")
+    bot_exits.labels(status).inc()
+    if limit:
+        send_notification(bot_info.user_id, f"⚠️ Your bot #{bot_id} was stopped for exceeding its plan's "
+                                            f"{LIMIT_DESCRIPTIONS.get(limit, limit)} limit. Start it again from My Bots.")
+    
+    if status != 'Stopped' and Config.AUTO_RESTART_BOTS and bot_info.auto_restart == 1 and bot_info.is_banned != 1:
+        # Hang restarts are counted apart from crash restarts
+        if hung:
+            write_buffer.add('deployments', bot_id, hang_restart_count=1)
+        else:
+            write_buffer.add('deployments', bot_id, restart_count=1)
+        start_bot_process(bot_id)
+
+def hibernate_bot(bot_id, rss_mb=None):
+    """Stop an idle bot and mark it Hibernated until it is woken"""
+    bot_info = dal.deployment(bot_id, 'hibernate')
+    if not bot_info or bot_info.status != 'Running':
+        return False
+    
+    stop_bot_process(bot_id, status='Hibernated')
+    
+    now = datetime.now()
+    wake_at = None
+    if Config.HIBERNATION_WAKE_AFTER:
+        wake_at = (now + timedelta(seconds=Config.HIBERNATION_WAKE_AFTER)).strftime('%Y-%m-%d %H:%M:%S')
+    execute_db("INSERT OR REPLACE INTO hibernation (deployment_id, hibernated_at, wake_at, rss_mb) VALUES (?, ?, ?, ?)",
+               (bot_id, now.strftime('%Y-%m-%d %H:%M:%S'), wake_at, rss_mb), commit=True)
+    
+    logger.info(f"Hibernated idle bot {bot_id} ({rss_mb or 0:.0f} MB)")
+    send_notification(bot_info.user_id, f"Bot '{bot_info.bot_name}' was hibernated after being idle. Use /wake to start it again.")
+    try:
+        markup = types.InlineKeyboardMarkup()
+        markup.add(types.InlineKeyboardButton("☀️ Wake Up", callback_data=f"wake_{bot_id}"))
+        bot.send_message(bot_info.user_id, f"""
+😴 **BOT HIBERNATED**
+━━━━━━━━━━━━━━━━━━━━
+🤖 **Bot:** {bot_info.bot_name}
+Your bot was idle for a long time and has been paused to save resources.
+Pending updates are kept by Telegram and handled when it wakes.
+━━━━━━━━━━━━━━━━━━━━
+""", reply_markup=markup, parse_mode="Markdown")
+    except Exception as e:
+        logger.error(f"Could not notify user {bot_info.user_id} about hibernation: {e}")
+    return True
+
+def wake_bot(bot_id):
+    """Restart a hibernated bot on its node"""
+    bot_info = dal.deployment(bot_id, 'hibernate')
+    if not bot_info or bot_info.status != 'Hibernated':
+        return None
+    
+    managed = start_bot_process(bot_id)
+    if managed:
+        execute_db("DELETE FROM hibernation WHERE deployment_id=?", (bot_id,), commit=True)
+        logger.info(f"Woke bot {bot_id}")
+    return managed
+
+def hibernate_idle_bots():
+    """Hibernate up to HIBERNATE_BATCH idle free-tier bots, largest first, on any node"""
+    cutoff = (datetime.now() - timedelta(seconds=Config.HIBERNATE_IDLE_SECONDS)).strftime('%Y-%m-%d %H:%M:%S')
+    hibernated = 0
+    for bot_id in idle_tracker.candidates():
+        if hibernated >= Config.HIBERNATE_BATCH:
+            break
+        managed = supervisor.bots.get(bot_id)
+        if managed and managed.plan == 'prime':
+            continue
+        bot_info = dal.deployment(bot_id, 'hibernate')
+        if not bot_info or (not managed and bot_info.node_id not in node_clients) or (bot_info.last_active and bot_info.last_active > cutoff) or is_prime(bot_info.user_id):
+            continue
+        if hibernate_bot(bot_id, idle_tracker.average_rss(bot_id)):
+            hibernated += 1
+    return hibernated
+
+def wake_due_bots():
+    """Wake hibernated bots whose scheduled wake time has passed"""
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    due = execute_db("SELECT deployment_id FROM hibernation WHERE wake_at IS NOT NULL AND wake_at <= ?",
+                     (now,), fetchall=True) or []
+    for row in due:
+        wake_bot(row['deployment_id'])
+
+def reattach_bots():
+    """Adopt bots left Running by the previous control-plane process.
+
+    Local bots are matched by PID plus the /proc start time recorded at
+    launch; bots on agent nodes are confirmed with one batched status call
+    per node. Bots that died meanwhile go through the normal exit path.
+    """
+    running = dal.all_deployments('reattach')
+    running = [b for b in running if b.status == 'Running']
+    adopted, lost = 0, []
+    
+    remote = {}
+    for bot_info in running:
+        if bot_info.node_id in node_clients:
+            remote.setdefault(bot_info.node_id, []).append(bot_info.id)
+            continue
+        script = project_path / bot_info.filename
+        start_ticks = bot_info.pid_start_ticks
+        if bot_info.pid and not start_ticks:
+            # Launched before start times were recorded: fall back to the command line
+            if any(part.endswith(bot_info.filename) for part in procfs.read_cmdline(bot_info.pid)):
+                stat = procfs.read_stat(bot_info.pid)
+                start_ticks = stat['starttime'] if stat else None
+        if bot_info.pid and supervisor.adopt(bot_info.id, bot_info.pid, start_ticks,
+                                             launch_target(script), user_plan(bot_info.user_id)):
+            adopted += 1
+        else:
+            lost.append(bot_info.id)
+    
+    for node_id, bot_ids in remote.items():
+        try:
+            status = node_clients[node_id].status(bot_ids)
+        except AgentError as e:
+            # Leave them Running; the agent keeps owning them and reports exits
+            logger.error(f"Node {node_id} agent unreachable during reattach: {e}")
+            continue
+        for entry in status:
+            if entry['running']:
+                adopted += 1
+            else:
+                lost.append(entry['bot_id'])
+    
+    logger.info(f"Reattached to {adopted} running bots, {len(lost)} exited while the control plane was down")
+    for bot_id in lost:
+        handle_bot_exit(bot_id, None)
+    return adopted, lost
+
+def handle_agent_event(node_id):
+    """Event callback for one node agent connection"""
+    def handle(event):
+        kind = event.get('event')
+        if kind == 'exited':
+            executor.submit(handle_bot_exit, event['bot_id'], event.get('returncode'), event.get('limit'),
+                            bool(event.get('hung')))
+        elif kind == 'throttled':
+            supervisor.record_throttle(event['bot_id'], event.get('reason'), f"node {node_id}: {event.get('detail')}")
+    return handle
+
+def connect_node_agents():
+    """Open connections to the node agents listed in Config.NODE_AGENTS"""
+    for node_id, address in Config.NODE_AGENTS.items():
+        client = NodeAgentClient(address, on_event=handle_agent_event(node_id), token=Config.AGENT_TOKEN)
+        node_clients[node_id] = client
+        try:
+            client.connect()
+            logger.info(f"Connected to node {node_id} agent at {address}")
+        except (OSError, AgentError) as e:
+            # Calls reconnect on demand
+            logger.error(f"Node {node_id} agent at {address} unreachable: {e}")
+
+def register_node_agents():
+    """Rebalancer agents: remote nodes via their agent, the rest in-process.
+
+    The in-process nodes share one supervisor, so the rebalancer only moves
+    bots between them and agent nodes; with no agents configured it only
+    corrects node counters.
+    """
+    def launch(bot_id):
+        bot_info = dal.deployment(bot_id, 'launch')
+        return launch_bot(bot_info) if bot_info and bot_info.is_banned != 1 else None
+    
+    def spec_for(bot_id):
+        bot_info = dal.deployment(bot_id, 'launch')
+        return bot_launch_spec(bot_info) if bot_info and bot_info.is_banned != 1 else None
+    
+    for node in dal.nodes('load'):
+        if node.id in node_clients:
+            rebalancer.agents[node.id] = RemoteNodeAgent(node.id, node_clients[node.id], spec_for)
+        else:
+            rebalancer.agents[node.id] = LocalNodeAgent(node.id, supervisor, launch)
+
+def emit_rebalance(result):
+    """Node load changes from one rebalancing round"""
+    for move in result['succeeded']:
+        events.emit('node', id=move.source, delta=-1)
+        events.emit('node', id=move.target, delta=1)
+    if result['drift']:
+        events.emit('rebalance', corrected=len(result['drift']), moved=len(result['succeeded']))
+
+def rebalance_nodes():
+    """Periodically fix node load drift and even out node pressure"""
+    while True:
+        time.sleep(Config.REBALANCE_INTERVAL)
+        try:
+            result = rebalancer.run()
+            if result:
+                emit_rebalance(result)
+            if result and (result['planned'] or result['drift']):
+                logger.info(f"Rebalance: {len(result['succeeded'])}/{len(result['planned'])} moves, "
+                            f"{len(result['drift'])} node counters corrected")
+        except Exception as e:
+            logger.error(f"Rebalancer error: {e}")
+
+def supervise_bots():
+    """Reap exited bots, apply resource limits and record usage"""
+    while True:
+        try:
+            for bot_id, returncode, limit in supervisor.poll():
+                handle_bot_exit(bot_id, returncode, limit)
+            
+            supervisor.enforce()
+            
+            # SIGTERM then SIGKILL; the exit is picked up by the next poll
+            for managed in watchdog.check(list(supervisor.bots.values())):
+                executor.submit(supervisor.terminate, managed, Config.HANG_KILL_GRACE)
+            
+            for managed in list(supervisor.bots.values()):
+                update_bot_stats(managed.bot_id, round(managed.cpu_percent, 1), round(managed.rss_mb, 1))
+                idle_tracker.observe(managed)
+            
+            # Exits and throttling on remote nodes arrive as agent events
+            for node_id, client in node_clients.items():
+                try:
+                    for sample in client.metrics()['bots']:
+                        update_bot_stats(sample['bot_id'], sample['cpu_percent'], sample['rss_mb'])
+                        idle_tracker.record(sample['bot_id'], sample['pid'], sample['cpu_percent'],
+                                            sample['rss_mb'], sample.get('log_size'))
+                except AgentError as e:
+                    logger.error(f"Metrics from node {node_id} failed: {e}")
+            
+            if Config.HIBERNATION_ENABLED:
+                hibernate_idle_bots()
+                wake_due_bots()
+            
+            run_bulk_jobs()
+            export_metrics()
+        except Exception as e:
+            logger.error(f"Supervisor error: {e}")
+        
+        time.sleep(Config.SUPERVISE_INTERVAL)
+
 # ... [Existing functions like handle_my_bots, handle_dashboard, etc.] ...
 
+def handle_shutdown_signal(signum, frame):
+    """Exit cleanly so atexit hooks flush buffered writes"""
+    logger.info(f"Received signal {signum}, shutting down...")
+    sys.exit(0)
+
 # Start the bot
 def main():
     """Main function to start the bot"""
@@ -1876,6 +3117,32 @@ def main():
     
     # Initialize database
     init_db()
+    with db_lock:
+        conn = get_db()
+        try:
+            if fail_interrupted_jobs(conn):
+                logger.warning("Bulk jobs interrupted by the last shutdown were marked failed")
+        finally:
+            conn.close()
+    
+    # Start background writers
+    notification_store.start()
+    write_buffer.start()
+    atexit.register(notification_store.stop)
+    atexit.register(write_buffer.stop)
+    signal.signal(signal.SIGTERM, handle_shutdown_signal)
+    
+    # Start the bot supervisor
+    if Config.USE_ZYGOTE and zygote.start():
+        atexit.register(zygote.stop)
+    connect_node_agents()
+    reattach_bots()
+    threading.Thread(target=supervise_bots, name="bot-supervisor", daemon=True).start()
+    register_node_agents()
+    threading.Thread(target=rebalance_nodes, name="node-rebalancer", daemon=True).start()
+    
+    # Warm the shared library layer so the first install only fetches extras
+    executor.submit(deps.prefetch, Config.BASE_PACKAGES)
     
     # Start the bot
     logger.info("Bot is now running...")
@@ -0,0 +1,289 @@
+"""Minimal Prometheus-style metrics: counters, gauges and histograms.
+
+Metrics live in a Registry and are rendered in the text exposition
+format. Recording is a dict lookup plus a short uncontended lock, cheap
+enough for per-query and per-request use. Processes that do not serve
+HTTP (the bot control plane) write their registry to a textfile, which
+the web process merges into its own /metrics output.
+"""
+import os
+import time
+import bisect
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Metric:
+    """A named metric with a fixed set of label names.
+
+    ``labels(*values)`` returns the child for one label combination;
+    metrics without labels record directly through the metric itself.
+    """
+
+    kind = None
+    child_class = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        return self.child_class()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def samples(self):
+        """Yield (suffix, label values, extra labels, value)"""
+        for values, child in list(self._children.items()):
+            yield '', values, (), child.value
+
+
+class Counter(Metric):
+    kind = 'counter'
+    child_class = _CounterChild
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    """A value that goes up and down, or is computed when rendered.
+
+    ``callback`` returns either a number or {label values tuple: number};
+    it runs at render time, so it costs nothing on the hot path.
+    """
+
+    kind = 'gauge'
+    child_class = _GaugeChild
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def samples(self):
+        if self.callback is None:
+            yield from super().samples()
+            return
+        value = self.callback()
+        if isinstance(value, dict):
+            for values, number in value.items():
+                yield '', tuple(values), (), number
+        elif value is not None:
+            yield '', (), (), value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield '_bucket', values, (('le', _format_value(float(bound))),), cumulative
+            yield '_sum', values, (), total
+            yield '_count', values, (), count
+
+
+class Registry:
+    """A set of metrics rendered together.
+
+    ``const_labels`` are added to every sample, e.g. the process role, so
+    several processes can expose the same metric names side by side.
+    """
+
+    def __init__(self, const_labels=None):
+        self.const_labels = tuple((const_labels or {}).items())
+        self.metrics = []
+        self._scrape = 0
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def per_scrape(self, callback):
+        """Wrap a gauge callback so gauges sharing it run it once per render"""
+        cached = [None, None]
+
+        def collect():
+            scrape = self._scrape
+            if cached[0] != scrape:
+                cached[:] = [scrape, callback()]
+            return cached[1]
+        return collect
+
+    def render(self):
+        """The registry in text exposition format"""
+        self._scrape += 1
+        lines = []
+        for metric in self.metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                lines.append(f"# {metric.name} collection failed: {_escape(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, values, extra, value in samples:
+                labels = _format_labels(metric.labelnames, values, self.const_labels + tuple(extra))
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """Atomically write the rendered registry to ``path``"""
+        path = str(path)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+def read_textfiles(directory, max_age=None):
+    """Concatenate the *.prom files in ``directory``, skipping stale ones"""
+    chunks = []
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith('.prom'))
+    except FileNotFoundError:
+        return ''
+    now = time.time()
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            if max_age is not None and now - os.path.getmtime(path) > max_age:
+                continue
+            with open(path) as f:
+                chunks.append(f.read())
+        except OSError:
+            continue
+    return ''.join(chunks)
+
+
+def merge_expositions(*texts):
+    """Combine exposition texts so each family is declared once, samples together.
+
+    Several processes export the same metric names (told apart by their
+    const labels); repeating a family's HELP/TYPE lines would be rejected
+    by the scraper.
+    """
+    families = {}
+    for text in texts:
+        current = None
+        for line in text.splitlines():
+            if line.startswith(('# HELP ', '# TYPE ')):
+                name = line.split(' ', 3)[2]
+                current = families.setdefault(name, {'HELP': None, 'TYPE': None, 'samples': []})
+                key = line[2:6]
+                current[key] = current[key] or line
+            elif line and not line.startswith('#') and current is not None:
+                current['samples'].append(line)
+    lines = []
+    for family in families.values():
+        lines.extend(line for line in (family['HELP'], family['TYPE']) if line)
+        lines.extend(family['samples'])
+    return '\n'.join(lines) + '\n'
+
+
+def statement_kind(query):
+    """Leading SQL keyword, used as a low-cardinality query label"""
+    head = query.lstrip()[:8].split(None, 1)
+    return head[0].upper() if head else 'UNKNOWN'
@@ -0,0 +1,543 @@
+"""Node agent: owns the bot processes on one host.
+
+The control plane talks to it over a Unix or TCP socket using
+length-prefixed JSON messages (4-byte big-endian length, then the body):
+
+* request  ``{"id": 1, "method": "start", "params": {...}}``
+* response ``{"id": 1, "result": ...}`` or ``{"id": 1, "error": "..."}``
+* event    ``{"event": "exited", "bot_id": 7, "returncode": 1, "limit": null, "hung": false}``
+
+Calls are batched (start/stop/status take lists of bots) and a
+connection that sent ``subscribe`` receives lifecycle events as they
+happen. Bot scripts are referenced by path, so the project directory
+must be available on the node at the same location; the agent only
+starts scripts under its ``--bots-dir`` and overlays under ``--deps-dir``.
+A TCP listener needs ``--token`` unless it is bound to loopback.
+
+The agent runs its own hang watchdog (``--hang-timeout``), since heartbeat
+files and logs live on its host: hung bots are killed there and their
+``exited`` event says so. ``metrics`` reports what the control plane
+needs for idle hibernation.
+
+    python node_agent.py --node-id 2 --listen unix:/run/zenx/node2.sock
+    python node_agent.py --node-id 3 --listen tcp:0.0.0.0:7070 --token secret
+"""
+import os
+import sys
+import json
+import time
+import hmac
+import signal
+import socket
+import struct
+import argparse
+import ipaddress
+import threading
+import itertools
+import logging
+
+from supervisor import BotSupervisor
+from liveness import Watchdog
+from rebalancer import NodeAgent
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('!I')
+MAX_MESSAGE = 16 * 1024 * 1024
+
+
+class AgentError(Exception):
+    pass
+
+
+def parse_agent_map(value):
+    """'2=unix:/run/n2.sock,3=tcp:10.0.0.3:7070' -> {2: 'unix:...', 3: 'tcp:...'}"""
+    agents = {}
+    for item in (value or '').split(','):
+        node_id, sep, address = item.strip().partition('=')
+        if sep and node_id.strip().isdigit() and address.strip():
+            agents[int(node_id)] = address.strip()
+    return agents
+
+
+def parse_address(address):
+    """'unix:/path' or 'tcp:host:port' -> (family, sockaddr)"""
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[5:]
+    if address.startswith('tcp:'):
+        address = address[4:]
+    host, _, port = address.rpartition(':')
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def confined(path, root):
+    """``path`` resolved, if it lies inside ``root``; otherwise None"""
+    resolved = os.path.realpath(path)
+    return resolved if os.path.commonpath([resolved, root]) == root else None
+
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def send_message(sock, payload):
+    body = json.dumps(payload, separators=(',', ':')).encode()
+    sock.sendall(HEADER.pack(len(body)) + body)
+
+
+def recv_message(sock):
+    """Read one message; None when the peer closed the connection"""
+    header = _recv_exact(sock, HEADER.size)
+    if header is None:
+        return None
+    (length,) = HEADER.unpack(header)
+    if length > MAX_MESSAGE:
+        raise AgentError(f"message of {length} bytes exceeds limit")
+    body = _recv_exact(sock, length)
+    if body is None:
+        return None
+    return json.loads(body)
+
+
+class Connection:
+    """A socket shared by a request loop and event broadcasts"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.send_lock = threading.Lock()
+        self.subscribed = False
+        self.authenticated = False
+
+    def send(self, payload):
+        with self.send_lock:
+            send_message(self.sock, payload)
+
+
+class NodeAgentServer:
+    """Serves the agent protocol on top of a local BotSupervisor"""
+
+    def __init__(self, node_id, address, logs_dir, limits_by_plan=None, zygote=None,
+                 poll_interval=2.0, token=None, bots_dir='projects', deps_dir='deps',
+                 hang_timeout=300, hang_grace=10):
+        self.node_id = node_id
+        self.address = address
+        self.bots_dir = os.path.realpath(bots_dir)
+        self.deps_dir = os.path.realpath(deps_dir)
+        self.supervisor = BotSupervisor(limits_by_plan or {'free': {}}, logs_dir, zygote=zygote)
+        # Hang detection for this node's bots; a timeout of 0 turns it off
+        self.watchdog = Watchdog(logs_dir, hang_timeout) if hang_timeout else None
+        self.hang_grace = hang_grace
+        self.poll_interval = poll_interval
+        self.token = token
+        self.connections = set()
+        self._connections_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.methods = {
+            'hello': self.rpc_hello,
+            'ping': self.rpc_ping,
+            'subscribe': self.rpc_subscribe,
+            'start': self.rpc_start,
+            'stop': self.rpc_stop,
+            'status': self.rpc_status,
+            'metrics': self.rpc_metrics,
+        }
+
+    # RPC methods
+
+    def rpc_hello(self, conn, params):
+        if self.token and not hmac.compare_digest(str(params.get('token', '')), self.token):
+            raise AgentError("bad token")
+        conn.authenticated = True
+        return {'node_id': self.node_id}
+
+    def rpc_ping(self, conn, params):
+        return {'node_id': self.node_id, 'bots': len(self.supervisor.bots), 'time': time.time()}
+
+    def rpc_subscribe(self, conn, params):
+        conn.subscribed = True
+        return True
+
+    def rpc_start(self, conn, params):
+        results = []
+        for spec in params.get('bots', []):
+            bot_id = spec['bot_id']
+            try:
+                script = confined(spec['script'], self.bots_dir)
+                cwd = confined(spec['cwd'], self.bots_dir) if spec.get('cwd') else None
+                site_dirs = [confined(path, self.deps_dir) for path in spec.get('site_dirs') or ()]
+                if script is None or (spec.get('cwd') and cwd is None):
+                    raise AgentError(f"bot paths must be inside {self.bots_dir}")
+                if None in site_dirs:
+                    raise AgentError(f"library overlays must be inside {self.deps_dir}")
+                env = self.watchdog.env_for(bot_id, spec.get('env')) if self.watchdog else spec.get('env')
+                managed = self.supervisor.launch(bot_id, script, spec.get('plan', 'free'),
+                                                 cwd=cwd, env=env, site_dirs=site_dirs or None)
+                results.append({'bot_id': bot_id, 'pid': managed.pid, 'start_ticks': managed.start_ticks})
+                self.broadcast({'event': 'started', 'bot_id': bot_id, 'pid': managed.pid})
+            except Exception as e:
+                results.append({'bot_id': bot_id, 'error': str(e)})
+        return results
+
+    def rpc_stop(self, conn, params):
+        timeout = params.get('timeout', 10)
+        bot_ids = params.get('bot_ids', [])
+        stopped = self.supervisor.stop_many(bot_ids, timeout)
+        if self.watchdog:
+            for bot_id in bot_ids:
+                self.watchdog.forget(bot_id)
+        return [{'bot_id': bot_id, 'stopped': stopped.get(bot_id, False)} for bot_id in bot_ids]
+
+    def rpc_status(self, conn, params):
+        bot_ids = params.get('bot_ids')
+        if bot_ids is None:
+            bot_ids = list(self.supervisor.bots)
+        result = []
+        for bot_id in bot_ids:
+            managed = self.supervisor.bots.get(bot_id)
+            running = bool(managed and self.supervisor.is_running(bot_id))
+            result.append({'bot_id': bot_id, 'running': running,
+                           'pid': managed.pid if managed else None,
+                           'started_at': managed.started_at if managed else None})
+        return result
+
+    def rpc_metrics(self, conn, params):
+        bots = []
+        for managed in list(self.supervisor.bots.values()):
+            try:
+                log_size = os.stat(managed.log_path).st_size
+            except OSError:
+                log_size = None
+            bots.append({'bot_id': managed.bot_id, 'pid': managed.pid, 'plan': managed.plan,
+                         'cpu_percent': round(managed.cpu_percent, 1), 'rss_mb': round(managed.rss_mb, 1),
+                         'log_size': log_size})
+        return {'node_id': self.node_id, 'bots': bots,
+                'rss_mb': round(sum(b['rss_mb'] for b in bots), 1),
+                'load': os.getloadavg()[0] if hasattr(os, 'getloadavg') else None}
+
+    # Plumbing
+
+    def broadcast(self, event):
+        with self._connections_lock:
+            subscribers = [conn for conn in self.connections if conn.subscribed]
+        for conn in subscribers:
+            try:
+                conn.send(event)
+            except OSError:
+                pass
+
+    def handle(self, conn):
+        try:
+            while not self._stopped.is_set():
+                try:
+                    request = recv_message(conn.sock)
+                except (OSError, ValueError, AgentError):
+                    break
+                if request is None:
+                    break
+                request_id = request.get('id')
+                method = request.get('method')
+                try:
+                    if self.token and not conn.authenticated and method != 'hello':
+                        raise AgentError("not authenticated")
+                    handler = self.methods.get(method)
+                    if handler is None:
+                        raise AgentError(f"unknown method {method!r}")
+                    response = {'id': request_id, 'result': handler(conn, request.get('params') or {})}
+                except Exception as e:
+                    response = {'id': request_id, 'error': str(e)}
+                try:
+                    conn.send(response)
+                except OSError:
+                    break
+        finally:
+            with self._connections_lock:
+                self.connections.discard(conn)
+            conn.sock.close()
+
+    def monitor(self):
+        """Reap exited bots, enforce limits and stream the resulting events"""
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                for bot_id, returncode, limit in self.supervisor.poll():
+                    hung = self.watchdog.consume(bot_id) if self.watchdog else False
+                    self.broadcast({'event': 'exited', 'bot_id': bot_id, 'returncode': returncode,
+                                    'limit': limit, 'hung': hung})
+                for bot_id, reason, detail in self.supervisor.enforce():
+                    self.broadcast({'event': 'throttled', 'bot_id': bot_id, 'reason': reason, 'detail': detail})
+                if self.watchdog:
+                    # SIGTERM then SIGKILL; the exit is picked up by the next poll
+                    for managed in self.watchdog.check(list(self.supervisor.bots.values())):
+                        threading.Thread(target=self.supervisor.terminate, args=(managed, self.hang_grace),
+                                         daemon=True).start()
+            except Exception as e:
+                logger.error(f"Agent monitor error: {e}")
+
+    def serve_forever(self):
+        family, sockaddr = parse_address(self.address)
+        if family != socket.AF_UNIX and not self.token and not is_loopback(sockaddr[0]):
+            # Anyone who can connect could start processes on this host
+            raise AgentError(f"refusing to listen on {self.address} without a token")
+        listener = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_UNIX:
+            try:
+                os.unlink(sockaddr)
+            except FileNotFoundError:
+                pass
+        else:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(sockaddr)
+        if family == socket.AF_UNIX:
+            os.chmod(sockaddr, 0o600)
+        listener.listen(64)
+        listener.settimeout(0.5)
+        self.listener = listener
+
+        threading.Thread(target=self.monitor, name="agent-monitor", daemon=True).start()
+        print(json.dumps({'ready': True, 'node_id': self.node_id, 'pid': os.getpid()}), flush=True)
+
+        while not self._stopped.is_set():
+            try:
+                sock, _ = listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            sock.settimeout(None)
+            if family != socket.AF_UNIX:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = Connection(sock)
+            with self._connections_lock:
+                self.connections.add(conn)
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+        listener.close()
+        if family == socket.AF_UNIX:
+            try:
+                os.unlink(sockaddr)
+            except FileNotFoundError:
+                pass
+
+    def shutdown(self, stop_bots=True):
+        self._stopped.set()
+        if stop_bots:
+            for bot_id in list(self.supervisor.bots):
+                self.supervisor.stop(bot_id, timeout=5)
+
+
+class NodeAgentClient:
+    """Persistent connection from the control plane to one node agent.
+
+    Requests are multiplexed by id; events are passed to ``on_event`` from
+    the reader thread, so the callback should hand work off quickly.
+    """
+
+    def __init__(self, address, on_event=None, timeout=15, token=None):
+        self.address = address
+        self.on_event = on_event
+        self.timeout = timeout
+        self.token = token
+        self.sock = None
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+
+    def connect(self):
+        """Open the connection if it is not open; every failure is an AgentError"""
+        with self._lock:
+            if self.sock is not None:
+                return
+            family, sockaddr = parse_address(self.address)
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            try:
+                sock.settimeout(self.timeout)
+                sock.connect(sockaddr)
+                sock.settimeout(None)
+                if family != socket.AF_UNIX:
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except OSError as e:
+                sock.close()
+                raise AgentError(f"cannot reach node agent at {self.address}: {e}")
+            self.sock = sock
+            threading.Thread(target=self._reader, args=(sock,), name="agent-client", daemon=True).start()
+        try:
+            if self.token:
+                self.call('hello', {'token': self.token})
+            if self.on_event:
+                self.call('subscribe')
+        except AgentError:
+            # Do not leave an unauthenticated or unsubscribed connection behind
+            self.close()
+            raise
+
+    def _reader(self, sock):
+        try:
+            while True:
+                message = recv_message(sock)
+                if message is None:
+                    break
+                if 'event' in message:
+                    if self.on_event:
+                        try:
+                            self.on_event(message)
+                        except Exception as e:
+                            logger.error(f"Agent event handler error: {e}")
+                    continue
+                waiter = self._pending.pop(message.get('id'), None)
+                if waiter:
+                    waiter[1] = message
+                    waiter[0].set()
+        except (OSError, ValueError, AgentError):
+            pass
+        finally:
+            with self._lock:
+                if self.sock is sock:
+                    self.sock = None
+            sock.close()
+            for request_id in list(self._pending):
+                waiter = self._pending.pop(request_id, None)
+                if waiter:
+                    waiter[1] = {'error': 'connection to node agent lost'}
+                    waiter[0].set()
+
+    def call(self, method, params=None, timeout=None):
+        try:
+            if self.sock is None:
+                self.connect()
+        except OSError as e:
+            raise AgentError(f"cannot reach node agent at {self.address}: {e}")
+        request_id = next(self._ids)
+        waiter = [threading.Event(), None]
+        self._pending[request_id] = waiter
+        try:
+            with self._send_lock:
+                send_message(self.sock, {'id': request_id, 'method': method, 'params': params or {}})
+        except (OSError, AttributeError) as e:
+            self._pending.pop(request_id, None)
+            raise AgentError(f"send failed: {e}")
+        if not waiter[0].wait(timeout or self.timeout):
+            self._pending.pop(request_id, None)
+            raise AgentError(f"{method} timed out")
+        response = waiter[1]
+        if 'error' in response:
+            raise AgentError(response['error'])
+        return response['result']
+
+    def ping(self):
+        return self.call('ping')
+
+    def start(self, specs):
+        """Start a batch of bots; specs are dicts with bot_id, script, plan, ..."""
+        return self.call('start', {'bots': list(specs)}, timeout=max(self.timeout, 2 * len(specs)))
+
+    def stop(self, bot_ids, timeout=10):
+        bot_ids = list(bot_ids)
+        # The agent signals the whole batch at once, so the grace period is shared
+        return self.call('stop', {'bot_ids': bot_ids, 'timeout': timeout},
+                         timeout=timeout + 5 + self.timeout)
+
+    def status(self, bot_ids=None):
+        return self.call('status', {'bot_ids': list(bot_ids) if bot_ids is not None else None})
+
+    def metrics(self):
+        return self.call('metrics')
+
+    def close(self):
+        with self._lock:
+            sock, self.sock = self.sock, None
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+
+class RemoteBot:
+    """Control-plane handle for a bot started through a node agent"""
+
+    __slots__ = ('bot_id', 'pid', 'start_ticks', 'node_id')
+
+    def __init__(self, bot_id, pid, start_ticks, node_id):
+        self.bot_id = bot_id
+        self.pid = pid
+        self.start_ticks = start_ticks
+        self.node_id = node_id
+
+
+class RemoteNodeAgent(NodeAgent):
+    """Rebalancer adapter for a node served by a node agent"""
+
+    def __init__(self, node_id, client, spec_for):
+        super().__init__(node_id)
+        self.client = client
+        self.spec_for = spec_for
+
+    def start(self, bot_id):
+        spec = self.spec_for(bot_id)
+        if spec is None:
+            raise AgentError(f"bot {bot_id} cannot be started")
+        result = self.client.start([spec])[0]
+        if 'error' in result:
+            raise AgentError(result['error'])
+        return result['pid'], result.get('start_ticks')
+
+    def stop(self, bot_id):
+        return self.client.stop([bot_id])[0]['stopped'] or not self.client.status([bot_id])[0]['running']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ZEN X node agent")
+    parser.add_argument('--node-id', type=int, required=True)
+    parser.add_argument('--listen', required=True, help="unix:/path or tcp:host:port")
+    parser.add_argument('--logs-dir', default='logs')
+    parser.add_argument('--bots-dir', default='projects', help="only scripts under here are started")
+    parser.add_argument('--deps-dir', default='deps', help="only library overlays under here are used")
+    parser.add_argument('--limits', help="JSON file with per-plan resource limits")
+    parser.add_argument('--token', default=os.environ.get('ZENX_AGENT_TOKEN'))
+    parser.add_argument('--poll-interval', type=float, default=2.0)
+    parser.add_argument('--hang-timeout', type=float, default=300,
+                        help="kill bots that make no progress for this many seconds (0 disables)")
+    parser.add_argument('--hang-grace', type=float, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    limits = None
+    if args.limits:
+        with open(args.limits) as f:
+            limits = json.load(f)
+
+    server = NodeAgentServer(args.node_id, args.listen, args.logs_dir, limits,
+                             poll_interval=args.poll_interval, token=args.token,
+                             bots_dir=args.bots_dir, deps_dir=args.deps_dir,
+                             hang_timeout=args.hang_timeout, hang_grace=args.hang_grace)
+
+    def handle_signal(signum, frame):
+        server.shutdown()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    try:
+        server.serve_forever()
+    except AgentError as e:
+        parser.error(str(e))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+import sqlite3
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationStore:
+    """Buffered notification writer with per-user unread counters.
+
+    Inserts are queued in memory and flushed in one transaction per batch.
+    Unread counts live in ``notification_counters`` and are cached here so
+    reading them is a dict lookup once a user has been seen.
+    """
+
+    def __init__(self, db_name, lock, flush_interval=2.0, max_pending=200,
+                 retention_days=30, prune_interval=3600):
+        self.db_name = db_name
+        self.lock = lock
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retention_days = retention_days
+        self.prune_interval = prune_interval
+
+        self._pending = []
+        self._pending_unread = {}
+        self._unread = {}
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._last_prune = 0
+
+    def _connect(self):
+        return sqlite3.connect(self.db_name, check_same_thread=False)
+
+    def send(self, user_id, message):
+        """Queue a notification for a user"""
+        created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._buffer_lock:
+            self._pending.append((user_id, message, created_at))
+            self._pending_unread[user_id] = self._pending_unread.get(user_id, 0) + 1
+            if user_id in self._unread:
+                self._unread[user_id] += 1
+            full = len(self._pending) >= self.max_pending
+
+        if full:
+            self._wakeup.set()
+
+    def unread_count(self, user_id):
+        """Return the number of unread notifications for a user"""
+        with self._buffer_lock:
+            if user_id in self._unread:
+                return self._unread[user_id]
+
+        # Hold the flush lock so a concurrent flush can't move pending
+        # deltas into the DB between our read and the merge below.
+        with self._flush_lock:
+            try:
+                with self.lock:
+                    conn = self._connect()
+                    try:
+                        row = conn.execute("SELECT unread FROM notification_counters WHERE user_id=?",
+                                           (user_id,)).fetchone()
+                    finally:
+                        conn.close()
+            except Exception as e:
+                logger.error(f"Error reading unread count: {e}")
+                return self._pending_unread.get(user_id, 0)
+
+            with self._buffer_lock:
+                count = (row[0] if row else 0) + self._pending_unread.get(user_id, 0)
+                self._unread[user_id] = count
+                return count
+
+    def flush(self):
+        """Write all queued notifications in a single transaction"""
+        with self._flush_lock:
+            with self._buffer_lock:
+                pending, self._pending = self._pending, []
+                deltas, self._pending_unread = self._pending_unread, {}
+
+            if not pending:
+                return 0
+
+            try:
+                with self.lock:
+                    conn = self._connect()
+                    try:
+                        with conn:
+                            conn.executemany("INSERT INTO notifications (user_id, message, is_read, created_at) VALUES (?, ?, 0, ?)",
+                                             pending)
+                            conn.executemany("""
+                                INSERT INTO notification_counters (user_id, unread) VALUES (?, ?)
+                                ON CONFLICT(user_id) DO UPDATE SET unread=unread+excluded.unread
+                            """, list(deltas.items()))
+                    finally:
+                        conn.close()
+            except Exception as e:
+                logger.error(f"Error flushing notifications: {e}")
+                # Put the batch back so it is retried on the next flush
+                with self._buffer_lock:
+                    self._pending = pending + self._pending
+                    for user_id, delta in deltas.items():
+                        self._pending_unread[user_id] = self._pending_unread.get(user_id, 0) + delta
+                return 0
+
+            return len(pending)
+
+    def mark_all_read(self, user_id):
+        """Mark every notification of a user as read"""
+        self.flush()
+
+        with self._flush_lock:
+            try:
+                with self.lock:
+                    conn = self._connect()
+                    try:
+                        with conn:
+                            conn.execute("UPDATE notifications SET is_read=1 WHERE user_id=? AND is_read=0", (user_id,))
+                            conn.execute("""
+                                INSERT INTO notification_counters (user_id, unread) VALUES (?, 0)
+                                ON CONFLICT(user_id) DO UPDATE SET unread=0
+                            """, (user_id,))
+                    finally:
+                        conn.close()
+            except Exception as e:
+                logger.error(f"Error marking notifications read: {e}")
+                return False
+
+            with self._buffer_lock:
+                # Anything queued after the flush above is still unread
+                self._unread[user_id] = self._pending_unread.get(user_id, 0)
+            return True
+
+    def prune(self, retention_days=None):
+        """Delete read notifications older than the retention window"""
+        days = self.retention_days if retention_days is None else retention_days
+        cutoff = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            with self.lock:
+                conn = self._connect()
+                try:
+                    with conn:
+                        cur = conn.execute("DELETE FROM notifications WHERE is_read=1 AND created_at < ?", (cutoff,))
+                        return cur.rowcount
+                finally:
+                    conn.close()
+        except Exception as e:
+            logger.error(f"Error pruning notifications: {e}")
+            return 0
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+            if time.time() - self._last_prune >= self.prune_interval:
+                self._last_prune = time.time()
+                removed = self.prune()
+                if removed:
+                    logger.info(f"Pruned {removed} old notifications")
+
+    def start(self):
+        """Start the background flusher thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._last_prune = time.time()
+        self._thread = threading.Thread(target=self._run, name="notification-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher thread and write out anything still queued"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.flush()
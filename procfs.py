@@ -0,0 +1,77 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def read_stat(pid):
+    """Parse /proc/<pid>/stat; returns None if the process is gone"""
+    try:
+        with open(f"/proc/{pid}/stat", 'rb') as f:
+            data = f.read().decode('utf-8', 'replace')
+    except (OSError, ValueError):
+        return None
+
+    # comm may contain spaces and parentheses, so split after the last ')'
+    end = data.rfind(')')
+    fields = data[end + 2:].split()
+    try:
+        return {
+            'pid': pid,
+            'comm': data[data.find('(') + 1:end],
+            'state': fields[0],
+            'ppid': int(fields[1]),
+            'utime': int(fields[11]),
+            'stime': int(fields[12]),
+            'nice': int(fields[16]),
+            'starttime': int(fields[19]),
+            'rss_bytes': int(fields[21]) * PAGE_SIZE,
+        }
+    except (IndexError, ValueError):
+        return None
+
+
+def cpu_ticks(pid):
+    """Total user+system CPU ticks consumed by a process"""
+    stat = read_stat(pid)
+    return stat['utime'] + stat['stime'] if stat else None
+
+
+def is_alive(pid, start_ticks=None):
+    """Check a PID exists, is not a zombie and (optionally) is the same process.
+
+    ``start_ticks`` is the starttime recorded at launch; comparing it guards
+    against the PID having been reused by an unrelated process.
+    """
+    if not pid:
+        return False
+    stat = read_stat(pid)
+    if not stat or stat['state'] in ('Z', 'X'):
+        return False
+    if start_ticks is not None and stat['starttime'] != start_ticks:
+        return False
+    return True
+
+
+def read_cmdline(pid):
+    try:
+        with open(f"/proc/{pid}/cmdline", 'rb') as f:
+            return [part.decode('utf-8', 'replace') for part in f.read().split(b'\0') if part]
+    except OSError:
+        return []
+
+
+def proportional_rss(pid):
+    """PSS in bytes (shared pages split between sharers), falling back to RSS"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    stat = read_stat(pid)
+    return stat['rss_bytes'] if stat else 0
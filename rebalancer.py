@@ -0,0 +1,290 @@
+import abc
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class MigrationError(Exception):
+    pass
+
+
+class NodeAgent(abc.ABC):
+    """What the rebalancer needs from a node: start and stop a bot there.
+
+    ``start`` returns the new (pid, start_ticks), raising on failure, and
+    ``stop`` returns True once the bot is no longer running on the node.
+    Nodes with the same ``host`` run their bots on the same machine, so
+    moving a bot between them frees nothing.
+    """
+
+    def __init__(self, node_id, host=None):
+        self.node_id = node_id
+        self.host = node_id if host is None else host
+
+    @abc.abstractmethod
+    def start(self, bot_id):
+        """Start the bot here; returns (pid, start_ticks)"""
+
+    @abc.abstractmethod
+    def stop(self, bot_id):
+        """Stop the bot here; returns True once it is no longer running"""
+
+
+class LocalNodeAgent(NodeAgent):
+    """A node whose bots run under this process's supervisor"""
+
+    def __init__(self, node_id, supervisor, launch):
+        super().__init__(node_id, host=supervisor)
+        self.supervisor = supervisor
+        self.launch = launch
+
+    def start(self, bot_id):
+        managed = self.launch(bot_id)
+        if managed is None:
+            raise MigrationError(f"bot {bot_id} could not be launched")
+        return managed.pid, managed.start_ticks
+
+    def stop(self, bot_id):
+        if bot_id not in self.supervisor.bots:
+            return True
+        return self.supervisor.stop(bot_id)
+
+
+class Move:
+    __slots__ = ('bot_id', 'source', 'target', 'weight', 'pid', 'start_ticks', 'error')
+
+    def __init__(self, bot_id, source, target, weight):
+        self.bot_id = bot_id
+        self.source = source
+        self.target = target
+        self.weight = weight
+        self.pid = None
+        self.start_ticks = None
+        self.error = None
+
+    def __repr__(self):
+        return f"Move(bot {self.bot_id}: node {self.source} -> {self.target}, {self.weight:.1f}MB)"
+
+
+def reconcile_loads(conn):
+    """Recompute nodes.current_load from Running deployments in one transaction.
+
+    Returns {node_id: (stored, actual)} for the nodes that had drifted.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute('''SELECT n.id, n.current_load,
+                                      (SELECT COUNT(*) FROM deployments d
+                                       WHERE d.node_id = n.id AND d.status = 'Running')
+                               FROM nodes n''').fetchall()
+        drift = {node_id: (stored, actual) for node_id, stored, actual in rows if stored != actual}
+        conn.executemany("UPDATE nodes SET current_load=? WHERE id=?",
+                         [(actual, node_id) for node_id, (_, actual) in drift.items()])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return drift
+
+
+class Rebalancer:
+    """Moves running bots off overloaded nodes.
+
+    Load is measured as the sampled RSS of each node's running bots
+    relative to the node's capacity. While the busiest and idlest nodes
+    differ by more than ``skew_threshold`` (as a fraction of the busiest),
+    bots are planned to move from the busiest to the idlest node on another
+    host, choosing the bot whose weight best closes half the gap. Moves run with at most
+    ``max_concurrent`` in flight; a failed start on the target restarts the
+    bot on its source, and node counters only change once a move succeeds
+    (or the bot could not be restarted anywhere and is marked Crashed).
+    """
+
+    def __init__(self, db_name, lock, agents, max_concurrent=2, skew_threshold=0.2,
+                 max_moves=10, default_weight=30.0):
+        self.db_name = db_name
+        self.lock = lock
+        self.agents = agents
+        self.max_concurrent = max_concurrent
+        self.skew_threshold = skew_threshold
+        self.max_moves = max_moves
+        self.default_weight = default_weight
+        self._running = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def reconcile(self):
+        with self.lock:
+            conn = self._connect()
+            try:
+                drift = reconcile_loads(conn)
+            finally:
+                conn.close()
+        for node_id, (stored, actual) in drift.items():
+            logger.warning(f"Node {node_id} load drifted: stored {stored}, actual {actual}")
+        return drift
+
+    def snapshot(self):
+        """Active nodes with an agent: {node_id: {'capacity', 'bots': {bot_id: weight}}}"""
+        with self.lock:
+            conn = self._connect()
+            try:
+                nodes = conn.execute("SELECT id, capacity FROM nodes WHERE status='active'").fetchall()
+                bots = conn.execute('''SELECT id, node_id, ram_usage FROM deployments
+                                       WHERE status='Running' AND node_id IS NOT NULL''').fetchall()
+            finally:
+                conn.close()
+
+        state = {node_id: {'capacity': capacity or 1, 'bots': {}}
+                 for node_id, capacity in nodes if node_id in self.agents}
+        for bot_id, node_id, ram in bots:
+            if node_id in state:
+                state[node_id]['bots'][bot_id] = ram or self.default_weight
+        return state
+
+    def _host(self, node_id):
+        agent = self.agents.get(node_id)
+        return node_id if agent is None else agent.host
+
+    @staticmethod
+    def _pressure(node):
+        return sum(node['bots'].values()) / node['capacity']
+
+    def plan(self, state=None):
+        """Return the list of Moves that bring node skew under the threshold"""
+        state = state or self.snapshot()
+        moves = []
+        if len(state) < 2:
+            return moves
+
+        while len(moves) < self.max_moves:
+            ranked = sorted(state, key=lambda node_id: self._pressure(state[node_id]))
+            hottest = ranked[-1]
+            coldest = next((node_id for node_id in ranked if self._host(node_id) != self._host(hottest)), None)
+            if coldest is None:
+                break
+            hot, cold = state[hottest], state[coldest]
+            hot_pressure, cold_pressure = self._pressure(hot), self._pressure(cold)
+            if hot_pressure <= 0 or (hot_pressure - cold_pressure) / hot_pressure <= self.skew_threshold:
+                break
+            if len(cold['bots']) >= cold['capacity']:
+                break
+
+            # Moving weight w changes the gap by w/cap_hot + w/cap_cold; aim for half
+            gap = hot_pressure - cold_pressure
+            per_mb = 1 / hot['capacity'] + 1 / cold['capacity']
+            target_weight = gap / per_mb / 2
+            candidates = [(abs(weight - target_weight), bot_id, weight)
+                          for bot_id, weight in hot['bots'].items() if weight * per_mb < gap]
+            if not candidates:
+                break
+            _, bot_id, weight = min(candidates)
+
+            del hot['bots'][bot_id]
+            cold['bots'][bot_id] = weight
+            moves.append(Move(bot_id, hottest, coldest, weight))
+        return moves
+
+    def _transaction(self, statements):
+        """Run (sql, params) pairs in one transaction; returns the first rowcount.
+
+        Later statements only run if the first one matched a row.
+        """
+        with self.lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                first = conn.execute(*statements[0]).rowcount
+                if first:
+                    for statement in statements[1:]:
+                        conn.execute(*statement)
+                conn.commit()
+                return first
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+
+    def _record_move(self, move):
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return self._transaction([
+            ('''UPDATE deployments SET node_id=?, pid=?, pid_start_ticks=?, start_time=?, updated_at=?
+                WHERE id=? AND node_id=? AND status='Running' ''',
+             (move.target, move.pid, move.start_ticks, now, now, move.bot_id, move.source)),
+            ("UPDATE nodes SET current_load=MAX(current_load-1, 0) WHERE id=?", (move.source,)),
+            ("UPDATE nodes SET current_load=current_load+1, total_deployed=total_deployed+1 WHERE id=?",
+             (move.target,)),
+        ])
+
+    def _record_rollback(self, move, started):
+        """The bot is back on its source node with a new PID, or not running at all"""
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if started:
+            pid, start_ticks = started
+            return self._transaction([
+                ("UPDATE deployments SET pid=?, pid_start_ticks=?, start_time=?, updated_at=? WHERE id=? AND status='Running'",
+                 (pid, start_ticks, now, now, move.bot_id)),
+            ])
+        return self._transaction([
+            ("UPDATE deployments SET status='Crashed', pid=0, updated_at=? WHERE id=? AND status='Running'",
+             (now, move.bot_id)),
+            ("UPDATE nodes SET current_load=MAX(current_load-1, 0) WHERE id=?", (move.source,)),
+        ])
+
+    def migrate(self, move):
+        """Stop on source, start on target; roll back to source on failure"""
+        source, target = self.agents[move.source], self.agents[move.target]
+        if not source.stop(move.bot_id):
+            move.error = "could not stop on source"
+            return False
+        try:
+            move.pid, move.start_ticks = target.start(move.bot_id)
+        except Exception as e:
+            move.error = f"start on target failed: {e}"
+            logger.error(f"Migration of bot {move.bot_id} failed, rolling back: {e}")
+            started = None
+            try:
+                started = source.start(move.bot_id)
+            except Exception as rollback_error:
+                move.error += f"; rollback failed: {rollback_error}"
+                logger.error(f"Rollback of bot {move.bot_id} to node {move.source} failed: {rollback_error}")
+            self._record_rollback(move, started)
+            return False
+
+        if not self._record_move(move):
+            # The bot was stopped or deleted meanwhile; do not leave it running
+            target.stop(move.bot_id)
+            move.error = "deployment changed during migration"
+            return False
+        logger.info(f"Migrated bot {move.bot_id} from node {move.source} to node {move.target}")
+        return True
+
+    def execute(self, moves):
+        """Run moves with bounded concurrency; returns (succeeded, failed)"""
+        if not moves:
+            return [], []
+        with ThreadPoolExecutor(max_workers=self.max_concurrent) as pool:
+            results = list(pool.map(self.migrate, moves))
+        succeeded = [move for move, ok in zip(moves, results) if ok]
+        failed = [move for move, ok in zip(moves, results) if not ok]
+        return succeeded, failed
+
+    def run(self):
+        """Reconcile counters, then plan and execute one rebalancing round"""
+        if not self._running.acquire(blocking=False):
+            return None
+        try:
+            drift = self.reconcile()
+            moves = self.plan()
+            succeeded, failed = self.execute(moves)
+            return {'drift': drift, 'planned': moves, 'succeeded': succeeded, 'failed': failed}
+        finally:
+            self._running.release()
@@ -0,0 +1,149 @@
+"""On-demand sampling profiler for the running process.
+
+StackSampler wakes up every ``interval`` seconds, reads the current
+Python stack of every other thread through sys._current_frames() and
+counts identical stacks. Nothing is installed in the profiled threads,
+so the cost is paid only by the sampling thread: when a sample takes
+longer than ``max_overhead`` of the wall time, the interval is stretched
+to stay within it.
+
+Results are written in the collapsed-stack format (one
+``thread;outer;...;inner count`` line per distinct stack) read by
+flamegraph.pl, speedscope and inferno.
+"""
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+_active = threading.Lock()
+# Leaf frames in these modules mean the thread is parked waiting for work
+IDLE_MODULES = ('threading.py', 'queue.py', 'selectors.py')
+
+
+class SamplerBusy(RuntimeError):
+    """Another profile is already being taken"""
+
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def is_idle(stack):
+    return len(stack) > 1 and stack[-1].rsplit(' (', 1)[-1].split(':', 1)[0] in IDLE_MODULES
+
+
+class Profile:
+    """Sampled stacks of one profiling run"""
+
+    def __init__(self, stacks, samples, duration, sampling_time, interval, truncated):
+        self.stacks = stacks
+        self.samples = samples
+        self.duration = duration
+        self.sampling_time = sampling_time
+        self.interval = interval
+        self.truncated = truncated
+
+    @property
+    def overhead(self):
+        """Share of wall time the sampling thread spent taking samples"""
+        return self.sampling_time / self.duration if self.duration else 0.0
+
+    def collapsed(self):
+        """Collapsed-stack text, heaviest stacks first"""
+        lines = [f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()]
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    @property
+    def idle_share(self):
+        """Share of thread samples parked in a wait"""
+        samples = sum(self.stacks.values())
+        idle = sum(count for stack, count in self.stacks.items() if is_idle(stack))
+        return idle / samples if samples else 0.0
+
+    def top_functions(self, limit=10, include_idle=False):
+        """[(frame, self samples, total samples)] ordered by self samples"""
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            if not include_idle and is_idle(stack):
+                continue
+            # stack[0] is the thread name
+            frames = stack[1:]
+            if frames:
+                own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        return [(frame, count, total[frame]) for frame, count in own.most_common(limit)]
+
+
+class StackSampler:
+    """Samples all thread stacks of this process for a fixed duration"""
+
+    def __init__(self, interval=0.01, max_overhead=0.05, max_depth=128, max_stacks=50000):
+        self.interval = interval
+        self.max_overhead = max_overhead
+        self.max_depth = max_depth
+        self.max_stacks = max_stacks
+
+    def _sample(self, stacks, names, own_ident):
+        truncated = False
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            frames = []
+            while frame is not None and len(frames) < self.max_depth:
+                frames.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            frames.append(names.get(ident) or f"thread-{ident}")
+            frames.reverse()
+            key = tuple(frames)
+            if key not in stacks and len(stacks) >= self.max_stacks:
+                key = (frames[0], '[other]')
+                truncated = True
+            stacks[key] += 1
+        return truncated
+
+    def run(self, duration):
+        """Sample for ``duration`` seconds on the calling thread; return a Profile"""
+        if not _active.acquire(blocking=False):
+            raise SamplerBusy("A profile is already running")
+        try:
+            stacks = Counter()
+            own_ident = threading.get_ident()
+            samples = 0
+            sampling_time = 0.0
+            truncated = False
+            names = {}
+            started = time.perf_counter()
+            deadline = started + duration
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                if samples % 100 == 0:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                truncated |= self._sample(stacks, names, own_ident)
+                cost = time.perf_counter() - now
+                samples += 1
+                sampling_time += cost
+                delay = max(self.interval - cost, cost * (1 - self.max_overhead) / self.max_overhead)
+                time.sleep(min(delay, max(deadline - time.perf_counter(), 0)))
+            return Profile(stacks, samples, time.perf_counter() - started, sampling_time,
+                           self.interval, truncated)
+        finally:
+            _active.release()
+
+    def start(self, duration, callback):
+        """Sample on a background thread and pass the Profile (or error) to ``callback``"""
+        def run():
+            try:
+                profile = self.run(duration)
+            except Exception as e:
+                callback(None, e)
+                return
+            callback(profile, None)
+        thread = threading.Thread(target=run, name="stack-sampler", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,176 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Narrow deployments table: only the fields scanned by listings, counts and
+# the scheduler. Bulky payloads live in deployment_metadata/deployment_logs.
+DEPLOYMENT_COLUMNS = ('id', 'user_id', 'bot_name', 'filename', 'pid', 'start_time', 'status',
+                      'cpu_usage', 'ram_usage', 'last_active', 'node_id', 'restart_count',
+                      'auto_restart', 'created_at', 'updated_at', 'bot_username', 'is_banned',
+                      'token', 'hang_restart_count', 'pid_start_ticks')
+
+DEPLOYMENTS_DDL = '''CREATE TABLE IF NOT EXISTS {name}
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, bot_name TEXT,
+                     filename TEXT, pid INTEGER, start_time TEXT, status TEXT,
+                     cpu_usage REAL, ram_usage REAL, last_active TEXT, node_id INTEGER,
+                     restart_count INTEGER DEFAULT 0, auto_restart INTEGER DEFAULT 1,
+                     created_at TEXT, updated_at TEXT, bot_username TEXT, is_banned INTEGER DEFAULT 0,
+                     token TEXT, hang_restart_count INTEGER DEFAULT 0, pid_start_ticks INTEGER)'''
+
+TABLES = [
+    '''CREATE TABLE IF NOT EXISTS users
+                    (id INTEGER PRIMARY KEY, username TEXT, expiry TEXT, file_limit INTEGER,
+                     is_prime INTEGER, join_date TEXT, last_renewal TEXT, total_bots_deployed INTEGER DEFAULT 0,
+                     total_deployments INTEGER DEFAULT 0, last_active TEXT, bot_username TEXT)''',
+
+    '''CREATE TABLE IF NOT EXISTS keys
+                    (key TEXT PRIMARY KEY, duration_days INTEGER, file_limit INTEGER, created_date TEXT,
+                     used_by TEXT, used_date TEXT, is_used INTEGER DEFAULT 0)''',
+
+    DEPLOYMENTS_DDL.format(name='deployments'),
+
+    '''CREATE TABLE IF NOT EXISTS deployment_metadata
+                    (deployment_id INTEGER PRIMARY KEY, metadata TEXT)''',
+
+    '''CREATE TABLE IF NOT EXISTS deployment_logs
+                    (deployment_id INTEGER PRIMARY KEY, logs TEXT, updated_at TEXT)''',
+
+    '''CREATE TABLE IF NOT EXISTS deployment_deps
+                    (deployment_id INTEGER PRIMARY KEY, requirements TEXT, imports TEXT,
+                     analyzed_at TEXT)''',
+
+    '''CREATE TABLE IF NOT EXISTS hibernation
+                    (deployment_id INTEGER PRIMARY KEY, hibernated_at TEXT, wake_at TEXT,
+                     rss_mb REAL)''',
+
+    '''CREATE TABLE IF NOT EXISTS nodes
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, status TEXT,
+                     capacity INTEGER, current_load INTEGER DEFAULT 0, last_check TEXT,
+                     region TEXT, total_deployed INTEGER DEFAULT 0)''',
+
+    '''CREATE TABLE IF NOT EXISTS server_logs
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT,
+                     event TEXT, details TEXT, user_id INTEGER)''',
+
+    '''CREATE TABLE IF NOT EXISTS bot_logs
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, bot_id INTEGER, timestamp TEXT,
+                     log_type TEXT, message TEXT)''',
+
+    '''CREATE TABLE IF NOT EXISTS notifications
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, message TEXT,
+                     is_read INTEGER DEFAULT 0, created_at TEXT)''',
+
+    '''CREATE TABLE IF NOT EXISTS notification_counters
+                    (user_id INTEGER PRIMARY KEY, unread INTEGER DEFAULT 0)''',
+
+    '''CREATE TABLE IF NOT EXISTS bot_backups
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, bot_id INTEGER, backup_name TEXT,
+                     backup_path TEXT, created_at TEXT, size_kb REAL)''',
+
+    '''CREATE TABLE IF NOT EXISTS bulk_jobs
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, action TEXT, selector TEXT,
+                     status TEXT DEFAULT 'pending', requested_by TEXT, created_at TEXT,
+                     started_at TEXT, finished_at TEXT, result TEXT)''',
+]
+
+# Created after migrations, since rebuilding a table drops its indexes
+INDEXES = [
+    '''CREATE INDEX IF NOT EXISTS idx_deployments_user_status
+                    ON deployments (user_id, status)''',
+
+    '''CREATE INDEX IF NOT EXISTS idx_notifications_user_read
+                    ON notifications (user_id, is_read)''',
+
+    '''CREATE INDEX IF NOT EXISTS idx_notifications_read_created
+                    ON notifications (is_read, created_at)''',
+
+    '''CREATE TRIGGER IF NOT EXISTS trg_deployments_delete_side_tables
+                    AFTER DELETE ON deployments BEGIN
+                        DELETE FROM deployment_metadata WHERE deployment_id = old.id;
+                        DELETE FROM deployment_logs WHERE deployment_id = old.id;
+                    END''',
+
+    '''CREATE TRIGGER IF NOT EXISTS trg_deployments_delete_deps
+                    AFTER DELETE ON deployments BEGIN
+                        DELETE FROM deployment_deps WHERE deployment_id = old.id;
+                    END''',
+
+    '''CREATE TRIGGER IF NOT EXISTS trg_deployments_delete_hibernation
+                    AFTER DELETE ON deployments BEGIN
+                        DELETE FROM hibernation WHERE deployment_id = old.id;
+                    END''',
+]
+
+
+def table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+# Columns added after a table first shipped: (table, column, definition)
+ADDED_COLUMNS = [
+    ('deployments', 'hang_restart_count', 'INTEGER DEFAULT 0'),
+    ('deployments', 'pid_start_ticks', 'INTEGER'),
+]
+
+
+def add_missing_columns(conn):
+    """ALTER older databases to carry columns added since they were created"""
+    for table, column, definition in ADDED_COLUMNS:
+        if column not in table_columns(conn, table):
+            logger.info(f"Adding column {table}.{column}")
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def migrate_deployment_blobs(conn):
+    """Move logs/metadata out of deployments into their side tables.
+
+    Rebuilds the deployments table without the blob columns in a single
+    transaction. Returns True if a migration was performed.
+    """
+    columns = table_columns(conn, 'deployments')
+    if 'logs' not in columns and 'metadata' not in columns:
+        return False
+
+    logger.info("Migrating deployments: moving logs/metadata into side tables")
+    keep = ', '.join(DEPLOYMENT_COLUMNS)
+
+    conn.commit()
+    conn.execute("BEGIN")
+    try:
+        if 'metadata' in columns:
+            conn.execute('''INSERT OR REPLACE INTO deployment_metadata (deployment_id, metadata)
+                            SELECT id, metadata FROM deployments WHERE metadata IS NOT NULL''')
+        if 'logs' in columns:
+            conn.execute('''INSERT OR REPLACE INTO deployment_logs (deployment_id, logs, updated_at)
+                            SELECT id, logs, updated_at FROM deployments WHERE logs IS NOT NULL''')
+
+        conn.execute(DEPLOYMENTS_DDL.format(name='deployments_narrow'))
+        conn.execute(f"INSERT INTO deployments_narrow ({keep}) SELECT {keep} FROM deployments")
+        conn.execute("DROP TABLE deployments")
+        conn.execute("ALTER TABLE deployments_narrow RENAME TO deployments")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    # Give the pages freed by the old blobs back to the filesystem
+    conn.execute("VACUUM")
+    return True
+
+
+def init_schema(conn):
+    """Create all tables, run pending migrations and create indexes"""
+    c = conn.cursor()
+    for statement in TABLES:
+        c.execute(statement)
+
+    add_missing_columns(conn)
+    migrate_deployment_blobs(conn)
+
+    for statement in INDEXES:
+        c.execute(statement)
+
+    # Backfill unread counters for users that predate the counter table
+    c.execute('''INSERT OR IGNORE INTO notification_counters (user_id, unread)
+                SELECT user_id, COUNT(*) FROM notifications WHERE is_read=0 GROUP BY user_id''')
+    conn.commit()
@@ -0,0 +1,377 @@
+import os
+import sys
+import math
+import signal
+import subprocess
+import threading
+import time
+import logging
+from pathlib import Path
+
+import procfs
+from isolation import CgroupManager, make_preexec
+from deps import overlay_packages
+
+logger = logging.getLogger(__name__)
+
+# Exit signal of a bot that ran past RLIMIT_CPU (a plan with cpu_seconds)
+CPU_LIMIT_SIGNAL = getattr(signal, 'SIGXCPU', None)
+
+
+# Plan limits a bot can be stopped for, as shown to its owner
+LIMIT_DESCRIPTIONS = {'cpu_time': "CPU time", 'memory': "memory"}
+
+
+def limit_kill(returncode):
+    """Name of the resource limit whose signal killed a process, or None for other exits"""
+    if returncode is not None and CPU_LIMIT_SIGNAL and -returncode == CPU_LIMIT_SIGNAL:
+        return 'cpu_time'
+    return None
+
+
+class ManagedBot:
+    """Book-keeping for one supervised bot process"""
+
+    __slots__ = ('bot_id', 'pid', 'popen', 'plan', 'limits', 'script', 'log_path',
+                 'started_at', 'start_ticks', 'cgroup', 'last_ticks', 'last_sample',
+                 'cpu_percent', 'cpu_average', 'rss_mb', 'reniced', 'cgroup_stats', 'limit_reason')
+
+    def __init__(self, bot_id, pid, popen, plan, limits, script, log_path, cgroup=None):
+        self.bot_id = bot_id
+        self.pid = pid
+        self.popen = popen
+        self.plan = plan
+        self.limits = limits
+        self.script = script
+        self.log_path = log_path
+        self.started_at = time.time()
+        stat = procfs.read_stat(pid)
+        self.start_ticks = stat['starttime'] if stat else None
+        self.cgroup = cgroup
+        self.last_ticks = stat['utime'] + stat['stime'] if stat else 0
+        self.last_sample = time.monotonic()
+        self.cpu_percent = 0.0
+        self.cpu_average = 0.0
+        self.rss_mb = 0.0
+        self.reniced = False
+        self.cgroup_stats = {}
+        # Set when the supervisor kills the bot for exceeding a plan limit
+        self.limit_reason = None
+
+
+class BotSupervisor:
+    """Launches hosted bots with per-plan resource limits and polices them.
+
+    ``limits_by_plan`` maps a plan name ('free', 'prime') to a dict with
+    memory_mb, address_space_mb, cpu_seconds, max_files, nice, cpu_quota
+    and max_pids.
+    rlimits are always applied; cgroup quotas only when ``cgroup_root``
+    points at a usable delegated cgroup v2 directory. Without cgroups,
+    cpu_quota is held against CPU use averaged over ``cpu_window``
+    seconds, so short bursts are not punished. With a running
+    ``zygote`` (zygote.ForkServer), bots are forked from the pre-warmed
+    server instead of starting a fresh interpreter.
+    """
+
+    def __init__(self, limits_by_plan, logs_dir, python=None, cgroup_root=None, zygote=None, cpu_window=60):
+        self.limits_by_plan = limits_by_plan
+        self.cpu_window = cpu_window
+        self.logs_dir = Path(logs_dir)
+        self.python = python or sys.executable
+        self.cgroups = CgroupManager(cgroup_root)
+        self.zygote = zygote
+        self.bots = {}
+        self.throttle_log = {}
+        self._lock = threading.RLock()
+
+    def log_path(self, bot_id):
+        return self.logs_dir / f"bot_{bot_id}.log"
+
+    def limits_for(self, plan):
+        return self.limits_by_plan.get(plan) or self.limits_by_plan['free']
+
+    def launch(self, bot_id, script, plan='free', cwd=None, env=None, site_dirs=None):
+        """Start a bot script and return its ManagedBot record.
+
+        ``site_dirs`` are dependency overlays whose .pth files must be
+        processed before the script runs.
+        """
+        with self._lock:
+            existing = self.bots.get(bot_id)
+            if existing and self._alive(existing):
+                return existing
+
+            limits = self.limits_for(plan)
+            script = Path(script).resolve()
+            self.logs_dir.mkdir(parents=True, exist_ok=True)
+            log_path = self.log_path(bot_id)
+            cgroup = self.cgroups.create(bot_id, limits)
+
+            pid, popen = None, None
+            use_zygote = self.zygote is not None and self.zygote.alive()
+            if use_zygote and site_dirs:
+                # A forked child keeps the zygote's copy of anything it preloaded
+                pinned = {}
+                for path in site_dirs:
+                    pinned.update(overlay_packages(path))
+                conflicts = self.zygote.conflicts(pinned)
+                if conflicts:
+                    logger.info(f"Bot {bot_id} pins {', '.join(conflicts)} at versions the zygote "
+                                f"has preloaded differently; starting it cold")
+                    use_zygote = False
+            if use_zygote:
+                try:
+                    pid = self.zygote.spawn(script, log_path, limits, cwd=cwd, env=env, cgroup=cgroup,
+                                            site_dirs=site_dirs)
+                except Exception as e:
+                    logger.warning(f"Zygote spawn failed for bot {bot_id}, falling back: {e}")
+
+            if pid is None:
+                if site_dirs:
+                    # Each overlay carries a sitecustomize that activates its .pth
+                    env = dict(os.environ if env is None else env)
+                    paths = [str(path) for path in site_dirs]
+                    if env.get('PYTHONPATH'):
+                        paths.append(env['PYTHONPATH'])
+                    env['PYTHONPATH'] = os.pathsep.join(paths)
+                with open(log_path, 'ab') as log_file:
+                    popen = subprocess.Popen(
+                        [self.python, '-u', str(script)],
+                        cwd=cwd or str(script.parent),
+                        env=env,
+                        stdin=subprocess.DEVNULL,
+                        stdout=log_file,
+                        stderr=subprocess.STDOUT,
+                        preexec_fn=make_preexec(limits, cgroup),
+                        close_fds=True,
+                        # Own session: survives a control-plane restart and its signals
+                        start_new_session=True,
+                    )
+                pid = popen.pid
+
+            managed = ManagedBot(bot_id, pid, popen, plan, limits, script, log_path, cgroup)
+            self.bots[bot_id] = managed
+            logger.info(f"Launched bot {bot_id} (pid {pid}, plan {plan}{', zygote' if popen is None else ''})")
+            return managed
+
+    def adopt(self, bot_id, pid, start_ticks, script, plan='free'):
+        """Take over a bot started by a previous control-plane process.
+
+        The PID is only trusted if /proc shows the same process start time
+        that was recorded at launch, so a recycled PID is never adopted.
+        Returns the ManagedBot, or None if the process is gone.
+        """
+        if not start_ticks or not procfs.is_alive(pid, start_ticks):
+            return None
+        with self._lock:
+            limits = self.limits_for(plan)
+            cgroup = None
+            if self.cgroups.available and self.cgroups.group_path(bot_id).exists():
+                cgroup = self.cgroups.group_path(bot_id)
+            managed = ManagedBot(bot_id, pid, None, plan, limits, Path(script), self.log_path(bot_id), cgroup)
+            self.bots[bot_id] = managed
+        logger.info(f"Reattached to bot {bot_id} (pid {pid})")
+        return managed
+
+    def _returncode(self, managed):
+        if managed.popen is not None:
+            return managed.popen.returncode
+        if self.zygote is not None and self.zygote.alive():
+            try:
+                return self.zygote.exitcode(managed.pid)[1]
+            except Exception:
+                return None
+        return None
+
+    def _alive(self, managed):
+        if managed.popen is not None:
+            return managed.popen.poll() is None
+        return procfs.is_alive(managed.pid, managed.start_ticks)
+
+    def is_running(self, bot_id):
+        managed = self.bots.get(bot_id)
+        return bool(managed and self._alive(managed))
+
+    def _signal(self, managed, sig):
+        try:
+            os.kill(managed.pid, sig)
+            return True
+        except ProcessLookupError:
+            return False
+        except PermissionError as e:
+            logger.error(f"Cannot signal bot {managed.bot_id}: {e}")
+            return False
+
+    def _wait(self, managed, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self._alive(managed):
+                return True
+            time.sleep(0.05)
+        return not self._alive(managed)
+
+    def _wait_many(self, pending, timeout):
+        """Wait for several bots to exit; returns those still alive"""
+        deadline = time.monotonic() + timeout
+        while pending and time.monotonic() < deadline:
+            time.sleep(0.05)
+            pending = [m for m in pending if self._alive(m)]
+        return pending
+
+    def terminate(self, managed, timeout=10):
+        """SIGTERM, then SIGKILL if the process outlives ``timeout``"""
+        if not self._alive(managed):
+            return True
+        self._signal(managed, signal.SIGTERM)
+        if self._wait(managed, timeout):
+            return True
+        logger.warning(f"Bot {managed.bot_id} ignored SIGTERM, sending SIGKILL")
+        self._signal(managed, signal.SIGKILL)
+        return self._wait(managed, 5)
+
+    def _keep(self, managed):
+        """Supervise a bot again that outlived SIGKILL, so a later poll() reaps it"""
+        with self._lock:
+            self.bots.setdefault(managed.bot_id, managed)
+        logger.error(f"Bot {managed.bot_id} (pid {managed.pid}) survived SIGKILL; still supervised")
+
+    def stop(self, bot_id, timeout=10):
+        """Stop a bot and forget about it once it is gone"""
+        with self._lock:
+            managed = self.bots.pop(bot_id, None)
+        if not managed:
+            return False
+        stopped = self.terminate(managed, timeout)
+        if stopped:
+            self.cgroups.remove(bot_id)
+        else:
+            self._keep(managed)
+        return stopped
+
+    def stop_many(self, bot_ids, timeout=10):
+        """Stop several bots with one shared grace period.
+
+        Every bot gets SIGTERM at once and the stragglers SIGKILL when
+        ``timeout`` runs out, so stopping N bots takes one grace period
+        rather than N. Returns {bot_id: stopped} for the bots it knew;
+        bots still alive afterwards (e.g. stuck in D state) stay supervised.
+        """
+        with self._lock:
+            managed = [self.bots.pop(bot_id) for bot_id in bot_ids if bot_id in self.bots]
+        pending = [m for m in managed if self._alive(m)]
+        for m in pending:
+            self._signal(m, signal.SIGTERM)
+
+        pending = self._wait_many(pending, timeout)
+        if pending:
+            logger.warning(f"{len(pending)} bots ignored SIGTERM, sending SIGKILL")
+            for m in pending:
+                self._signal(m, signal.SIGKILL)
+            pending = self._wait_many(pending, 5)
+
+        for m in managed:
+            if m in pending:
+                self._keep(m)
+            else:
+                self.cgroups.remove(m.bot_id)
+        return {m.bot_id: m not in pending for m in managed}
+
+    def poll(self):
+        """Return [(bot_id, returncode, limit)] for bots that exited since last poll.
+
+        ``limit`` names the plan limit the bot was killed for ('cpu_time',
+        'memory'), or is None for any other exit.
+        """
+        exited = []
+        with self._lock:
+            for bot_id, managed in list(self.bots.items()):
+                if self._alive(managed):
+                    continue
+                returncode = self._returncode(managed)
+                del self.bots[bot_id]
+                limit = managed.limit_reason
+                if managed.cgroup and not limit:
+                    # The OOM killer of the bot's own cgroup
+                    stats = self.cgroups.stats(bot_id)
+                    if stats.get('memory_oom_kill', 0) > managed.cgroup_stats.get('memory_oom_kill', 0):
+                        limit = 'memory'
+                        self.record_throttle(bot_id, 'memory', f"memory_oom_kill={stats['memory_oom_kill']}")
+                self.cgroups.remove(bot_id)
+                if not limit and limit_kill(returncode):
+                    limit = limit_kill(returncode)
+                    self.record_throttle(bot_id, 'cpu_time', 'killed by RLIMIT_CPU')
+                exited.append((bot_id, returncode, limit))
+        return exited
+
+    def sample(self, managed):
+        """Refresh cpu_percent/rss_mb for a bot from /proc"""
+        stat = procfs.read_stat(managed.pid)
+        if not stat:
+            return None
+        now = time.monotonic()
+        ticks = stat['utime'] + stat['stime']
+        elapsed = now - managed.last_sample
+        if elapsed > 0:
+            managed.cpu_percent = (ticks - managed.last_ticks) / procfs.CLOCK_TICKS / elapsed * 100
+            # Time-weighted moving average over cpu_window, whatever the tick length
+            weight = 1 - math.exp(-elapsed / self.cpu_window) if self.cpu_window else 1.0
+            managed.cpu_average += (managed.cpu_percent - managed.cpu_average) * weight
+        managed.last_ticks = ticks
+        managed.last_sample = now
+        managed.rss_mb = stat['rss_bytes'] / 1048576
+        return managed.cpu_percent, managed.rss_mb
+
+    def record_throttle(self, bot_id, reason, detail):
+        events = self.throttle_log.setdefault(bot_id, [])
+        events.append((time.time(), reason, detail))
+        del events[:-20]
+        logger.warning(f"Bot {bot_id} throttled ({reason}): {detail}")
+
+    def enforce(self):
+        """Sample every bot and apply the plan's CPU/memory policy.
+
+        Without cgroups, a bot whose RSS exceeds its memory limit is stopped
+        and one whose average CPU use exceeds its share is reniced to the
+        lowest priority. Returns the (bot_id, reason, detail) events raised.
+        """
+        events = []
+        with self._lock:
+            bots = list(self.bots.values())
+
+        for managed in bots:
+            if not self.sample(managed):
+                continue
+            limits = managed.limits
+
+            if managed.cgroup:
+                stats = self.cgroups.stats(managed.bot_id)
+                previous = managed.cgroup_stats
+                managed.cgroup_stats = stats
+                for key in ('nr_throttled', 'memory_high', 'memory_max', 'memory_oom_kill'):
+                    if stats.get(key, 0) > previous.get(key, 0):
+                        events.append((managed.bot_id, key, f"{key}={stats[key]}"))
+                continue
+
+            memory_mb = limits.get('memory_mb')
+            if memory_mb and managed.rss_mb > memory_mb:
+                events.append((managed.bot_id, 'memory', f"RSS {managed.rss_mb:.0f}MB > {memory_mb}MB"))
+                managed.limit_reason = 'memory'
+                self.terminate(managed, timeout=5)
+                continue
+
+            cpu_quota = limits.get('cpu_quota')
+            if cpu_quota and not managed.reniced and managed.cpu_average > cpu_quota * 100:
+                try:
+                    os.setpriority(os.PRIO_PROCESS, managed.pid, 19)
+                    managed.reniced = True
+                except OSError:
+                    pass
+                events.append((managed.bot_id, 'cpu', f"{managed.cpu_average:.0f}% over {self.cpu_window}s > {cpu_quota * 100:.0f}%"))
+
+        for bot_id, reason, detail in events:
+            self.record_throttle(bot_id, reason, detail)
+        return events
+
+    def throttled(self):
+        """Recent throttle events per bot, newest last"""
+        return {bot_id: list(events) for bot_id, events in self.throttle_log.items() if events}
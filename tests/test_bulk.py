@@ -0,0 +1,30 @@
+import sqlite3
+import threading
+from collections import Counter
+
+from bulk import BulkOperations
+from schema import init_schema
+
+
+def test_bulk_restart_spreads_unplaced_bots_over_nodes(tmp_path):
+    db_name = str(tmp_path / 'bulk.db')
+    conn = sqlite3.connect(db_name)
+    init_schema(conn)
+    conn.executemany("INSERT INTO nodes (id, name, status, capacity, current_load) VALUES (?, ?, 'active', ?, ?)",
+                     [(1, 'Node-1', 10, 0), (2, 'Node-2', 10, 1), (3, 'Node-3', 2, 2)])
+    conn.executemany("INSERT INTO deployments (id, user_id, filename, status, pid) VALUES (?, 1, 'bot.py', 'Stopped', 0)",
+                     [(bot_id,) for bot_id in range(1, 6)])
+    conn.commit()
+
+    def launch(bot_info, node_id):
+        return 1000 + bot_info.id, None, node_id
+
+    ops = BulkOperations(db_name, threading.RLock(), lambda node_id, bot_ids: {}, launch=launch)
+    result = ops.run('restart', {'bot_ids': [1, 2, 3, 4, 5]})
+
+    assert sorted(result.succeeded) == [1, 2, 3, 4, 5]
+    placed = Counter(node_id for (node_id,) in conn.execute("SELECT node_id FROM deployments"))
+    # Node 3 is full; the others end up level once node 2's existing bot counts
+    assert placed == {1: 3, 2: 2}
+    loads = dict(conn.execute("SELECT id, current_load FROM nodes"))
+    assert loads == {1: 3, 2: 3, 3: 2}
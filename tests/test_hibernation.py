@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+import importlib
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def host(tmp_path_factory):
+    """main imported inside a scratch directory, with the database initialised"""
+    workdir = tmp_path_factory.mktemp('host')
+    previous = os.getcwd()
+    os.chdir(workdir)
+    os.environ.setdefault('BOT_TOKEN', '123456:test')
+    os.environ['ZENX_ZYGOTE'] = '0'
+    sys.modules.pop('main', None)
+    main = importlib.import_module('main')
+    main.init_db()
+    main.bot.send_message = lambda *args, **kwargs: None
+    yield main
+    for managed in list(main.supervisor.bots.values()):
+        main.supervisor.terminate(managed, 1)
+    os.chdir(previous)
+
+
+def test_idle_bot_is_hibernated(host):
+    main = host
+    main.project_path.mkdir(exist_ok=True)
+    (main.project_path / 'idle_bot.py').write_text("import time\nwhile True:\n    time.sleep(60)\n")
+    long_ago = (datetime.now() - timedelta(seconds=main.Config.HIBERNATE_IDLE_SECONDS + 3600)).strftime('%Y-%m-%d %H:%M:%S')
+    main.execute_db(
+        "INSERT INTO deployments (user_id, bot_name, filename, status, auto_restart, created_at, updated_at) "
+        "VALUES (?, 'Idle Bot', 'idle_bot.py', 'Stopped', 1, ?, ?)",
+        (42, long_ago, long_ago), commit=True)
+    bot_id = main.execute_db("SELECT id FROM deployments WHERE filename='idle_bot.py'", fetchone=True)['id']
+
+    managed = main.start_bot_process(bot_id)
+    assert managed is not None
+    main.execute_db("UPDATE deployments SET last_active=? WHERE id=?", (long_ago, bot_id), commit=True)
+
+    # What supervise_bots does each pass, with the first idle sample taken long ago
+    main.idle_tracker.record(bot_id, managed.pid, 0.0, 20.0, now=time.time() - main.Config.HIBERNATE_IDLE_SECONDS - 60)
+    main.update_bot_stats(bot_id, 0.0, 20.0)
+    main.idle_tracker.observe(managed)
+    main.write_buffer.flush()
+
+    assert main.hibernate_idle_bots() == 1
+    row = main.execute_db("SELECT status FROM deployments WHERE id=?", (bot_id,), fetchone=True)
+    assert row['status'] == 'Hibernated'
+    assert main.execute_db("SELECT deployment_id FROM hibernation WHERE deployment_id=?", (bot_id,), fetchone=True)
+    assert bot_id not in main.supervisor.bots
@@ -0,0 +1,178 @@
+import os
+import sys
+import time
+import signal
+import socket
+import threading
+import subprocess
+
+import pytest
+
+from node_agent import (AgentError, NodeAgentClient, HEADER, MAX_MESSAGE, confined, is_loopback,
+                        recv_message, send_message)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SLEEPER = "import time\nwhile True:\n    time.sleep(60)\n"
+# Ignores SIGTERM, so a stop waits out its whole grace period
+STUBBORN = "import signal, time\nsignal.signal(signal.SIGTERM, signal.SIG_IGN)\nwhile True:\n    time.sleep(60)\n"
+
+
+@pytest.fixture
+def cluster(tmp_path):
+    """Starts node agents on Unix sockets under tmp_path; kills them and their bots afterwards"""
+    projects = tmp_path / 'projects'
+    projects.mkdir()
+    (projects / 'sleeper.py').write_text(SLEEPER)
+    (projects / 'stubborn.py').write_text(STUBBORN)
+    processes, clients, pids = [], [], set()
+
+    def start(node_id, token=None, hang_timeout=None):
+        address = f"unix:{tmp_path / f'node{node_id}.sock'}"
+        command = [sys.executable, os.path.join(ROOT, 'node_agent.py'), '--node-id', str(node_id),
+                   '--listen', address, '--logs-dir', str(tmp_path / f'logs{node_id}'), '--poll-interval', '0.2']
+        env = dict(os.environ)
+        env.pop('ZENX_AGENT_TOKEN', None)
+        if token:
+            command += ['--token', token]
+        if hang_timeout is not None:
+            command += ['--hang-timeout', str(hang_timeout), '--hang-grace', '0.5']
+        process = subprocess.Popen(command, cwd=str(tmp_path), env=env,
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        assert b'ready' in process.stdout.readline()
+        processes.append(process)
+        return process, address
+
+    def client(address, **kwargs):
+        c = NodeAgentClient(address, timeout=5, **kwargs)
+        clients.append(c)
+        return c
+
+    def launch(c, bot_id, script='sleeper.py'):
+        result = c.start([{'bot_id': bot_id, 'script': str(projects / script)}])[0]
+        if 'pid' in result:
+            pids.add(result['pid'])
+        return result
+
+    yield start, client, launch
+    for c in clients:
+        c.close()
+    for process in processes:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+    for pid in pids:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+def test_framing_round_trip():
+    a, b = socket.socketpair()
+    with a, b:
+        send_message(a, {'id': 1, 'method': 'ping', 'params': {'text': 'é' * 1000}})
+        assert recv_message(b) == {'id': 1, 'method': 'ping', 'params': {'text': 'é' * 1000}}
+
+        a.sendall(HEADER.pack(MAX_MESSAGE + 1))
+        with pytest.raises(AgentError):
+            recv_message(b)
+
+        # A peer that dies halfway through a message reads as a closed connection
+        a.sendall(HEADER.pack(10) + b'{"id"')
+        a.shutdown(socket.SHUT_WR)
+        assert recv_message(b) is None
+
+
+def test_two_agents_survive_one_dying_mid_call(cluster):
+    start, client, launch = cluster
+    _, address1 = start(1)
+    process2, address2 = start(2)
+    node1, node2 = client(address1), client(address2)
+
+    assert 'pid' in launch(node1, 1)
+    assert 'pid' in launch(node2, 2, 'stubborn.py')
+    time.sleep(0.5)  # let it install its SIGTERM handler
+
+    outcome = {}
+
+    def slow_stop():
+        started = time.monotonic()
+        try:
+            node2.stop([2], timeout=30)
+            outcome['error'] = None
+        except AgentError as e:
+            outcome['error'] = e
+        outcome['seconds'] = time.monotonic() - started
+
+    caller = threading.Thread(target=slow_stop)
+    caller.start()
+    time.sleep(0.5)
+    process2.kill()
+    caller.join(10)
+
+    assert not caller.is_alive()
+    assert isinstance(outcome['error'], AgentError)
+    assert outcome['seconds'] < 10
+    # The surviving agent is unaffected
+    assert node1.status([1])[0]['running']
+
+    # Calls to the dead agent fail cleanly until it comes back, then reconnect
+    with pytest.raises(AgentError):
+        node2.ping()
+    start(2)
+    assert node2.ping()['node_id'] == 2
+
+
+def test_agent_kills_hung_bots_and_reports_usage(cluster):
+    start, client, launch = cluster
+    _, address = start(1, hang_timeout=1)
+    events = []
+    node = client(address, on_event=events.append)
+
+    assert 'pid' in launch(node, 1)
+    sample = node.metrics()['bots'][0]
+    assert sample['bot_id'] == 1 and sample['plan'] == 'free' and sample['log_size'] == 0
+
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline and not any(e['event'] == 'exited' for e in events):
+        time.sleep(0.1)
+    exited = [e for e in events if e['event'] == 'exited']
+    assert exited and exited[0]['bot_id'] == 1 and exited[0]['hung'] is True
+    assert node.metrics()['bots'] == []
+
+
+def test_unreachable_agent_raises_agent_error(tmp_path):
+    c = NodeAgentClient(f"unix:{tmp_path / 'missing.sock'}", timeout=1)
+    with pytest.raises(AgentError):
+        c.ping()
+
+
+def test_token_is_required(cluster):
+    start, client, _ = cluster
+    _, address = start(1, token='secret')
+    with pytest.raises(AgentError, match='not authenticated'):
+        client(address).ping()
+    with pytest.raises(AgentError, match='bad token'):
+        client(address, token='wrong').ping()
+    assert client(address, token='secret').ping()['node_id'] == 1
+
+
+def test_scripts_outside_bots_dir_are_refused(cluster, tmp_path):
+    start, client, launch = cluster
+    _, address = start(1)
+    outside = tmp_path / 'outside.py'
+    outside.write_text(SLEEPER)
+    c = client(address)
+    result = c.start([{'bot_id': 1, 'script': str(outside)}])[0]
+    assert 'error' in result
+    result = c.start([{'bot_id': 2, 'script': str(tmp_path / 'projects' / '..' / 'outside.py')}])[0]
+    assert 'error' in result
+    assert c.status() == []
+
+
+def test_path_helpers(tmp_path):
+    root = os.path.realpath(tmp_path)
+    assert confined(os.path.join(root, 'a', 'b.py'), root) == os.path.join(root, 'a', 'b.py')
+    assert confined(os.path.join(root, '..', 'b.py'), root) is None
+    assert is_loopback('127.0.0.1') and is_loopback('::1') and is_loopback('localhost')
+    assert not is_loopback('0.0.0.0') and not is_loopback('10.0.0.3')
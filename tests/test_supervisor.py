@@ -0,0 +1,55 @@
+import time
+
+from supervisor import BotSupervisor
+
+SLEEPER = "import time\nwhile True:\n    time.sleep(60)\n"
+
+
+def wait_for_exits(supervisor, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        exited = supervisor.poll()
+        if exited:
+            return exited
+        time.sleep(0.05)
+    raise AssertionError("no bot exited")
+
+
+def test_memory_kill_is_reported_as_a_limit(tmp_path):
+    script = tmp_path / 'bot.py'
+    script.write_text(SLEEPER)
+    supervisor = BotSupervisor({'free': {'memory_mb': 1}}, tmp_path / 'logs')
+    supervisor.launch(1, script)
+    time.sleep(0.3)
+
+    events = supervisor.enforce()
+
+    assert [(bot_id, reason) for bot_id, reason, _ in events] == [(1, 'memory')]
+    [(bot_id, returncode, limit)] = wait_for_exits(supervisor)
+    assert (bot_id, limit) == (1, 'memory')
+    assert returncode != 0
+
+
+def test_ordinary_exit_has_no_limit(tmp_path):
+    script = tmp_path / 'bot.py'
+    script.write_text("raise SystemExit(3)\n")
+    supervisor = BotSupervisor({'free': {}}, tmp_path / 'logs')
+    supervisor.launch(1, script)
+
+    assert wait_for_exits(supervisor) == [(1, 3, None)]
+
+
+def test_bot_that_survives_sigkill_stays_supervised(tmp_path, monkeypatch):
+    script = tmp_path / 'bot.py'
+    script.write_text(SLEEPER)
+    supervisor = BotSupervisor({'free': {}}, tmp_path / 'logs')
+    managed = supervisor.launch(1, script)
+    # Signals that never land look like a process stuck in D state
+    monkeypatch.setattr(supervisor, '_signal', lambda managed, sig: True)
+
+    assert supervisor.stop_many([1], timeout=0.1) == {1: False}
+    assert supervisor.bots[1] is managed
+
+    monkeypatch.undo()
+    managed.popen.kill()
+    assert [bot_id for bot_id, _, _ in wait_for_exits(supervisor)] == [1]
@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+from zygote import ForkServer
+
+SCRIPT = """import atexit, threading, time
+
+def work():
+    time.sleep(0.5)
+    print("thread finished", flush=True)
+
+atexit.register(lambda: print("atexit ran", flush=True))
+threading.Thread(target=work).start()
+print("main done", flush=True)
+"""
+
+
+@pytest.fixture
+def zygote(tmp_path):
+    server = ForkServer(str(tmp_path / 'zygote.sock'), preload=('json',))
+    assert server.start()
+    yield server
+    server.stop()
+
+
+def wait_for_exit(server, pid, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        running, returncode = server.exitcode(pid)
+        if not running:
+            return returncode
+        time.sleep(0.05)
+    raise AssertionError(f"child {pid} still running")
+
+
+def test_forked_bot_keeps_threads_and_atexit_hooks(zygote, tmp_path):
+    script = tmp_path / 'bot.py'
+    script.write_text(SCRIPT)
+    log = tmp_path / 'bot.log'
+
+    pid = zygote.spawn(script, log)
+
+    assert wait_for_exit(zygote, pid) == 0
+    assert log.read_text().splitlines() == ["main done", "thread finished", "atexit ran"]
@@ -0,0 +1,240 @@
+"""Lightweight per-update tracing.
+
+A trace covers one incoming Telegram update from the moment it is
+dispatched until its handler returns. Code on that path opens spans
+(``with span('db', 'SELECT')``) around database calls, file I/O and
+outbound API calls; outside a trace, ``span`` returns a shared no-op, so
+instrumented helpers cost almost nothing when called from background
+threads.
+
+Finished traces go to a bounded in-memory ring buffer. Traces slower
+than a threshold are also appended to a JSON-lines file, which is
+rotated once it grows past a size limit.
+"""
+import os
+import json
+import time
+import uuid
+import threading
+from collections import deque
+from functools import wraps
+
+_local = threading.local()
+
+
+class Span:
+    __slots__ = ('category', 'name', 'start', 'duration', 'own', 'depth', 'child_time')
+
+    def __init__(self, category, name, start, depth):
+        self.category = category
+        self.name = name
+        self.start = start
+        self.depth = depth
+        self.duration = 0.0
+        self.own = 0.0
+        self.child_time = 0.0
+
+    def to_dict(self, origin):
+        return {'category': self.category, 'name': self.name, 'depth': self.depth,
+                'offset_ms': round((self.start - origin) * 1000, 2),
+                'duration_ms': round(self.duration * 1000, 2)}
+
+
+class Trace:
+    """One update: its spans plus exact per-category totals"""
+
+    __slots__ = ('trace_id', 'kind', 'user_id', 'started_at', 'start', 'duration', 'spans',
+                 'totals', 'dropped', 'error', 'stack', 'max_spans')
+
+    def __init__(self, kind, user_id=None, max_spans=200):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.kind = kind
+        self.user_id = user_id
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.spans = []
+        # category -> [exclusive seconds, span count]; kept even when spans are dropped
+        self.totals = {}
+        self.dropped = 0
+        self.error = None
+        self.stack = []
+        self.max_spans = max_spans
+
+    def breakdown(self):
+        """[(category, seconds, count)] by exclusive time, slowest first.
+
+        Time not covered by any span is reported as 'handler'.
+        """
+        rows = [(category, seconds, count) for category, (seconds, count) in self.totals.items()]
+        covered = sum(seconds for _, seconds, _ in rows)
+        if self.duration is not None:
+            rows.append(('handler', max(self.duration - covered, 0.0), 1))
+        rows.sort(key=lambda row: row[1], reverse=True)
+        return rows
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'kind': self.kind,
+            'user_id': self.user_id,
+            'started_at': self.started_at,
+            'duration_ms': round((self.duration or 0.0) * 1000, 2),
+            'error': self.error,
+            'breakdown': [{'category': category, 'ms': round(seconds * 1000, 2), 'count': count}
+                          for category, seconds, count in self.breakdown()],
+            'spans': [s.to_dict(self.start) for s in self.spans],
+            'dropped_spans': self.dropped,
+        }
+
+
+class _SpanContext:
+    __slots__ = ('trace', 'category', 'name', 'span')
+
+    def __init__(self, trace, category, name):
+        self.trace = trace
+        self.category = category
+        self.name = name
+
+    def __enter__(self):
+        trace = self.trace
+        self.span = Span(self.category, self.name, time.perf_counter(), len(trace.stack))
+        trace.stack.append(self.span)
+        return self.span
+
+    def __exit__(self, *exc):
+        span = self.span
+        trace = self.trace
+        span.duration = time.perf_counter() - span.start
+        span.own = span.duration - span.child_time
+        trace.stack.pop()
+        if trace.stack:
+            trace.stack[-1].child_time += span.duration
+        totals = trace.totals.get(span.category)
+        if totals is None:
+            trace.totals[span.category] = [span.own, 1]
+        else:
+            totals[0] += span.own
+            totals[1] += 1
+        if len(trace.spans) < trace.max_spans:
+            trace.spans.append(span)
+        else:
+            trace.dropped += 1
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+def span(category, name):
+    """Time a block as part of the current trace, if there is one"""
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        return NO_SPAN
+    return _SpanContext(trace, category, name)
+
+
+def traced(category, name=None):
+    """Decorator form of ``span``"""
+    def decorate(func):
+        label = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(category, label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class Tracer:
+    """Starts and finishes traces on the current thread and keeps the recent ones"""
+
+    def __init__(self, capacity=500, slow_ms=1000, slow_path=None, max_file_bytes=5 * 1024 * 1024,
+                 max_spans=200):
+        self.buffer = deque(maxlen=capacity)
+        self.slow_seconds = slow_ms / 1000
+        self.slow_path = slow_path
+        self.max_file_bytes = max_file_bytes
+        self.max_spans = max_spans
+        self._file_lock = threading.Lock()
+
+    def start(self, kind, user_id=None):
+        trace = Trace(kind, user_id, self.max_spans)
+        _local.trace = trace
+        return trace
+
+    def finish(self, error=None):
+        trace = getattr(_local, 'trace', None)
+        if trace is None:
+            return None
+        _local.trace = None
+        trace.duration = time.perf_counter() - trace.start
+        trace.stack = []
+        if error is not None:
+            trace.error = f"{type(error).__name__}: {error}"
+        self.buffer.append(trace)
+        if self.slow_path and trace.duration >= self.slow_seconds:
+            self._write_slow(trace)
+        return trace
+
+    def _write_slow(self, trace):
+        line = json.dumps(trace.to_dict()) + '\n'
+        with self._file_lock:
+            try:
+                os.makedirs(os.path.dirname(self.slow_path) or '.', exist_ok=True)
+                if os.path.exists(self.slow_path) and os.path.getsize(self.slow_path) > self.max_file_bytes:
+                    os.replace(self.slow_path, self.slow_path + '.1')
+                with open(self.slow_path, 'a') as f:
+                    f.write(line)
+            except OSError:
+                pass
+
+    def recent(self):
+        return list(self.buffer)
+
+    def slowest(self, limit=5, kind=None):
+        traces = [t for t in list(self.buffer) if kind is None or t.kind.startswith(kind)]
+        traces.sort(key=lambda t: t.duration, reverse=True)
+        return traces[:limit]
+
+    def find(self, trace_id):
+        for trace in reversed(list(self.buffer)):
+            if trace.trace_id.startswith(trace_id):
+                return trace
+        return None
+
+
+def read_slow_traces(path, limit=20):
+    """The last ``limit`` traces from a slow-trace file, newest first"""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            # Traces are at most a few KB each; read only the tail
+            f.seek(max(size - limit * 16384, 0))
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    traces = []
+    for line in reversed(lines):
+        try:
+            traces.append(json.loads(line))
+        except ValueError:
+            continue
+        if len(traces) >= limit:
+            break
+    return traces
@@ -0,0 +1,148 @@
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBuffer:
+    """Write-behind buffer for high-frequency row updates.
+
+    Updates are merged per (table, row id): ``set`` values are
+    last-write-wins, ``add`` values are summed. Everything pending is written
+    in one transaction per flush, so a buffered write reaches the database
+    within ``flush_interval`` seconds (sooner once ``max_pending`` rows are
+    queued) unless the database itself is failing.
+    """
+
+    def __init__(self, db_name, lock, flush_interval=5.0, max_pending=500):
+        self.db_name = db_name
+        self.lock = lock
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._pending = {}
+        self._oldest = None
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _check_names(table, columns):
+        for name in (table, *columns):
+            if not name.isidentifier():
+                raise ValueError(f"Invalid identifier: {name!r}")
+
+    def _entry(self, table, row_id):
+        key = (table, row_id)
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = self._pending[key] = ({}, {})
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+        return entry
+
+    def _queued(self):
+        if len(self._pending) >= self.max_pending:
+            self._wakeup.set()
+
+    def set(self, table, row_id, **values):
+        """Queue column assignments; later values replace earlier ones"""
+        self._check_names(table, values)
+        with self._buffer_lock:
+            self._entry(table, row_id)[0].update(values)
+            self._queued()
+
+    def add(self, table, row_id, **deltas):
+        """Queue additive column updates; deltas are summed until flushed"""
+        self._check_names(table, deltas)
+        with self._buffer_lock:
+            adds = self._entry(table, row_id)[1]
+            for column, delta in deltas.items():
+                adds[column] = adds.get(column, 0) + delta
+            self._queued()
+
+    def staleness(self):
+        """Age in seconds of the oldest unflushed update"""
+        with self._buffer_lock:
+            return time.monotonic() - self._oldest if self._oldest is not None else 0.0
+
+    def pending_count(self):
+        with self._buffer_lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Write all pending updates in a single transaction"""
+        with self._flush_lock:
+            with self._buffer_lock:
+                pending, self._pending = self._pending, {}
+                oldest, self._oldest = self._oldest, None
+
+            if not pending:
+                return 0
+
+            # Group rows sharing the same column shape into one executemany
+            batches = {}
+            for (table, row_id), (sets, adds) in pending.items():
+                shape = (table, tuple(sets), tuple(adds))
+                params = [*sets.values(), *adds.values(), row_id]
+                batches.setdefault(shape, []).append(params)
+
+            try:
+                with self.lock:
+                    conn = sqlite3.connect(self.db_name, check_same_thread=False)
+                    try:
+                        with conn:
+                            for (table, set_cols, add_cols), rows in batches.items():
+                                assignments = [f"{col}=?" for col in set_cols]
+                                assignments += [f"{col}=COALESCE({col}, 0)+?" for col in add_cols]
+                                conn.executemany(f"UPDATE {table} SET {', '.join(assignments)} WHERE id=?", rows)
+                    finally:
+                        conn.close()
+            except Exception as e:
+                logger.error(f"Error flushing write buffer: {e}")
+                self._requeue(pending, oldest)
+                return 0
+
+            return len(pending)
+
+    def _requeue(self, pending, oldest):
+        # Merge the failed batch under anything queued meanwhile
+        with self._buffer_lock:
+            for key, (sets, adds) in pending.items():
+                newer = self._pending.get(key)
+                if newer is None:
+                    self._pending[key] = (sets, adds)
+                    continue
+                merged_sets = dict(sets)
+                merged_sets.update(newer[0])
+                for column, delta in adds.items():
+                    newer[1][column] = newer[1].get(column, 0) + delta
+                self._pending[key] = (merged_sets, newer[1])
+            if oldest is not None and (self._oldest is None or oldest < self._oldest):
+                self._oldest = oldest
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self):
+        """Start the background flusher thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="write-buffer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher thread and write out anything still pending"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.flush()
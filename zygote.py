@@ -0,0 +1,328 @@
+"""Pre-warmed fork server for hosted bots.
+
+The server process imports the common hosting dependencies once and then
+forks one child per bot, so children share those pages copy-on-write and
+skip the import cost. Each child runs the user script with a fresh
+``__main__`` via runpy. The control plane talks to it over a Unix socket,
+one JSON request/response line per connection.
+
+    python zygote.py --socket zygote.sock [--preload telebot,requests]
+"""
+import os
+import sys
+import json
+import select
+import signal
+import socket
+import argparse
+import importlib
+import subprocess
+import logging
+from pathlib import Path
+
+from isolation import make_preexec
+from deps import activate, normalize_name
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRELOAD = ('telebot', 'requests', 'aiogram', 'aiohttp', 'json', 'sqlite3',
+                   'asyncio', 'logging', 'threading', 'urllib.request', 'ssl')
+
+
+def loaded_distributions():
+    """{normalized distribution name: version} behind every top-level module imported so far"""
+    try:
+        from importlib import metadata
+        providers = metadata.packages_distributions()
+    except Exception:
+        return {}
+    versions = {}
+    for module in {name.partition('.')[0] for name in list(sys.modules)}:
+        for dist in providers.get(module, ()):
+            try:
+                versions[normalize_name(dist)] = metadata.version(dist)
+            except Exception:
+                pass
+    return versions
+
+
+def _run_child(request):
+    """Runs in the forked child; never returns"""
+    code = 1
+    try:
+        os.setsid()
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD, signal.SIGHUP):
+            signal.signal(sig, signal.SIG_DFL)
+
+        cgroup = request.get('cgroup')
+        make_preexec(request.get('limits') or {}, Path(cgroup) if cgroup else None)()
+
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        log_fd = os.open(request['log_path'], os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        os.dup2(log_fd, 1)
+        os.dup2(log_fd, 2)
+        sys.stdout = open(1, 'w', buffering=1, closefd=False)
+        sys.stderr = open(2, 'w', buffering=1, closefd=False)
+
+        script = request['script']
+        cwd = request.get('cwd') or os.path.dirname(script)
+        os.chdir(cwd)
+        if request.get('env') is not None:
+            os.environ.clear()
+            os.environ.update(request['env'])
+        sys.argv = [script]
+        sys.path[0] = os.path.dirname(script)
+
+        # The control plane only sends overlays that pin nothing preloaded here
+        if request.get('site_dirs'):
+            activate(request['site_dirs'])
+
+        import runpy
+        runpy.run_path(script, run_name='__main__')
+        code = 0
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        code = 1
+    finally:
+        # What interpreter shutdown would do: wait for non-daemon threads
+        # (e.g. a polling thread started by the script), then run atexit hooks
+        try:
+            import threading
+            threading._shutdown()
+        except BaseException:
+            pass
+        try:
+            import atexit
+            atexit._run_exitfuncs()
+        except BaseException:
+            pass
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except Exception:
+            pass
+        os._exit(code)
+
+
+class ZygoteServer:
+    """The fork server loop (runs in its own process)"""
+
+    def __init__(self, socket_path, preload=DEFAULT_PRELOAD):
+        self.socket_path = socket_path
+        self.preload = preload
+        self.exit_codes = {}
+        self.children = set()
+
+    def preload_modules(self):
+        loaded = []
+        for name in self.preload:
+            try:
+                importlib.import_module(name)
+                loaded.append(name)
+            except Exception:
+                pass
+        return loaded
+
+    def reap(self):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if pid == 0:
+                return
+            self.children.discard(pid)
+            self.exit_codes[pid] = os.waitstatus_to_exitcode(status)
+            if len(self.exit_codes) > 10000:
+                self.exit_codes.pop(next(iter(self.exit_codes)))
+
+    def handle(self, request):
+        op = request.get('op')
+        if op == 'ping':
+            return {'ok': True, 'pid': os.getpid(), 'children': len(self.children)}
+        if op == 'spawn':
+            pid = os.fork()
+            if pid == 0:
+                self.listener.close()
+                self.conn.close()
+                _run_child(request)
+            self.children.add(pid)
+            return {'ok': True, 'pid': pid}
+        if op == 'exitcode':
+            pid = request['pid']
+            if pid in self.children:
+                return {'ok': True, 'running': True, 'returncode': None}
+            return {'ok': True, 'running': False, 'returncode': self.exit_codes.pop(pid, None)}
+        if op == 'shutdown':
+            self.running = False
+            return {'ok': True}
+        return {'ok': False, 'error': f"unknown op {op!r}"}
+
+    def serve(self):
+        loaded = self.preload_modules()
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        self.listener.listen(64)
+        self.running = True
+        print(json.dumps({'ready': True, 'preloaded': loaded, 'distributions': loaded_distributions()}),
+              flush=True)
+
+        while self.running:
+            self.reap()
+            try:
+                readable, _, _ = select.select([self.listener], [], [], 0.5)
+            except InterruptedError:
+                continue
+            if not readable:
+                continue
+
+            conn, _ = self.listener.accept()
+            self.conn = conn
+            with conn:
+                conn.settimeout(5)
+                try:
+                    data = b''
+                    while not data.endswith(b'\n'):
+                        chunk = conn.recv(65536)
+                        if not chunk:
+                            break
+                        data += chunk
+                    response = self.handle(json.loads(data))
+                except Exception as e:
+                    response = {'ok': False, 'error': str(e)}
+                try:
+                    conn.sendall(json.dumps(response).encode() + b'\n')
+                except OSError:
+                    pass
+
+        self.listener.close()
+        os.unlink(self.socket_path)
+
+
+class ForkServer:
+    """Control-plane handle for a zygote process"""
+
+    def __init__(self, socket_path, preload=DEFAULT_PRELOAD, python=None):
+        self.socket_path = os.path.abspath(socket_path)
+        self.preload = preload
+        self.python = python or sys.executable
+        self.process = None
+        # Distributions already imported in the zygote, which forked children cannot replace
+        self.distributions = {}
+
+    def start(self, timeout=30):
+        """Start the zygote and wait until it has finished preloading"""
+        if self.alive():
+            return True
+        if os.path.exists(self.socket_path):
+            # A zygote left behind by a control plane that died without
+            # cleaning up; its children are unaffected by the shutdown
+            try:
+                self._request({'op': 'shutdown'}, timeout=2)
+            except (OSError, ValueError, RuntimeError):
+                pass
+        self.process = subprocess.Popen(
+            [self.python, os.path.abspath(__file__), '--socket', self.socket_path,
+             '--preload', ','.join(self.preload)],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, start_new_session=True,
+        )
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not ready:
+            logger.error("Zygote did not become ready in time")
+            self.stop()
+            return False
+        line = self.process.stdout.readline()
+        try:
+            info = json.loads(line)
+        except ValueError:
+            info = {}
+        if not info.get('ready'):
+            logger.error("Zygote failed to start")
+            self.stop()
+            return False
+        self.distributions = info.get('distributions') or {}
+        logger.info(f"Zygote ready (pid {self.process.pid}), preloaded: {', '.join(info.get('preloaded', []))}")
+        return True
+
+    def conflicts(self, packages):
+        """Names in ``packages`` ({name: version}) that the zygote has loaded at another version"""
+        return sorted(name for name, version in packages.items()
+                      if name in self.distributions and self.distributions[name] != version)
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def _request(self, payload, timeout=10):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(self.socket_path)
+            sock.sendall(json.dumps(payload).encode() + b'\n')
+            data = b''
+            while not data.endswith(b'\n'):
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+        response = json.loads(data)
+        if not response.get('ok'):
+            raise RuntimeError(response.get('error', 'zygote request failed'))
+        return response
+
+    def spawn(self, script, log_path, limits=None, cwd=None, env=None, cgroup=None, site_dirs=None):
+        """Fork a child running ``script`` and return its PID"""
+        return self._request({
+            'op': 'spawn',
+            'script': os.path.abspath(str(script)),
+            'log_path': os.path.abspath(str(log_path)),
+            'limits': limits or {},
+            'cwd': str(cwd) if cwd else None,
+            'env': env,
+            'cgroup': str(cgroup) if cgroup else None,
+            'site_dirs': [str(path) for path in site_dirs] if site_dirs else None,
+        })['pid']
+
+    def exitcode(self, pid):
+        """Return (running, returncode) for a child of the zygote"""
+        response = self._request({'op': 'exitcode', 'pid': pid})
+        return response['running'], response['returncode']
+
+    def stop(self):
+        if not self.alive():
+            return
+        try:
+            self._request({'op': 'shutdown'}, timeout=2)
+            self.process.wait(timeout=5)
+        except Exception:
+            self.process.kill()
+            self.process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ZEN X bot fork server")
+    parser.add_argument('--socket', required=True)
+    parser.add_argument('--preload', default=','.join(DEFAULT_PRELOAD))
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    preload = tuple(name for name in args.preload.split(',') if name)
+    ZygoteServer(args.socket, preload).serve()
+
+
+if __name__ == '__main__':
+    main()